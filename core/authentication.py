@@ -0,0 +1,168 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import Token
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+# Claims added to the tokens by core.serializers.TokenObtainPairSerializer
+CUSTOMER_ID_CLAIM = 'customer_id'
+MEMBERSHIP_CLAIM = 'membership'
+
+
+def get_token_claim(request, claim):
+    # None when the request isn't authenticated with a token, or with one issued before the claim was added
+    return request.auth.get(claim) if isinstance(request.auth, Token) else None
+
+
+def user_version_key(user_id):
+    return f'user_version:{user_id}'
+
+
+def _initial_version():
+    # Seeded with a timestamp, so that a version evicted from the cache never comes back with an old value
+    return int(time.time() * 1000)
+
+
+def get_user_version(user_id):
+    cache = caches[settings.USER_CACHE_VERSION_ALIAS]
+    key = user_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_user_version(user_id):
+    cache = caches[settings.USER_CACHE_VERSION_ALIAS]
+    key = user_version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_version(), timeout=None)
+
+
+class UserCache:
+    """
+    Bounded in-process LRU cache of users by id, whose entries expire after `timeout` seconds.
+
+    Every entry is stored along with the version of the user it was loaded at, which is bumped in the shared
+    USER_CACHE_VERSION_ALIAS cache when the user is saved or deleted (see core.signals.handlers): an entry
+    read with a newer version is stale, so every process sees a deactivation or a password change on its
+    next request. The writing process also drops its own entry right away.
+    Keyed by the id as a string, the way tokens carry it.
+    """
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def get(self, user_id, version=None):
+        user_id = str(user_id)
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            user, entry_version, expires_at = entry
+            if entry_version != version:
+                # Changed since it was cached, possibly by another process
+                del self.entries[user_id]
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            if expires_at <= time.monotonic():
+                del self.entries[user_id]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(user_id)
+            self.hits += 1
+        # Every request gets its own instance, changes made while handling one must not leak into the others
+        return copy.copy(user)
+
+    def set(self, user_id, user, version=None):
+        if self.max_entries <= 0:
+            return
+        user_id = str(user_id)
+        with self.lock:
+            self.entries[user_id] = (copy.copy(user), version, time.monotonic() + self.timeout)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id):
+        user_id = str(user_id)
+        with self.lock:
+            if self.entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_entries': self.max_entries,
+                'timeout': self.timeout,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+
+user_cache = UserCache(settings.USER_CACHE_MAX_ENTRIES, settings.USER_CACHE_TIMEOUT)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication resolving the user from user_cache, so that requests by the same user within
+    USER_CACHE_TIMEOUT seconds don't each look the user up again, only its version in the shared cache.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(
+                _('Token contained no recognizable user identification')) from e
+
+        # Read before loading the user, so that a change made in between leaves a stale entry behind
+        version = get_user_version(user_id)
+        user = user_cache.get(user_id, version)
+        if user is None:
+            # Loads the user and runs every check on it
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user, version)
+            return user
+
+        # Same checks as JWTAuthentication, on the cached row
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN and \
+                validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(
+                _("The user's password has been changed."), code='password_changed')
+        return user
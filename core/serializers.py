@@ -1,4 +1,8 @@
 from djoser.serializers import UserCreateSerializer as BaseUserCreateSerializer, UserSerializer as BaseUserSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer as BaseTokenObtainPairSerializer
+
+from store.models import Customer
+from .authentication import CUSTOMER_ID_CLAIM, MEMBERSHIP_CLAIM
 
 
 class UserCreateSerializer(BaseUserCreateSerializer):
@@ -10,3 +14,20 @@ class UserCreateSerializer(BaseUserCreateSerializer):
 class UserSerializer(BaseUserSerializer):
     class Meta(BaseUserSerializer.Meta):
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
+
+
+class TokenObtainPairSerializer(BaseTokenObtainPairSerializer):
+    """
+    Adds the customer of the user to the tokens, so that views can filter by it without looking it up.
+    Access tokens obtained from the refresh token copy the claims, so the membership in them is the one
+    the user had when logging in, and must not be relied on for anything a change of tier should affect.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        customer = Customer.objects.filter(user_id=user.id).values('id', 'membership').first()
+        if customer is not None:
+            token[CUSTOMER_ID_CLAIM] = customer['id']
+            token[MEMBERSHIP_CLAIM] = customer['membership']
+        return token
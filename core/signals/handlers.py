@@ -1,8 +1,24 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from rest_framework_simplejwt.settings import api_settings
 
+from core.authentication import bump_user_version, user_cache
 from store.signals import order_created
 
 
 @receiver(order_created)
 def on_order_created(sender, **kwargs):
     print(kwargs['order'])
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Covers password changes too, set_password() is always followed by a save().
+    # The version is bumped once the change is visible to the other processes, or they could cache
+    # the old row again under the new version
+    user_id = getattr(instance, api_settings.USER_ID_FIELD)
+    user_cache.invalidate(user_id)
+    transaction.on_commit(lambda: bump_user_version(user_id))
@@ -1,3 +1,49 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from rest_framework.test import APITestCase
+
+from .authentication import user_cache
+from .models import User
+from .serializers import TokenObtainPairSerializer
+
+
+class CachedJWTAuthenticationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        user_cache.reset_stats()
+        self.user = User.objects.create(username='customer', email='customer@domain.com')
+        token = TokenObtainPairSerializer.get_token(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {token}')
+
+    def get(self):
+        return self.client.get('/auth/users/me/')
+
+    def test_cached_between_requests(self):
+        self.assertEqual(self.get().status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get().status_code, 200)
+        self.assertEqual(user_cache.get_stats()['hits'], 1)
+
+    def test_changes_made_by_other_processes(self):
+        self.assertEqual(self.get().status_code, 200)
+
+        # Another process deactivates the user: only the shared version tells this one about it
+        self.user.is_active = False
+        with mock.patch.object(user_cache, 'invalidate'), self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.get().status_code, 401)
+        self.assertEqual(user_cache.get_stats()['invalidations'], 1)
+
+    def test_version_evicted_from_the_shared_cache(self):
+        self.assertEqual(self.get().status_code, 200)
+        cache.clear()
+        self.assertEqual(self.get().status_code, 200)
+        self.assertEqual(user_cache.get_stats()['hits'], 0)
+
+    def test_expired_entries(self):
+        self.assertEqual(self.get().status_code, 200)
+        with mock.patch('core.authentication.time.monotonic', return_value=10 ** 9):
+            self.assertEqual(self.get().status_code, 200)
+        self.assertEqual(user_cache.get_stats()['expirations'], 1)
@@ -0,0 +1,6 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('user-cache/', views.UserCacheStatsView.as_view()),
+]
@@ -1,3 +1,13 @@
-from django.shortcuts import render
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-# Create your views here.
+from .authentication import user_cache
+
+
+class UserCacheStatsView(APIView):
+    # Metrics of this process's user cache, each worker process has its own
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(user_cache.get_stats())
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_likes(apps, schema_editor):
+    # Nothing prevented liking the same object twice so far, keep the first like of each
+    LikedItem = apps.get_model('likes', 'LikedItem')
+    duplicates = LikedItem.objects \
+        .values('user_id', 'content_type_id', 'object_id') \
+        .annotate(first_id=Min('id'), count=Count('id')) \
+        .filter(count__gt=1)
+    for duplicate in duplicates:
+        LikedItem.objects \
+            .filter(user_id=duplicate['user_id'], content_type_id=duplicate['content_type_id'],
+                    object_id=duplicate['object_id']) \
+            .exclude(id=duplicate['first_id']) \
+            .delete()
+
+
+def populate_like_counters(apps, schema_editor):
+    LikedItem = apps.get_model('likes', 'LikedItem')
+    LikeCounter = apps.get_model('likes', 'LikeCounter')
+    LikeCounter.objects.bulk_create([
+        LikeCounter(content_type_id=row['content_type_id'],
+                    object_id=row['object_id'], count=row['count'])
+        for row in LikedItem.objects
+        .order_by()
+        .values('content_type_id', 'object_id')
+        .annotate(count=Count('id'))
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('likes', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LikeCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='likeditem',
+            index=models.Index(fields=['content_type', 'object_id'], name='likes_liked_content_7292dd_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_likes,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='likeditem',
+            constraint=models.UniqueConstraint(fields=('user', 'content_type', 'object_id'), name='likes_likeditem_unique_user_object'),
+        ),
+        migrations.AddField(
+            model_name='likecounter',
+            name='content_type',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype'),
+        ),
+        migrations.AddConstraint(
+            model_name='likecounter',
+            constraint=models.UniqueConstraint(fields=('content_type', 'object_id'), name='likes_likecounter_unique_object'),
+        ),
+        migrations.RunPython(populate_like_counters,
+                             migrations.RunPython.noop),
+    ]
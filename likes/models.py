@@ -1,13 +1,109 @@
 from django.conf import settings
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 
 
+class LikedItemManager(models.Manager):
+    def like(self, user, obj_type, obj_id):
+        # Idempotent, liking twice keeps a single like. Returns True if the like is new
+        content_type = ContentType.objects.get_for_model(obj_type)
+        with transaction.atomic():
+            _, created = self.get_or_create(
+                user=user, content_type=content_type, object_id=obj_id)
+            if created:
+                LikeCounter.objects.adjust(content_type, obj_id, 1)
+        return created
+
+    def unlike(self, user, obj_type, obj_id):
+        # Idempotent as well, returns True if there was a like to remove
+        content_type = ContentType.objects.get_for_model(obj_type)
+        with transaction.atomic():
+            deleted, _ = self.filter(
+                user=user, content_type=content_type, object_id=obj_id).delete()
+            if deleted:
+                LikeCounter.objects.adjust(content_type, obj_id, -deleted)
+        return bool(deleted)
+
+    def get_likes_for_many(self, obj_type, obj_ids, user=None):
+        """
+        Like counts of many objects of the same type, and whether the user liked each of them,
+        as {object id: (count, liked)}. Two queries at most, whatever the number of objects.
+        """
+        content_type = ContentType.objects.get_for_model(obj_type)
+        counts = dict(LikeCounter.objects
+                      .filter(content_type=content_type, object_id__in=obj_ids)
+                      .values_list('object_id', 'count'))
+        liked = set()
+        if user is not None and user.is_authenticated:
+            liked = set(self
+                        .filter(user=user, content_type=content_type, object_id__in=obj_ids)
+                        .values_list('object_id', flat=True))
+        return {obj_id: (counts.get(obj_id, 0), obj_id in liked) for obj_id in obj_ids}
+
+
 class LikedItem(models.Model):
+    objects = LikedItemManager()
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
                              on_delete=models.CASCADE)
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey()
+
+    class Meta:
+        constraints = [
+            # Also serves the "liked by me" lookups, which filter on all three columns
+            models.UniqueConstraint(fields=['user', 'content_type', 'object_id'],
+                                    name='likes_likeditem_unique_user_object')
+        ]
+        indexes = [
+            models.Index(fields=['content_type', 'object_id'])
+        ]
+
+
+class LikeCounterManager(models.Manager):
+    def adjust(self, content_type, obj_id, delta):
+        # A single row UPDATE in the caller's transaction, the row is created by the first like
+        counter = self.filter(content_type=content_type, object_id=obj_id)
+        if counter.update(count=F('count') + delta):
+            return
+        try:
+            with transaction.atomic():
+                self.create(content_type=content_type,
+                            object_id=obj_id, count=delta)
+        except IntegrityError:
+            # Created concurrently by another like
+            counter.update(count=F('count') + delta)
+
+    def rebuild(self):
+        # Recounts everything from the likes, for data loaded in bulk or repairs
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create([
+                LikeCounter(content_type_id=content_type_id,
+                            object_id=object_id, count=count)
+                for content_type_id, object_id, count in LikedItem.objects
+                .order_by()
+                .values('content_type_id', 'object_id')
+                .annotate(count=Count('id'))
+                .values_list('content_type_id', 'object_id', 'count')
+                .iterator()
+            ], batch_size=500)
+
+
+class LikeCounter(models.Model):
+    # Number of likes of an object, kept up to date along with the likes so that counts are never a COUNT(*)
+    objects = LikeCounterManager()
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['content_type', 'object_id'],
+                                    name='likes_likecounter_unique_object')
+        ]
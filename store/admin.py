@@ -1,8 +1,6 @@
 from typing import Any
 from django.contrib import admin, messages
 from django.db.models.query import QuerySet
-from django.http.request import HttpRequest
-from django.db.models import Count
 from django.utils.html import format_html, urlencode
 from django.urls import reverse
 
@@ -20,7 +18,7 @@ class InventoryFilter(admin.SimpleListFilter):
 
     def queryset(self, request: Any, queryset: QuerySet[Any]) -> QuerySet[Any] | None:
         if self.value() == '<10':
-            return queryset.filter(inventory__lt=10)
+            return queryset.filter(available_inventory__lt=10)
 
 
 class ProductImageInline(admin.TabularInline):
@@ -29,7 +27,10 @@ class ProductImageInline(admin.TabularInline):
 
     def thumbnail(self, instance):
         if instance.image.name != '':
-            return format_html(f'<img src="{instance.image.url}" class="thumbnail" />')
+            # Prefer the small rendered variant over making the browser download the original
+            name = instance.variants.get('thumbnail')
+            url = instance.image.storage.url(name) if name else instance.image.url
+            return format_html('<img src="{}" class="thumbnail" />', url)
 
 
 @admin.register(models.Product)
@@ -47,21 +48,30 @@ class ProductAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ['title']}
     search_fields = ['title']
 
+    def get_queryset(self, request):
+        # The stock available right now, including the sales rollup_inventory hasn't folded in yet
+        return super().get_queryset(request).with_available_inventory()
+
     def collection_title(self, product):
         return product.collection.title
 
-    @admin.display(ordering='inventory')
+    @admin.display(ordering='available_inventory')
     def inventory_status(self, product):
-        if product.inventory < 10:
+        if product.available_inventory < 10:
             return 'Low'
         return 'All good'
 
+    def get_readonly_fields(self, request, obj=None):
+        # Only set on creation, changes are recorded as inventory movements
+        return ['inventory'] if obj is not None else []
+
     @admin.action(description='Clear inventory')
     def clear_inventory(self, request, queryset):
-        updated_count = queryset.update(inventory=0)
+        product_ids = list(queryset.values_list('id', flat=True))
+        models.InventoryMovement.objects.set_stock({product_id: 0 for product_id in product_ids})
         self.message_user(
             request,
-            f'Successfully cleared inventory for {updated_count} product(s)',
+            f'Successfully cleared inventory for {len(product_ids)} product(s)',
             messages.SUCCESS
         )
 
@@ -94,9 +104,6 @@ class CollectionAdmin(admin.ModelAdmin):
         return format_html('<a href="{}">{}</a>', url,
                            collection.products_count)
 
-    def get_queryset(self, request: HttpRequest) -> QuerySet[Any]:
-        return super().get_queryset(request).annotate(products_count=Count('products'))
-
 
 class OrderItemInline(admin.TabularInline):
     autocomplete_fields = ['product']
@@ -121,5 +128,25 @@ class OrderAdmin(admin.ModelAdmin):
         )
         return format_html('<a href="{}">{}</a>', url, order.customer)
 
+
+@admin.register(models.InventoryMovement)
+class InventoryMovementAdmin(admin.ModelAdmin):
+    # Append-only: movements are added, through the ledger, and never changed
+    autocomplete_fields = ['product']
+    fields = ['product', 'kind', 'quantity']
+    list_display = ['created_at', 'product', 'kind', 'quantity', 'order', 'rolled_up']
+    list_filter = ['kind', 'rolled_up', 'created_at']
+    list_per_page = 20
+    list_select_related = ['product']
+
+    def save_model(self, request, obj, form, change):
+        obj.pk = models.InventoryMovement.objects.record(obj.kind, {obj.product_id: obj.quantity})[0].pk
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 # admin.site.register(models.Collection)
 # admin.site.register(models.Product)
@@ -0,0 +1,101 @@
+from contextlib import nullcontext
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.http import Http404
+from django.urls import URLPattern
+
+
+# Async counterparts of the hottest viewsets, served without holding a thread for the whole request under ASGI
+# (storefront/asgi.py). Which routes use them is decided by ASYNC_ROUTES, see use_async_routes().
+#
+# An async viewset subclasses the sync one and overrides some of its actions with coroutines; the actions it
+# doesn't override are run in a thread, the way Django runs sync views under ASGI. Django has no async database
+# drivers: the async ORM runs the queries in a thread as well, but only for as long as the query takes.
+
+class AsyncViewSetMixin:
+    """
+    Dispatches requests asynchronously. Authentication, permissions and throttling may query the database,
+    they run in a thread, once per request.
+    """
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        # dispatch() returns a coroutine, the view has to be awaited rather than run in a thread
+        return markcoroutinefunction(super().as_view(actions, **initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        # As APIView.dispatch
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        # Set by ReplicaReadMixin, whose dispatch() is bypassed
+        with getattr(self, 'replica_scope', nullcontext)():
+            try:
+                await sync_to_async(self.initial)(request, *args, **kwargs)
+
+                if request.method.lower() in self.http_method_names:
+                    handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+                else:
+                    handler = self.http_method_not_allowed
+
+                if iscoroutinefunction(handler):
+                    response = await handler(request, *args, **kwargs)
+                else:
+                    response = await sync_to_async(handler)(request, *args, **kwargs)
+            except Exception as exc:
+                response = self.handle_exception(exc)
+
+            self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def afilter_queryset(self, queryset):
+        # Filter backends may query, e.g. for content types the first time
+        if not self.filter_backends:
+            return queryset
+        return await sync_to_async(self.filter_queryset)(queryset)
+
+    async def aget_object(self):
+        # As GenericAPIView.get_object
+        queryset = await self.afilter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except queryset.model.DoesNotExist:
+            raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        await sync_to_async(self.check_object_permissions)(self.request, obj)
+        return obj
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        if hasattr(self.paginator, 'apaginate_queryset'):
+            return await self.paginator.apaginate_queryset(queryset, self.request, view=self)
+        return await sync_to_async(self.paginator.paginate_queryset)(queryset, self.request, view=self)
+
+
+def use_async_routes(urlpatterns, viewsets, routes):
+    """
+    Returns urlpatterns with the views of the routes named in `routes` served by the async counterpart
+    of their viewset, from `viewsets` ({viewset: async viewset}), with the same actions
+    """
+    available = {pattern.name for pattern in urlpatterns
+                 if getattr(pattern.callback, 'cls', None) in viewsets}
+    unknown = set(routes) - available
+    if unknown:
+        raise ImproperlyConfigured(
+            f'No async views for the routes: {", ".join(sorted(unknown))}, out of: {", ".join(sorted(available))}')
+
+    patterns = []
+    for pattern in urlpatterns:
+        if pattern.name in routes:
+            callback = pattern.callback
+            view = viewsets[callback.cls].as_view(callback.actions, **callback.initkwargs)
+            pattern = URLPattern(pattern.pattern, view, pattern.default_args, pattern.name)
+        patterns.append(pattern)
+    return patterns
@@ -0,0 +1,128 @@
+import gc
+import json
+import os
+import re
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+
+from store.models import Collection, Product
+
+
+# Each suite is a module exposing run(options) -> {name: result}, see the benchmark command
+SUITES = {
+    'asgi': 'store.benchmarks.asgi',
+    'endpoints': 'store.benchmarks.endpoints',
+    'exports': 'store.benchmarks.exports',
+    'serializers': 'store.benchmarks.serializers',
+}
+
+SEED_FILE = Path(__file__).resolve().parent.parent / \
+    'management' / 'commands' / 'seed.sql'
+
+
+def load_dataset(scale=1):
+    """
+    Loads seed.sql (10 collections, 1000 products) and replicates its products `scale` times.
+    """
+    sql = SEED_FILE.read_text()
+    with connection.cursor() as cursor:
+        for statement in re.split(r';\s*$', sql, flags=re.MULTILINE):
+            if statement.strip():
+                cursor.execute(statement)
+
+    # seed.sql bypasses the ORM, bring the denormalized/indexed data in line with it
+    from store import search
+    Collection.objects.reconcile_products_count()
+    search.index_products()
+    Product.objects.update_effective_prices()
+
+    originals = list(Product.objects.order_by('id').values(
+        'title', 'slug', 'description', 'unit_price', 'inventory', 'collection_id'))
+    for copy in range(1, scale):
+        Product.objects.bulk_create([
+            Product(**dict(product, title=f"{product['title']} #{copy}"))
+            for product in originals
+        ], batch_size=500)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = (len(values) - 1) * percent / 100
+    lower = int(index)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (index - lower)
+
+
+def measure(func, iterations=50, warmup=5):
+    """
+    Calls func repeatedly and reports the queries of a single call, latency percentiles in milliseconds
+    and the peak memory allocated by a single call. Memory is traced in a separate call, as tracemalloc
+    would otherwise inflate the timings.
+    """
+    for _ in range(warmup):
+        func()
+
+    # Requests reset the query log when they start, make sure the capture starts from an empty one as well
+    reset_queries()
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    # Captured queries are read lazily from the log, count them before the next request resets it
+    query_count = len(queries)
+
+    timings = []
+    gc.collect()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'queries': query_count,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def write_results(path, results, meta):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump({'meta': meta, 'results': results},
+                  file, indent=2, sort_keys=True)
+        file.write('\n')
+
+
+def find_regressions(results, baseline, threshold):
+    """
+    Compares results to a baseline produced by an earlier run. Any increase in queries is a regression,
+    timings and memory are allowed to grow by `threshold` percent to absorb noise.
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric, value in result.items():
+            before = previous.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(before, (int, float)):
+                continue
+            if metric == 'queries':
+                regressed = value > before
+            elif metric.endswith('_per_sec'):
+                # Throughput, higher is better
+                regressed = value < before * (1 - threshold / 100)
+            else:
+                regressed = value > before * (1 + threshold / 100)
+            if regressed:
+                regressions.append((name, metric, before, value))
+    return regressions
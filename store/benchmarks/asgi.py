@@ -0,0 +1,193 @@
+import asyncio
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.test.utils import override_settings
+from django.urls import include, path
+
+from core.models import User
+from core.serializers import TokenObtainPairSerializer
+from store import urls
+from store.models import Cart, CartItem, Product
+from . import percentile
+
+
+# Concurrent clients, each sending its requests one after the other
+CONNECTIONS = 50
+# Threads of the WSGI server, e.g. gunicorn --threads
+WSGI_WORKERS = 8
+# Time a slow client takes to send its request, during which a WSGI worker is busy reading it
+SLOW_CLIENT_MS = 100
+
+ASYNC_ROUTES = ['products-list', 'products-detail', 'cart-detail']
+
+
+def get_urlconf(async_routes):
+    urlconf = types.ModuleType(f'benchmark_urls_{len(async_routes)}')
+    urlconf.urlpatterns = [path('store/', include(urls.get_urlpatterns(async_routes)))]
+    return urlconf
+
+
+def create_fixtures():
+    user = User.objects.create(username='benchmark-asgi', email='asgi@benchmark.local')
+    cart = Cart.objects.create()
+    CartItem.objects.bulk_create(
+        [CartItem(cart=cart, product=product, quantity=2) for product in Product.objects.order_by('id')[:10]])
+    token = TokenObtainPairSerializer.get_token(user).access_token
+    return f'JWT {token}', cart
+
+
+class WSGIServer:
+    """
+    Runs the requests on a pool of threads, the way a threaded WSGI server does.
+    A worker is taken for the whole request, including the time the client takes to send it.
+    """
+
+    def __init__(self, slow_ms):
+        self.handler = WSGIHandler()
+        self.pool = ThreadPoolExecutor(WSGI_WORKERS)
+        self.slow = slow_ms / 1000
+
+    def handle(self, path, query, headers):
+        time.sleep(self.slow)
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+            'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+            'wsgi.url_scheme': 'http', 'wsgi.input': BytesIO(), 'wsgi.errors': BytesIO(),
+            'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+            **{'HTTP_' + name.upper().replace('-', '_'): value for name, value in headers.items()},
+        }
+        status = []
+        body = b''.join(self.handler(environ, lambda code, _, exc_info=None: status.append(code)))
+        return int(status[0].split()[0]), body
+
+    async def request(self, path, query, headers):
+        return await asyncio.get_running_loop().run_in_executor(self.pool, self.handle, path, query, headers)
+
+    def close(self):
+        self.pool.shutdown()
+
+
+class ASGIServer:
+    """
+    Runs the requests on the event loop, the way an ASGI server does.
+    The request body arrives SLOW_CLIENT_MS after the request starts, without holding anything meanwhile.
+    """
+
+    def __init__(self, slow_ms):
+        self.handler = ASGIHandler()
+        self.slow = slow_ms / 1000
+
+    async def request(self, path, query, headers):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+            'headers': [(b'host', b'testserver')] + [(name.lower().encode(), value.encode())
+                                                     for name, value in headers.items()],
+            'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+        }
+        done = asyncio.Event()
+        received = False
+
+        async def receive():
+            nonlocal received
+            if not received:
+                received = True
+                await asyncio.sleep(self.slow)
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # Django listens for a disconnect while the response is being produced
+            await done.wait()
+            return {'type': 'http.disconnect'}
+
+        status = None
+        body = []
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body':
+                body.append(message.get('body', b''))
+
+        try:
+            await self.handler(scope, receive, send)
+        finally:
+            done.set()
+        return status, b''.join(body)
+
+    def close(self):
+        pass
+
+
+async def load(server, url, headers, requests):
+    """
+    Sends `requests` requests over CONNECTIONS concurrent connections, returns the
+    elapsed time and the latency of every request, in seconds
+    """
+    path, _, query = url.partition('?')
+    remaining = iter(range(requests))
+    timings = []
+
+    async def connection():
+        for _ in remaining:
+            start = time.perf_counter()
+            status, _ = await server.request(path, query, headers)
+            timings.append(time.perf_counter() - start)
+            assert status == 200, f'{url}: {status}'
+
+    start = time.perf_counter()
+    await asyncio.gather(*[connection() for _ in range(CONNECTIONS)])
+    return time.perf_counter() - start, timings
+
+
+def run(options):
+    """
+    Serves the same reads under load, in process, through a threaded WSGI server with the sync views,
+    ASGI with the sync views and ASGI with the async views (ASYNC_ROUTES), for clients sending their requests
+    at once and slow ones. Responses are checked to be identical before anything is measured.
+
+    Clients and server share the process (and the GIL), what matters is how the three compare to each other.
+    """
+    authorization, cart = create_fixtures()
+    headers = {'Authorization': authorization, 'Accept': 'application/json'}
+    product = Product.objects.order_by('id').first()
+    endpoints = {
+        'products-list': '/store/products/?ordering=-unit_price',
+        'products-detail': f'/store/products/{product.id}/',
+        'cart-detail': f'/store/carts/{cart.id}/',
+    }
+    modes = {
+        'wsgi': (WSGIServer, get_urlconf([])),
+        'asgi-sync': (ASGIServer, get_urlconf([])),
+        'asgi': (ASGIServer, get_urlconf(ASYNC_ROUTES)),
+    }
+    requests = options['iterations'] * 10
+
+    results = {}
+    expected = {}
+    for clients, slow_ms in {'fast': 0, 'slow': SLOW_CLIENT_MS}.items():
+        for mode, (server_class, urlconf) in modes.items():
+            with override_settings(ROOT_URLCONF=urlconf, DEBUG=False):
+                server = server_class(slow_ms)
+                try:
+                    for name, url in endpoints.items():
+                        _, body = asyncio.run(server.request(*url.partition('?')[::2], headers))
+                        assert expected.setdefault(name, body) == body, f'{mode} {name}: response differs'
+                        asyncio.run(load(server, url, headers, options['warmup'] * CONNECTIONS))
+
+                        elapsed, timings = asyncio.run(load(server, url, headers, requests))
+                        timings = [timing * 1000 for timing in timings]
+                        results[f'{mode}-{name}-{clients}-clients'] = {
+                            'requests_per_sec': round(requests / elapsed),
+                            'p50_ms': round(percentile(timings, 50), 3),
+                            'p95_ms': round(percentile(timings, 95), 3),
+                            'p99_ms': round(percentile(timings, 99), 3),
+                        }
+                finally:
+                    server.close()
+
+    return results
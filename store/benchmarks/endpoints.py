@@ -0,0 +1,122 @@
+from rest_framework.test import APIClient
+
+from core.models import User
+from core.serializers import TokenObtainPairSerializer
+from store.models import Cart, CartItem, Customer, Order, OrderItem, Product, ProductImage, Review
+from . import measure
+
+
+def create_fixtures():
+    staff = User.objects.create(
+        username='benchmark-staff', email='staff@benchmark.local', is_staff=True, is_superuser=True)
+    user = User.objects.create(
+        username='benchmark-customer', email='customer@benchmark.local')
+    customer = Customer.objects.get(user=user)
+
+    products = list(Product.objects.order_by('id')[:20])
+    product = products[0]
+
+    Review.objects.bulk_create([
+        Review(product=product, name=f'Reviewer {index}', description='Lorem ipsum dolor sit amet')
+        for index in range(50)
+    ])
+    # bulk_create skips the variant rendering, the stored names are all that the serializers look at
+    ProductImage.objects.bulk_create([ProductImage(
+        product=product, image='dog.jpg', variants={'thumbnail': 'dog.jpg', 'small': 'dog.jpg'})])
+
+    cart = Cart.objects.create()
+    CartItem.objects.bulk_create(
+        [CartItem(cart=cart, product=item, quantity=2) for item in products[:10]])
+
+    orders = Order.objects.bulk_create(
+        [Order(customer=customer) for _ in range(50)])
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=item, quantity=1,
+                  unit_price=item.unit_price)
+        for order in orders
+        for item in products[:5]
+    ])
+
+    return {
+        'staff': staff,
+        'user': user,
+        'customer': customer,
+        'product': product,
+        'cart': cart,
+        'order': orders[0],
+    }
+
+
+def get_endpoints(fixtures):
+    """
+    Every route registered in store/urls.py, as name -> (client, method, url, data).
+    Catalog endpoints are measured both for anonymous clients (served from the catalog cache)
+    and for authenticated ones (always hitting the database).
+    The *-revalidate ones send the ETag of the current response, and are answered with a 304.
+    """
+    anonymous = APIClient()
+    customer = APIClient()
+    customer.force_authenticate(fixtures['user'])
+    staff = APIClient()
+    staff.force_authenticate(fixtures['staff'])
+    # Authenticated with an access token, like real clients, to include the user lookup
+    token = APIClient()
+    token.credentials(
+        HTTP_AUTHORIZATION=f"JWT {TokenObtainPairSerializer.get_token(fixtures['user']).access_token}")
+
+    product = fixtures['product']
+    collection_id = product.collection_id
+    cart = fixtures['cart']
+    order = fixtures['order']
+
+    return {
+        'products-list-anonymous': (anonymous, 'get', '/store/products/', None),
+        'products-list': (customer, 'get', '/store/products/', None),
+        'products-list-filtered': (customer, 'get', f'/store/products/?collection_id={collection_id}&unit_price__gte=10&ordering=-unit_price', None),
+        'products-search': (customer, 'get', '/store/products/?search=bread', None),
+        'products-detail-anonymous': (anonymous, 'get', f'/store/products/{product.id}/', None),
+        'products-detail': (customer, 'get', f'/store/products/{product.id}/', None),
+        'products-list-revalidate': (customer, 'get', '/store/products/', None),
+        'products-detail-revalidate': (customer, 'get', f'/store/products/{product.id}/', None),
+        'products-likes': (customer, 'get', '/store/products/likes/?ids=' + ','.join(str(id) for id in range(product.id, product.id + 10)), None),
+        'collections-list-anonymous': (anonymous, 'get', '/store/collections/', None),
+        'collections-list': (customer, 'get', '/store/collections/', None),
+        'collections-detail': (customer, 'get', f'/store/collections/{collection_id}/', None),
+        'collections-list-revalidate': (customer, 'get', '/store/collections/', None),
+        'reviews-list': (anonymous, 'get', f'/store/products/{product.id}/reviews/', None),
+        'images-list': (anonymous, 'get', f'/store/products/{product.id}/images/', None),
+        'carts-detail': (anonymous, 'get', f'/store/carts/{cart.id}/', None),
+        'carts-summary': (anonymous, 'get', f'/store/carts/{cart.id}/?summary=true', None),
+        'carts-detail-revalidate': (anonymous, 'get', f'/store/carts/{cart.id}/', None),
+        'cart-items-list': (anonymous, 'get', f'/store/carts/{cart.id}/items/', None),
+        'cart-items-add': (anonymous, 'post', f'/store/carts/{cart.id}/items/', {'product_id': product.id, 'quantity': 1}),
+        'customers-list': (staff, 'get', '/store/customers/', None),
+        'customers-me': (customer, 'get', '/store/customers/me/', None),
+        'customers-me-token': (token, 'get', '/store/customers/me/', None),
+        'customers-me-revalidate': (customer, 'get', '/store/customers/me/', None),
+        'orders-list': (customer, 'get', '/store/orders/', None),
+        'orders-list-token': (token, 'get', '/store/orders/', None),
+        'orders-list-staff': (staff, 'get', '/store/orders/', None),
+        'orders-detail': (customer, 'get', f'/store/orders/{order.id}/', None),
+    }
+
+
+def run(options):
+    fixtures = create_fixtures()
+    results = {}
+
+    for name, (client, method, url, data) in get_endpoints(fixtures).items():
+        headers = {}
+        expected = range(200, 300)
+        if name.endswith('-revalidate'):
+            headers['HTTP_IF_NONE_MATCH'] = client.get(url)['ETag']
+            expected = [304]
+
+        def request():
+            response = getattr(client, method)(url, data, format='json', **headers)
+            assert response.status_code in expected, f'{name}: {response.status_code}'
+
+        results[name] = measure(
+            request, iterations=options['iterations'], warmup=options['warmup'])
+
+    return results
@@ -0,0 +1,64 @@
+from rest_framework.test import APIClient
+
+from core.models import User
+from store.models import Customer, Order, OrderItem, Product
+from . import measure
+
+
+ORDERS_PER_SCALE = 2000
+ITEMS_PER_ORDER = 5
+
+
+def create_fixtures(scale):
+    staff = User.objects.create(
+        username='benchmark-export-staff', email='export-staff@benchmark.local', is_staff=True)
+    user = User.objects.create(
+        username='benchmark-export-customer', email='export-customer@benchmark.local')
+    customer = Customer.objects.get(user=user)
+
+    products = list(Product.objects.order_by('id')[:ITEMS_PER_ORDER])
+    orders = Order.objects.bulk_create(
+        [Order(customer=customer, payment_status='C' if index % 2 else 'P')
+         for index in range(ORDERS_PER_SCALE * scale)], batch_size=500)
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=product,
+                  quantity=1, unit_price=product.unit_price)
+        for order in orders
+        for product in products
+    ], batch_size=500)
+    return staff
+
+
+def run(options):
+    client = APIClient()
+    client.force_authenticate(create_fixtures(options['scale']))
+
+    exports = {
+        'orders-csv': ('/store/exports/orders.csv', 'csv'),
+        'orders-ndjson': ('/store/exports/orders.ndjson', 'ndjson'),
+        'orders-csv-complete': ('/store/exports/orders.csv?payment_status=C', 'csv'),
+        'products-csv': ('/store/exports/products.csv', 'csv'),
+        'products-ndjson': ('/store/exports/products.ndjson', 'ndjson'),
+    }
+
+    results = {}
+    for name, (url, export_format) in exports.items():
+        rows = 0
+
+        def export():
+            nonlocal rows
+            response = client.get(url)
+            assert response.status_code == 200, f'{name}: {response.status_code}'
+            # Consume the stream chunk by chunk as a client would, counting lines rather than keeping them
+            rows = sum(chunk.count(b'\n') for chunk in response.streaming_content)
+            if export_format == 'csv':
+                rows -= 1
+
+        # Every call exports the whole table, a handful of them is enough for stable numbers
+        result = measure(export, iterations=min(options['iterations'], 10),
+                         warmup=min(options['warmup'], 1))
+        result['rows'] = rows
+        result['rows_per_sec'] = round(rows / (result['p50_ms'] / 1000))
+        results[name] = result
+
+    return results
@@ -0,0 +1,84 @@
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from core.models import User
+from store.models import Customer, Order, OrderItem, Product
+from store.renderers import FastJSONRenderer
+from store.rows import OrderRowSerializer, ProductRowSerializer
+from store.serializers import OrderSerializer, ProductSerializer
+from tags.models import TaggedItem
+from . import measure
+
+
+PRODUCTS = 500
+ORDERS = 200
+ITEMS_PER_ORDER = 5
+
+
+def create_orders():
+    user = User.objects.create(
+        username='benchmark-serializers-customer', email='serializers-customer@benchmark.local')
+    customer = Customer.objects.get(user=user)
+    products = list(Product.objects.order_by('id')[:ITEMS_PER_ORDER])
+    orders = Order.objects.bulk_create(
+        [Order(customer=customer) for _ in range(ORDERS)], batch_size=500)
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=product,
+                  quantity=1, unit_price=product.unit_price)
+        for order in orders
+        for product in products
+    ], batch_size=500)
+    return customer
+
+
+def from_rows(serializer, queryset):
+    return serializer.serialize(serializer.get_rows(queryset))
+
+
+def run(options):
+    """
+    Serializes the same products and orders with the serializers and with their row counterparts
+    (from the query to the data, as the list views do), then renders the data with both JSON renderers.
+    The outputs are checked to be identical before anything is measured.
+    """
+    customer = create_orders()
+    context = {'request': APIRequestFactory().get('/store/products/')}
+
+    products = Product.objects.order_by('id').prefetch_related(
+        'images', Prefetch('tagged_items', queryset=TaggedItem.objects.select_related('tag')))[:PRODUCTS]
+    orders = Order.objects.filter(customer=customer).order_by('id').prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product')))
+
+    cases = {
+        'products': (
+            lambda: ProductSerializer(list(products.all()), many=True, context=context).data,
+            lambda: from_rows(ProductRowSerializer(context), products),
+        ),
+        'orders': (
+            lambda: OrderSerializer(list(orders.all()), many=True).data,
+            lambda: from_rows(OrderRowSerializer(), orders),
+        ),
+    }
+
+    results = {}
+    for name, (serialize, serialize_rows) in cases.items():
+        data = serialize()
+        assert JSONRenderer().render(data) == JSONRenderer().render(serialize_rows()), \
+            f'{name}: row serializer output differs'
+        assert JSONRenderer().render(data) == FastJSONRenderer().render(data), \
+            f'{name}: renderer output differs'
+        count = len(data)
+
+        for case, func in {
+            f'{name}-serializer': serialize,
+            f'{name}-rows': serialize_rows,
+            f'{name}-render-json': lambda: JSONRenderer().render(data),
+            f'{name}-render-fast': lambda: FastJSONRenderer().render(data),
+        }.items():
+            result = measure(func, iterations=options['iterations'], warmup=options['warmup'])
+            result['objects'] = count
+            result['objects_per_sec'] = round(count / (result['p50_ms'] / 1000))
+            results[case] = result
+
+    return results
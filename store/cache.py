@@ -0,0 +1,209 @@
+import hashlib
+import math
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+from .conditional import ConditionalGetMixin
+from .routers import read_alias
+
+
+CATALOG_VERSION_KEY = 'catalog'
+# Part of every product response: bumped instead of each product when many change at once
+PRODUCTS_VERSION_KEY = 'products'
+# Beyond this many products, a change invalidates all of them with a single bump
+MAX_PRODUCT_BUMPS = 100
+
+
+def get_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def product_version_key(product_id):
+    return f'product:{product_id}'
+
+
+def collection_version_key(collection_id):
+    return f'collection:{collection_id}'
+
+
+def canonical_id(value):
+    """
+    `value` as an int, or None when it isn't written the way the id is: '01' finds the same rows as '1',
+    but would be cached under a version key that the signal handlers never bump
+    """
+    value = str(value)
+    if not value.isdigit() or str(int(value)) != value:
+        return None
+    return int(value)
+
+
+def _initial_version():
+    # Seed missing counters with a timestamp rather than 1, so that a counter evicted by the cache backend
+    # can never come back with a value that was already used for an older state of the catalog
+    return int(time.time() * 1000)
+
+
+def get_versions(keys):
+    cache = get_cache()
+    keys = [f'version:{key}' for key in keys]
+    versions = cache.get_many(keys)
+
+    missing = {key: _initial_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*keys):
+    def bump():
+        cache = get_cache()
+        for key in set(keys):
+            try:
+                cache.incr(f'version:{key}')
+            except ValueError:
+                # Counter is not present yet (or was evicted), start a fresh one
+                cache.set(f'version:{key}', _initial_version(), timeout=None)
+        if settings.DATABASE_REPLICAS:
+            # See get_fill_timeout()
+            cache.set_many({f'bumped:{key}': time.time() for key in keys},
+                           settings.DATABASE_REPLICA_STICKY_SECONDS)
+
+    # Inside a transaction, wait for the commit: bumping earlier would let a concurrent reader cache
+    # the old state under the new version. Outside of one, this runs immediately
+    transaction.on_commit(bump)
+
+
+def get_fill_timeout(keys):
+    """
+    Timeout of an entry depending on the version `keys`, filled by the current request. Replicas may not have caught
+    up with the writes of the last DATABASE_REPLICA_STICKY_SECONDS yet: entries read from one after such a write
+    only live until the replica has
+    """
+    if read_alias.get() is None:
+        return settings.CATALOG_CACHE_TIMEOUT
+    bumped = get_cache().get_many([f'bumped:{key}' for key in keys]).values()
+    if not bumped:
+        return settings.CATALOG_CACHE_TIMEOUT
+    return max(1, math.ceil(max(bumped) + settings.DATABASE_REPLICA_STICKY_SECONDS - time.time()))
+
+
+def bump_product(product_id, *collection_ids):
+    # Any product change invalidates the product itself, the listings of the collections it belongs (or belonged) to,
+    # and the unfiltered catalog listings, since those include every product
+    bump_versions(
+        CATALOG_VERSION_KEY,
+        product_version_key(product_id),
+        *[collection_version_key(collection_id)
+          for collection_id in collection_ids if collection_id is not None]
+    )
+
+
+def bump_products(product_ids=None, collection_ids=()):
+    # For bulk changes, product_ids is None when the products weren't looked up
+    if product_ids is None or len(product_ids) > MAX_PRODUCT_BUMPS:
+        product_keys = [PRODUCTS_VERSION_KEY]
+    else:
+        product_keys = [product_version_key(product_id) for product_id in product_ids]
+    bump_versions(
+        CATALOG_VERSION_KEY,
+        *product_keys,
+        *[collection_version_key(collection_id)
+          for collection_id in collection_ids if collection_id is not None]
+    )
+
+
+def bump_collection(collection_id):
+    bump_versions(CATALOG_VERSION_KEY,
+                  collection_version_key(collection_id))
+
+
+class CatalogCacheMixin(ConditionalGetMixin):
+    """
+    Serves list/retrieve responses for anonymous clients from the catalog cache.
+
+    The cache key combines the request path, the query params and the version counters the response depends on,
+    so entries never need to be deleted explicitly: the signal handlers bump the relevant counters on every write
+    and stale entries simply stop being looked up. A hit returns the stored data without touching the ORM.
+    Conditional requests are answered first, with the validator cached the same way for every client, so that
+    a 304 doesn't cost the aggregate of a listing either: it must not depend on the user.
+    Misses are read from a replica like the rest of the view, see get_fill_timeout().
+    """
+
+    def get_cache_version_keys(self, request, pk=None):
+        """
+        Returns the version keys of the list (pk is None) or the object, or None when the response can't be cached,
+        e.g. for ids that aren't in canonical form
+        """
+        raise NotImplementedError
+
+    def get_catalog_cache_key(self, request, pk=None):
+        versions = get_versions(self.get_cache_version_keys(request, pk))
+        params = sorted(request.query_params.lists())
+        raw = f'{request.get_host()}|{request.path}|{params}|{versions}'
+        return 'response:' + hashlib.md5(raw.encode()).hexdigest()
+
+    def is_catalog_cacheable(self, request, pk=None):
+        return (request.method == 'GET' and not request.user.is_authenticated
+                and self.get_cache_version_keys(request, pk) is not None)
+
+    def load_validator(self, request, pk=None):
+        keys = self.get_cache_version_keys(request, pk)
+        if request.method not in ('GET', 'HEAD') or keys is None:
+            return super().load_validator(request, pk)
+
+        cache = get_cache()
+        key = 'validator:' + self.get_catalog_cache_key(request, pk)
+        validator = cache.get(key)
+        if validator is None:
+            validator = super().load_validator(request, pk)
+            if validator is not None:
+                cache.set(key, validator, get_fill_timeout(keys))
+        return validator
+
+    def cached_response(self, request, pk, render):
+        if not self.is_catalog_cacheable(request, pk):
+            return render()
+
+        cache = get_cache()
+        key = self.get_catalog_cache_key(request, pk)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = render()
+        if response.status_code == 200:
+            cache.set(key, response.data, get_fill_timeout(self.get_cache_version_keys(request, pk)))
+        return response
+
+    async def acached_response(self, request, pk, render):
+        # As cached_response, for the async views, where render() returns a coroutine
+        if not self.is_catalog_cacheable(request, pk):
+            return await render()
+
+        cache = get_cache()
+        key = await sync_to_async(self.get_catalog_cache_key)(request, pk)
+        data = await cache.aget(key)
+        if data is not None:
+            return Response(data)
+
+        response = await render()
+        if response.status_code == 200:
+            timeout = await sync_to_async(get_fill_timeout)(self.get_cache_version_keys(request, pk))
+            await cache.aset(key, response.data, timeout)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, self.get_validators(request), lambda: self.cached_response(
+            request, None, lambda: super(CatalogCacheMixin, self).list(request, *args, **kwargs)))
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs['pk']
+        return self.conditional_response(request, self.get_validators(request, pk), lambda: self.cached_response(
+            request, pk, lambda: super(CatalogCacheMixin, self).retrieve(request, *args, **kwargs)))
@@ -0,0 +1,99 @@
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+# Conditional GET support: responses carry an ETag and, for single objects, a Last-Modified header computed from
+# the last_update / last_activity timestamps of the rows they represent, and requests with a matching
+# If-None-Match, or an If-Modified-Since no older than Last-Modified, get a 304 Not Modified without running
+# the serializer.
+#
+# The ETag is weak, since the same data is rendered differently by the browsable API, and also depends on the
+# request (host, path, query params, renderer) so that e.g. two pages of the same listing never share one.
+
+def make_validators(request, last_modified, *parts):
+    """
+    Returns (etag, last_modified) for a response whose content only changes along with
+    `last_modified` and `parts`
+    """
+    params = sorted(request.query_params.lists())
+    renderer = getattr(request, 'accepted_renderer', None)
+    raw = f'{request.get_host()}|{request.path}|{params}|{renderer and renderer.format}|' \
+          f'{last_modified and last_modified.isoformat()}|{parts}'
+    return f'W/"{hashlib.md5(raw.encode()).hexdigest()}"', last_modified
+
+
+def get_timestamp_validator(queryset, pk=None, field='last_update'):
+    """
+    Validator of an object from its timestamp, or of a list from the latest timestamp and the number of rows,
+    which also catches rows being deleted or no longer matching the filters
+    """
+    queryset = queryset.order_by()
+    if pk is None:
+        aggregates = queryset.aggregate(last_modified=Max(field), count=Count('pk'))
+        return aggregates['last_modified'], aggregates['count']
+    try:
+        last_modified = queryset.filter(pk=pk).values_list(field, flat=True).first()
+    except (ValueError, ValidationError):
+        # Malformed pk, left for the view to handle
+        return None
+    return None if last_modified is None else (last_modified,)
+
+
+class ConditionalGetMixin:
+    def get_validator(self, request, pk=None):
+        """
+        Returns (last_modified, *parts) for the list (pk is None) or the object, from a query much cheaper
+        than the response itself. None skips the conditional handling, e.g. for objects that don't exist
+        """
+        raise NotImplementedError
+
+    def load_validator(self, request, pk=None):
+        # Extension point for caching the validator, see CatalogCacheMixin
+        return self.get_validator(request, pk)
+
+    def get_validators(self, request, pk=None):
+        validator = self.load_validator(request, pk)
+        if validator is None:
+            return None
+        etag, last_modified = make_validators(request, *validator)
+        if pk is None:
+            # The latest timestamp of a list doesn't go back when its newest row is deleted or leaves the filters,
+            # nor tell apart changes within the same second: lists are only validated by their ETag
+            last_modified = None
+        return etag, last_modified
+
+    def get_not_modified_response(self, request, validators):
+        etag, last_modified = validators
+        return get_conditional_response(
+            request, etag=etag, last_modified=int(last_modified.timestamp()) if last_modified else None)
+
+    def set_validator_headers(self, response, validators):
+        etag, last_modified = validators
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(int(last_modified.timestamp()))
+        return response
+
+    def conditional_response(self, request, validators, render):
+        if validators is None or request.method not in ('GET', 'HEAD'):
+            return render()
+
+        response = self.get_not_modified_response(request, validators)
+        if response is None:
+            response = render()
+        return self.set_validator_headers(response, validators)
+
+    async def aconditional_response(self, request, validators, render):
+        # As conditional_response, for the async views, where render() returns a coroutine
+        if validators is None or request.method not in ('GET', 'HEAD'):
+            return await render()
+
+        response = self.get_not_modified_response(request, validators)
+        if response is None:
+            response = await render()
+        return self.set_validator_headers(response, validators)
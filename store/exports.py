@@ -0,0 +1,117 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import OrderItem
+
+
+# Bulk exports for finance / analytics jobs. Rows are produced from values() querysets read in keyset chunks
+# (WHERE id > last id ORDER BY id LIMIT n) and written to the response as they are read, so an export holds
+# at most one chunk in memory however many rows it contains. Chunks are used instead of a single
+# QuerySet.iterator() as the MySQL driver buffers a whole result set client side.
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def iter_chunks(queryset, chunk_size):
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by('id')[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1]['id']
+
+
+class Echo:
+    # csv.writer only needs write(), which hands the formatted line back instead of buffering it
+    def write(self, value):
+        return value
+
+
+class Export:
+    chunk_size = 2000
+    fields = []
+
+    def __init__(self, queryset):
+        self.queryset = queryset
+
+    def iter_records(self):
+        raise NotImplementedError
+
+    def iter_rows(self):
+        # CSV is flat, one row per record unless a subclass spreads records over several rows
+        for record in self.iter_records():
+            yield [record[field] for field in self.fields]
+
+    def iter_ndjson(self):
+        encoder = DjangoJSONEncoder(separators=(',', ':'))
+        for record in self.iter_records():
+            yield encoder.encode(record) + '\n'
+
+    def iter_csv(self):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.fields)
+        for row in self.iter_rows():
+            yield writer.writerow(row)
+
+    def stream(self, export_format):
+        return getattr(self, f'iter_{export_format}')()
+
+
+class ProductExport(Export):
+    fields = ['id', 'title', 'slug', 'unit_price', 'inventory',
+              'collection_id', 'collection_title', 'last_update']
+
+    def iter_records(self):
+        # The stock available right now, including the sales rollup_inventory hasn't folded in yet
+        queryset = self.queryset.with_available_inventory().values(
+            'id', 'title', 'slug', 'unit_price', 'available_inventory', 'collection_id', 'collection__title',
+            'last_update')
+        for chunk in iter_chunks(queryset, self.chunk_size):
+            for row in chunk:
+                row['inventory'] = row.pop('available_inventory')
+                row['collection_title'] = row.pop('collection__title')
+                yield row
+
+
+class OrderExport(Export):
+    """
+    Orders with their items: one JSON object per order (items nested) in NDJSON, one row per order item in CSV.
+    """
+    # The ids of a chunk are passed to the items query, stay below SQLite's limit of 999 query parameters
+    chunk_size = 500
+    fields = ['id', 'placed_at', 'payment_status', 'customer_id',
+              'product_id', 'product_title', 'quantity', 'unit_price']
+
+    def iter_records(self):
+        queryset = self.queryset.values(
+            'id', 'placed_at', 'payment_status', 'customer_id')
+        for orders in iter_chunks(queryset, self.chunk_size):
+            for order in orders:
+                order['items'] = []
+            orders_by_id = {order['id']: order for order in orders}
+
+            items = OrderItem.objects \
+                .filter(order_id__in=orders_by_id.keys()) \
+                .order_by('order_id', 'id') \
+                .values('order_id', 'product_id', 'product__title', 'quantity', 'unit_price')
+            for item in items:
+                orders_by_id[item['order_id']]['items'].append({
+                    'product_id': item['product_id'],
+                    'product_title': item['product__title'],
+                    'quantity': item['quantity'],
+                    'unit_price': item['unit_price'],
+                })
+
+            yield from orders
+
+    def iter_rows(self):
+        for order in self.iter_records():
+            head = [order['id'], order['placed_at'],
+                    order['payment_status'], order['customer_id']]
+            for item in order['items']:
+                yield head + [item['product_id'], item['product_title'], item['quantity'], item['unit_price']]
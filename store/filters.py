@@ -1,11 +1,40 @@
-from django_filters.rest_framework import FilterSet
-from store.models import Product
+from django_filters.rest_framework import CharFilter, FilterSet, IsoDateTimeFilter
+from store.models import Order, Product
+from tags.models import TaggedItem
 
 
 class ProductFilter(FilterSet):
+    # ?tag=a,b returns the products tagged with any of the labels
+    tag = CharFilter(method='filter_tag')
+
+    def filter_tag(self, queryset, name, value):
+        labels = [label.strip() for label in value.split(',') if label.strip()]
+        if not labels:
+            return queryset
+        return queryset.filter(id__in=TaggedItem.objects.get_object_ids(Product, labels))
+
     class Meta:
         model = Product
         fields = {
             'collection_id': ['exact'],
-            'unit_price': ['gte', 'lt']
+            'unit_price': ['gte', 'lt'],
+            'effective_price': ['gte', 'lt'],
         }
+
+
+class OrderExportFilter(FilterSet):
+    placed_after = IsoDateTimeFilter(field_name='placed_at', lookup_expr='gte')
+    placed_before = IsoDateTimeFilter(field_name='placed_at', lookup_expr='lt')
+
+    class Meta:
+        model = Order
+        fields = ['payment_status']
+
+
+class ProductExportFilter(FilterSet):
+    updated_after = IsoDateTimeFilter(field_name='last_update', lookup_expr='gte')
+    updated_before = IsoDateTimeFilter(field_name='last_update', lookup_expr='lt')
+
+    class Meta:
+        model = Product
+        fields = ['collection_id']
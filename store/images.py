@@ -0,0 +1,57 @@
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .models import Product, ProductImage
+from .storage import content_addressed_path, content_hash
+
+
+# Resized variants of product images, rendered by the process_images command running as a worker next to
+# the web processes, so neither the upload request nor the web workers pay for decoding and encoding.
+# Until then the variants are empty and clients fall back to the original
+
+
+def render_variants(name):
+    """
+    Renders every variant in settings.PRODUCT_IMAGE_VARIANTS ({name: max size in pixels}) of the stored image,
+    as WebP, and returns {variant: storage name}. Variants are content addressed like the originals,
+    so identical images share their variants as well.
+    """
+    storage = ProductImage._meta.get_field('image').storage
+    with storage.open(name) as file:
+        original = ImageOps.exif_transpose(Image.open(file))
+        original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'A' in original.getbands() else 'RGB')
+
+    variants = {}
+    for variant, size in settings.PRODUCT_IMAGE_VARIANTS.items():
+        image = original.copy()
+        # Fits the image in a size x size box, keeping its aspect ratio and never upscaling
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+
+        output = BytesIO()
+        image.save(output, format='WEBP',
+                   quality=settings.PRODUCT_IMAGE_QUALITY, method=4)
+        path = content_addressed_path(
+            'store/images/variants', content_hash(output), '.webp')
+        variants[variant] = storage.save(path, ContentFile(output.getvalue()))
+    return variants
+
+
+def get_pending(everything=False):
+    """
+    Returns the (id, storage name) of the images whose variants are missing or incomplete, e.g. new uploads
+    or every image after a variant was added to PRODUCT_IMAGE_VARIANTS.
+    """
+    images = ProductImage.objects.exclude(image='')
+    if not everything:
+        images = images.exclude(variants__has_keys=list(settings.PRODUCT_IMAGE_VARIANTS))
+    return list(images.order_by('id').values_list('id', 'image'))
+
+
+def save_variants(image_id, variants):
+    ProductImage.objects.filter(pk=image_id).update(variants=variants)
+    Product.objects.filter(images__pk=image_id).touch()
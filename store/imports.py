@@ -0,0 +1,220 @@
+import csv
+import io
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .models import Collection, InventoryMovement, Product
+
+
+# Bulk product upserts from supplier files. Rows are parsed one at a time from the file, validated a batch at a time
+# against the model field definitions (max lengths, digits, the MinValueValidator bounds...) with the collections
+# looked up once for the whole import, and written with one bulk_create and one bulk_update per batch.
+# Invalid rows are reported with their line number and skipped, the rest of the file is still imported.
+#
+# Every row is matched to an existing product by `id` when given, else by `slug` (generated from the title when
+# missing): matched products are updated with the fields present in the row, the others are created.
+# The inventory of matched products is a stock count, recorded as adjustments in the inventory ledger.
+
+FORMATS = ['csv', 'ndjson']
+
+FIELDS = ['title', 'slug', 'description', 'unit_price', 'inventory', 'collection_id']
+REQUIRED_FIELDS = ['title', 'unit_price', 'inventory', 'collection_id']
+
+
+def get_format(filename):
+    extension = filename.rsplit('.', 1)[-1].lower()
+    if extension == 'jsonl':
+        return 'ndjson'
+    return extension if extension in FORMATS else None
+
+
+def parse_csv(file):
+    reader = csv.DictReader(file)
+    for row in reader:
+        # Empty cells mean "not provided", so that updates only need the columns that change
+        yield reader.line_num, {key: value for key, value in row.items() if key and value not in ('', None)}
+
+
+def parse_ndjson(file):
+    for line_number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, None
+            continue
+        yield line_number, row if isinstance(row, dict) else None
+
+
+def parse(file, file_format):
+    """
+    Yields (line number, row) from a binary or text file, row being None when the line cannot be parsed
+    """
+    if isinstance(file.read(0), bytes):
+        file = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    return parse_csv(file) if file_format == 'csv' else parse_ndjson(file)
+
+
+def batched(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ProductImporter:
+    # Keeps the id / slug lookups of a batch below SQLite's limit of 999 query parameters
+    batch_size = 500
+
+    def __init__(self, batch_size=None, dry_run=False):
+        if batch_size:
+            self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.fields = {name: Product._meta.get_field(name) for name in FIELDS if name != 'collection_id'}
+        # Resolved once, collections are few and rarely change during an import
+        self.collection_ids = set(Collection.objects.values_list('id', flat=True))
+        self.created = self.updated = 0
+        self.errors = []
+
+    def run(self, file, file_format):
+        for batch in batched(parse(file, file_format), self.batch_size):
+            self.import_batch(batch)
+        return self.get_result()
+
+    def get_result(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'failed': len(self.errors),
+            'errors': sorted(self.errors, key=lambda error: error['line']),
+        }
+
+    def add_error(self, line, errors):
+        self.errors.append({'line': line, 'errors': errors})
+
+    def clean_row(self, row):
+        values = {}
+        errors = {}
+        for name in FIELDS:
+            if name not in row:
+                continue
+            value = row[name]
+            try:
+                if isinstance(value, bool):
+                    # JSON true / false would otherwise pass as 1 / 0 (or 'True' / 'False' for text)
+                    raise ValueError(value)
+                if name == 'collection_id':
+                    value = int(value)
+                    if value not in self.collection_ids:
+                        raise ValidationError(f'Collection {value} does not exist.')
+                elif name == 'description' and value is None:
+                    pass
+                else:
+                    value = self.fields[name].clean(value, None)
+            except (TypeError, ValueError):
+                errors[name] = ['Invalid value.']
+                continue
+            except ValidationError as error:
+                errors[name] = error.messages
+                continue
+            values[name] = value
+
+        if 'id' in row:
+            try:
+                if isinstance(row['id'], bool):
+                    raise ValueError(row['id'])
+                values['id'] = int(row['id'])
+            except (TypeError, ValueError):
+                errors['id'] = ['Invalid value.']
+        elif 'slug' not in values and 'title' in values:
+            slug = slugify(values['title'])[:self.fields['slug'].max_length]
+            if slug:
+                values['slug'] = slug
+        return values, errors
+
+    def import_batch(self, batch):
+        cleaned = []
+        for line, row in batch:
+            if row is None:
+                self.add_error(line, {'non_field_errors': ['Row could not be parsed.']})
+                continue
+            values, errors = self.clean_row(row)
+            if errors:
+                self.add_error(line, errors)
+            else:
+                cleaned.append((line, values))
+
+        # Match the whole batch against existing products with two queries
+        ids = {values['id'] for _, values in cleaned if 'id' in values}
+        slugs = {values['slug'] for _, values in cleaned if 'id' not in values and 'slug' in values}
+        existing = Product.objects.in_bulk(ids) if ids else {}
+        slug_ids = {}
+        if slugs:
+            for product in Product.objects.filter(slug__in=slugs).order_by('-id'):
+                existing[product.id] = product
+                # Ordered by descending id, the oldest product with a slug wins
+                slug_ids[product.slug] = product.id
+
+        to_create = {}
+        to_update = {}
+        update_fields = set()
+        stock = {}
+        lines = []
+        for line, values in cleaned:
+            product_id = values.get('id') or slug_ids.get(values.get('slug'))
+            if product_id is not None:
+                if product_id not in existing:
+                    self.add_error(line, {'id': [f'Product {product_id} does not exist.']})
+                    continue
+                product = to_update.setdefault(product_id, existing[product_id])
+                values.pop('id', None)
+                if 'inventory' in values:
+                    stock[product_id] = values.pop('inventory')
+                update_fields.update(values.keys())
+            else:
+                # Later rows for the same new slug update the pending product instead of creating a second one
+                product = to_create.get(values.get('slug'))
+                if product is None:
+                    missing = [name for name in [*REQUIRED_FIELDS, 'slug'] if name not in values]
+                    if missing:
+                        self.add_error(line, {name: ['This field is required.'] for name in missing})
+                        continue
+                    product = to_create[values['slug']] = Product()
+            for name, value in values.items():
+                setattr(product, name, value)
+            lines.append(line)
+
+        if self.dry_run:
+            self.created += len(to_create)
+            self.updated += len(to_update)
+            return
+
+        try:
+            with transaction.atomic():
+                if to_create:
+                    Product.objects.bulk_create(to_create.values())
+                if update_fields:
+                    # bulk_update doesn't go through pre_save, so auto_now has to be applied by hand
+                    now = timezone.now()
+                    for product in to_update.values():
+                        product.last_update = now
+                    Product.objects.bulk_update(
+                        to_update.values(), [*update_fields, 'last_update'])
+                if stock:
+                    InventoryMovement.objects.set_stock(stock)
+        except DatabaseError as error:
+            for line in lines:
+                self.add_error(line, {'non_field_errors': [f'Batch could not be saved: {error}']})
+            return
+
+        self.created += len(to_create)
+        self.updated += len(to_update)
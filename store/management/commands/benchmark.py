@@ -0,0 +1,77 @@
+import json
+import platform
+from importlib import import_module
+from typing import Any
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from store import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the store endpoints on a throwaway SQLite database and reports queries, latency and memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('suites', nargs='*', default=['endpoints'],
+                            help=f'Suites to run, out of: {", ".join(benchmarks.SUITES.keys())}')
+        parser.add_argument('--scale', type=int, default=1,
+                            help='Number of copies of the seed.sql products to load')
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--output', default='benchmarks/results.json')
+        parser.add_argument('--baseline',
+                            help='Results of an earlier run to compare against')
+        parser.add_argument('--threshold', type=float, default=20,
+                            help='Allowed increase of timings and memory over the baseline, in percent')
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        unknown = set(options['suites']) - set(benchmarks.SUITES.keys())
+        if unknown:
+            raise CommandError(f'Unknown suite(s): {", ".join(unknown)}')
+        if connection.vendor != 'sqlite':
+            raise CommandError(
+                'Benchmarks run on SQLite, use --settings=storefront.settings_benchmark')
+
+        setup_test_environment()
+        # An in-memory test database, so that nothing ever touches the configured one
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True)
+        try:
+            print(f"Loading dataset (scale {options['scale']})")
+            benchmarks.load_dataset(options['scale'])
+
+            results = {}
+            for suite in options['suites']:
+                print(f'Running {suite} benchmarks')
+                suite_results = import_module(
+                    benchmarks.SUITES[suite]).run(options)
+                results.update({f'{suite}:{name}': result for name,
+                               result in suite_results.items()})
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        for name, result in results.items():
+            metrics = ', '.join(f'{metric}={value}' for metric,
+                                value in result.items())
+            print(f'{name}: {metrics}')
+
+        benchmarks.write_results(options['output'], results, {
+            'scale': options['scale'],
+            'iterations': options['iterations'],
+            'python': platform.python_version(),
+        })
+        print(f"Results written to {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)['results']
+            regressions = benchmarks.find_regressions(
+                results, baseline, options['threshold'])
+            for name, metric, before, after in regressions:
+                print(f'REGRESSION {name} {metric}: {before} -> {after}')
+            if regressions:
+                raise CommandError(
+                    f'{len(regressions)} regression(s) against {options["baseline"]}')
+            print('No regressions against the baseline')
@@ -0,0 +1,360 @@
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from itertools import islice
+from multiprocessing import Pool
+from random import Random
+from typing import Any
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Max
+
+from core.models import User
+from likes.models import LikeCounter, LikedItem
+from store.models import Cart, CartItem, Collection, Customer, Order, OrderItem, Product, Review
+from tags.models import Tag, TaggedItem
+
+
+WORDS = ['organic', 'fresh', 'classic', 'premium', 'spicy', 'sweet', 'crunchy', 'golden', 'smoked', 'wild',
+         'bread', 'cheese', 'coffee', 'tea', 'juice', 'sauce', 'cookie', 'pasta', 'honey', 'chocolate',
+         'soap', 'brush', 'candle', 'notebook', 'pen', 'toy', 'magazine', 'flower', 'pepper', 'salt']
+FIRST_NAMES = ['Ada', 'Alan', 'Grace', 'Linus', 'Ken', 'Barbara', 'Dennis', 'Margaret', 'Guido', 'Frances']
+LAST_NAMES = ['Lovelace', 'Turing', 'Hopper', 'Torvalds', 'Thompson', 'Liskov', 'Ritchie', 'Hamilton',
+              'Van Rossum', 'Allen']
+
+EPOCH = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+# Populated in every worker process by init_worker, so the id lists are only pickled once per process
+context = {}
+
+
+def init_worker(worker_context):
+    context.update(worker_context)
+
+
+def get_random(kind, chunk):
+    # Every chunk gets its own generator derived from the seed, so the output doesn't depend
+    # on how many processes generate it or in which order chunks complete
+    return Random(f"{context['seed']}:{kind}:{chunk}")
+
+
+def product_price(product_id):
+    return Decimal((product_id * 7919) % 99900 + 100) / 100
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def generate_collections(chunk, start, count):
+    rng = get_random('collections', chunk)
+    return [(start + index, sentence(rng, 2).title()) for index in range(count)]
+
+
+def generate_products(chunk, start, count):
+    rng = get_random('products', chunk)
+    rows = []
+    for product_id in range(start, start + count):
+        title = sentence(rng, 3).title()
+        rows.append((product_id, title, f'{title.lower().replace(" ", "-")}-{product_id}', sentence(rng, 12),
+                     product_price(product_id), rng.randint(0, 500), rng.choice(context['collection_ids'])))
+    return rows
+
+
+def generate_users(chunk, start, count):
+    rng = get_random('users', chunk)
+    users = []
+    customers = []
+    for user_id in range(start, start + count):
+        users.append((user_id, f'user{user_id}', f'user{user_id}@storefront.local',
+                      rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)))
+        customers.append((user_id, f'+1 555 {rng.randint(0, 9999999):07}',
+                          date(1950, 1, 1) + timedelta(days=rng.randint(0, 20000)),
+                          rng.choice(Customer.MEMBERSHIP_CHOICES)[0]))
+    return users, customers
+
+
+def generate_carts(chunk, start, count):
+    rng = get_random('carts', chunk)
+    carts = []
+    items = []
+    for _ in range(count):
+        cart_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+        carts.append(
+            (cart_id, EPOCH + timedelta(seconds=rng.randint(0, 365 * 86400))))
+        for product_id in rng.sample(context['product_ids'], rng.randint(1, min(5, len(context['product_ids'])))):
+            items.append((cart_id, product_id, rng.randint(1, 5)))
+    return carts, items
+
+
+def generate_orders(chunk, start, count):
+    rng = get_random('orders', chunk)
+    orders = []
+    items = []
+    for order_id in range(start, start + count):
+        orders.append((order_id, rng.choice(context['customer_ids']),
+                       EPOCH + timedelta(seconds=rng.randint(0, 365 * 86400)),
+                       rng.choice(Order.PAYMENT_STATUS_CHOICES)[0]))
+        items_per_order = min(context['items_per_order'], len(context['product_ids']))
+        for product_id in rng.sample(context['product_ids'], rng.randint(1, items_per_order)):
+            items.append((order_id, product_id, rng.randint(
+                1, 5), product_price(product_id)))
+    return orders, items
+
+
+def generate_reviews(chunk, start, count):
+    rng = get_random('reviews', chunk)
+    return [(rng.choice(context['product_ids']), rng.choice(FIRST_NAMES), sentence(rng, 20),
+             date(2023, 1, 1) + timedelta(days=rng.randint(0, 365)))
+            for _ in range(count)]
+
+
+def generate_tagged_items(chunk, start, count):
+    rng = get_random('tagged_items', chunk)
+    return [(rng.choice(context['tag_ids']), rng.choice(context['product_ids'])) for _ in range(count)]
+
+
+def generate_likes(chunk, start, count):
+    rng = get_random('likes', chunk)
+    return [(rng.choice(context['user_ids']), rng.choice(context['product_ids'])) for _ in range(count)]
+
+
+@contextmanager
+def preserve_timestamps(*fields):
+    # auto_now / auto_now_add would overwrite the generated timestamps on insert
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def next_id(model):
+    return (model.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+
+
+class Command(BaseCommand):
+    help = 'Generates a deterministic synthetic dataset of any size for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--collections', type=int, default=0)
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--carts', type=int, default=1000)
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--items-per-order', type=int, default=5,
+                            help='Maximum number of items per order (the actual number is random)')
+        parser.add_argument('--reviews', type=int, default=5000)
+        parser.add_argument('--tags', type=int, default=50)
+        parser.add_argument('--tagged-items', type=int, default=5000)
+        parser.add_argument('--likes', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Worker processes generating rows, the database writes always happen here')
+
+    def check_options(self, options):
+        # Fail before anything is written rather than halfway through
+        if options['items_per_order'] < 1:
+            raise CommandError('--items-per-order must be at least 1')
+        has_products = options['products'] > 0 or Product.objects.exists()
+        for kind in ['carts', 'orders', 'reviews', 'tagged_items', 'likes']:
+            if options[kind] > 0 and not has_products:
+                raise CommandError(f'--{kind.replace("_", "-")} needs products, pass --products')
+        if options['orders'] > 0 and not (options['users'] > 0 or Customer.objects.exists()):
+            raise CommandError('--orders needs customers, pass --users')
+        if options['likes'] > 0 and not (options['users'] > 0 or User.objects.exists()):
+            raise CommandError('--likes needs users, pass --users')
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        self.check_options(options)
+        self.options = options
+        self.batch_size = options['batch_size']
+        self.pool = None
+        self.context = {
+            'seed': options['seed'],
+            'items_per_order': options['items_per_order'],
+        }
+        started = time.perf_counter()
+
+        self.generate('collections', options['collections'], next_id(Collection),
+                      generate_collections, self.insert_collections)
+        self.context['collection_ids'] = list(
+            Collection.objects.values_list('id', flat=True))
+        if not self.context['collection_ids']:
+            self.generate('collections', 10, next_id(Collection),
+                          generate_collections, self.insert_collections)
+            self.context['collection_ids'] = list(
+                Collection.objects.values_list('id', flat=True))
+
+        self.generate('products', options['products'], next_id(Product),
+                      generate_products, self.insert_products)
+        self.generate('users', options['users'], next_id(User),
+                      generate_users, self.insert_users)
+
+        self.context['product_ids'] = list(
+            Product.objects.values_list('id', flat=True))
+        self.context['user_ids'] = list(
+            User.objects.values_list('id', flat=True))
+        self.context['customer_ids'] = list(
+            Customer.objects.values_list('id', flat=True))
+
+        self.generate('carts', options['carts'], 0,
+                      generate_carts, self.insert_carts)
+        self.generate('orders', options['orders'], next_id(Order),
+                      generate_orders, self.insert_orders)
+        self.generate('reviews', options['reviews'], 0,
+                      generate_reviews, self.insert_reviews)
+
+        if options['tags']:
+            Tag.objects.bulk_create([Tag(label=f'{word}-{index}')
+                                     for index in range(options['tags'] // len(WORDS) + 1)
+                                     for word in WORDS][:options['tags']])
+        self.context['tag_ids'] = list(Tag.objects.values_list('id', flat=True))
+        self.product_type = ContentType.objects.get_for_model(Product)
+        if self.context['tag_ids']:
+            self.generate('tagged items', options['tagged_items'], 0,
+                          generate_tagged_items, self.insert_tagged_items)
+        self.generate('likes', options['likes'], 0,
+                      generate_likes, self.insert_likes)
+        if options['likes']:
+            LikeCounter.objects.rebuild()
+
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+        print(f'Done in {time.perf_counter() - started:.1f}s')
+
+    def get_pool(self):
+        # Workers are (re)started with the id lists known so far
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+        # Don't let forked workers inherit the open database connection
+        connections.close_all()
+        self.pool = Pool(self.options['processes'],
+                         initializer=init_worker, initargs=(self.context,))
+        return self.pool
+
+    def generate(self, kind, total, start, generator, insert):
+        if total <= 0:
+            return
+
+        chunks = [(chunk, start + chunk * self.batch_size, min(self.batch_size, total - chunk * self.batch_size))
+                  for chunk in range((total + self.batch_size - 1) // self.batch_size)]
+        started = time.perf_counter()
+        done = 0
+
+        if self.options['processes'] > 1:
+            results = self.generate_in_pool(generator, chunks)
+        else:
+            init_worker(self.context)
+            results = (generator(*chunk) for chunk in chunks)
+
+        for (_, _, count), rows in zip(chunks, results):
+            with transaction.atomic():
+                insert(rows)
+            done += count
+            elapsed = time.perf_counter() - started
+            print(f'{kind}: {done}/{total} ({done / elapsed:,.0f} rows/s)')
+
+    def generate_in_pool(self, generator, chunks):
+        # Keep a bounded number of chunks in flight: workers generate ahead while this process inserts,
+        # without generated chunks piling up in memory when the database is the bottleneck.
+        # Results are consumed in submission order, so rows are inserted in the same order as with one process
+        pool = self.get_pool()
+        pending = deque()
+        chunks = iter(chunks)
+        for chunk in islice(chunks, self.options['processes'] * 2):
+            pending.append(pool.apply_async(generator, chunk))
+        while pending:
+            result = pending.popleft().get()
+            for chunk in islice(chunks, 1):
+                pending.append(pool.apply_async(generator, chunk))
+            yield result
+
+    def insert_collections(self, rows):
+        Collection.objects.bulk_create(
+            [Collection(id=id, title=title) for id, title in rows])
+
+    def insert_products(self, rows):
+        with preserve_timestamps(Product._meta.get_field('last_update')):
+            now = datetime.now(timezone.utc)
+            Product.objects.bulk_create([
+                Product(id=id, title=title, slug=slug, description=description, unit_price=unit_price,
+                        inventory=inventory, collection_id=collection_id, last_update=now)
+                for id, title, slug, description, unit_price, inventory, collection_id in rows
+            ])
+
+    def insert_users(self, rows):
+        if not hasattr(self, 'password'):
+            # Hashing is slow on purpose, every generated user shares the same password: 'password'
+            self.password = make_password('password')
+        users, customers = rows
+        User.objects.bulk_create([
+            User(id=id, username=username, email=email, first_name=first_name, last_name=last_name,
+                 password=self.password)
+            for id, username, email, first_name, last_name in users
+        ])
+        # bulk_create doesn't send post_save, so the customers have to be created here
+        Customer.objects.bulk_create([
+            Customer(user_id=user_id, phone=phone,
+                     birth_date=birth_date, membership=membership)
+            for user_id, phone, birth_date, membership in customers
+        ])
+
+    def insert_carts(self, rows):
+        carts, items = rows
+        with preserve_timestamps(Cart._meta.get_field('created_at')):
+            Cart.objects.bulk_create([Cart(id=id, created_at=created_at)
+                                      for id, created_at in carts])
+        CartItem.objects.bulk_create([
+            CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity)
+            for cart_id, product_id, quantity in items
+        ])
+
+    def insert_orders(self, rows):
+        orders, items = rows
+        with preserve_timestamps(Order._meta.get_field('placed_at')):
+            Order.objects.bulk_create([
+                Order(id=id, customer_id=customer_id,
+                      placed_at=placed_at, payment_status=payment_status)
+                for id, customer_id, placed_at, payment_status in orders
+            ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order_id=order_id, product_id=product_id,
+                      quantity=quantity, unit_price=unit_price)
+            for order_id, product_id, quantity, unit_price in items
+        ])
+
+    def insert_reviews(self, rows):
+        with preserve_timestamps(Review._meta.get_field('date')):
+            Review.objects.bulk_create([
+                Review(product_id=product_id, name=name,
+                       description=description, date=review_date)
+                for product_id, name, description, review_date in rows
+            ])
+
+    def insert_tagged_items(self, rows):
+        TaggedItem.objects.bulk_create([
+            TaggedItem(tag_id=tag_id, content_type=self.product_type,
+                       object_id=product_id)
+            for tag_id, product_id in rows
+        ])
+
+    def insert_likes(self, rows):
+        # Random pairs repeat, a user likes a product once. The counters are rebuilt once all likes are in
+        LikedItem.objects.bulk_create([
+            LikedItem(user_id=user_id, content_type=self.product_type,
+                      object_id=product_id)
+            for user_id, product_id in rows
+        ], ignore_conflicts=True)
@@ -0,0 +1,32 @@
+import json
+from typing import Any
+from django.core.management.base import BaseCommand, CommandError
+
+from store import imports
+
+
+class Command(BaseCommand):
+    help = 'Creates or updates products from a CSV or NDJSON file, matching rows by id or slug'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', dest='file_format', choices=imports.FORMATS,
+                            help='Defaults to the extension of the file')
+        parser.add_argument('--batch-size', type=int,
+                            default=imports.ProductImporter.batch_size)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Validate the file without writing anything')
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        file_format = options['file_format'] or imports.get_format(options['path'])
+        if file_format is None:
+            raise CommandError('Unknown file format, use --format')
+
+        importer = imports.ProductImporter(
+            batch_size=options['batch_size'], dry_run=options['dry_run'])
+        with open(options['path'], encoding='utf-8-sig', newline='') as file:
+            result = importer.run(file, file_format)
+
+        for error in result['errors']:
+            print(f"Line {error['line']}: {json.dumps(error['errors'])}")
+        print(f"Created {result['created']}, updated {result['updated']}, failed {result['failed']}")
@@ -0,0 +1,70 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+from typing import Any
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from store import images
+
+
+class Command(BaseCommand):
+    help = 'Renders the missing variants of product images, e.g. of new uploads or after adding a variant ' \
+        'to PRODUCT_IMAGE_VARIANTS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Re-render the variants of every image first, not only of the incomplete ones')
+        parser.add_argument('--workers', type=int,
+                            default=settings.PRODUCT_IMAGE_WORKERS,
+                            help='Number of processes rendering variants, 0 renders them in this process')
+        parser.add_argument('--poll-interval', type=float, default=5.0,
+                            help='Seconds to wait when there is nothing to render')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once every image has its variants instead of polling forever')
+
+    def render(self, pending, executor):
+        rendered = 0
+        failed = []
+        if executor is None:
+            results = ((image_id, name, partial(images.render_variants, name)) for image_id, name in pending)
+        else:
+            futures = {executor.submit(images.render_variants, name): (image_id, name)
+                       for image_id, name in pending}
+            results = ((*futures[future], future.result) for future in as_completed(futures))
+
+        for image_id, name, result in results:
+            try:
+                images.save_variants(image_id, result())
+                rendered += 1
+            except Exception as error:
+                print(f'Image {image_id} ({name}) failed: {error}')
+                failed.append((image_id, name))
+        return rendered, failed
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        print('Rendering image variants')
+        executor = None
+        if options['workers']:
+            executor = ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup)
+
+        everything = options['all']
+        failures = set()
+        try:
+            while True:
+                # Images that failed are not retried until the worker restarts, rather than over and over
+                pending = [image for image in images.get_pending(everything) if image not in failures]
+                everything = False
+                if pending:
+                    rendered, failed = self.render(pending, executor)
+                    failures.update(failed)
+                    print(f'Rendered {rendered} images, {len(failed)} failed')
+                if options['once']:
+                    break
+                if not pending:
+                    time.sleep(options['poll_interval'])
+        finally:
+            if executor is not None:
+                executor.shutdown()
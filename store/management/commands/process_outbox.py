@@ -0,0 +1,37 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from django.core.management.base import BaseCommand
+
+from store import outbox
+
+
+class Command(BaseCommand):
+    help = 'Delivers pending outbox events (e.g. order_created) to their handlers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Number of threads delivering events concurrently')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when there is nothing to process')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no more events are due instead of polling forever')
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        print('Processing outbox events')
+        processed = failed = 0
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                events = outbox.claim_batch(options['batch_size'])
+                if not events:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                results = list(executor.map(outbox.process, events))
+                processed += results.count(True)
+                failed += results.count(False)
+                print(f'Processed {processed} event(s), {failed} failure(s)')
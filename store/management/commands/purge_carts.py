@@ -0,0 +1,80 @@
+import time
+from datetime import datetime, timedelta
+from typing import Any
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from store.models import Cart, CartItem
+
+
+class Command(BaseCommand):
+    help = 'Deletes carts without activity for CART_EXPIRY_DAYS, in small batches with a pause in between'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CART_EXPIRY_DAYS)
+        parser.add_argument('--cutoff',
+                            help='Delete carts inactive since before this ISO timestamp, overrides --days. '
+                                 'Printed at the start of every run, pass it back to resume an interrupted one')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0.5,
+                            help='Seconds to sleep between batches, giving other transactions and replicas room')
+        parser.add_argument('--max-batches', type=int,
+                            help='Stop after this many batches, the next run carries on where this one stopped')
+
+    def get_cutoff(self, options):
+        if options['cutoff'] is None:
+            return timezone.now() - timedelta(days=options['days'])
+        try:
+            cutoff = datetime.fromisoformat(options['cutoff'])
+        except ValueError:
+            raise CommandError(f"Invalid cutoff: {options['cutoff']}")
+        return cutoff if timezone.is_aware(cutoff) else timezone.make_aware(cutoff)
+
+    def purge_batch(self, cutoff, batch_size):
+        with transaction.atomic():
+            # Lock the batch, so that a cart getting an item added concurrently is either skipped
+            # or waits for the delete. Oldest first, so that an interrupted run has removed the stalest carts
+            cart_ids = list(Cart.objects
+                            .select_for_update(skip_locked=True)
+                            .filter(last_activity__lt=cutoff)
+                            .order_by('last_activity', 'id')
+                            .values_list('id', flat=True)[:batch_size])
+            if not cart_ids:
+                return 0, 0
+            # The items go along with a single DELETE ... WHERE cart_id IN (...)
+            _, deleted = Cart.objects.filter(pk__in=cart_ids).delete()
+        return deleted.get(Cart._meta.label, 0), deleted.get(CartItem._meta.label, 0)
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        cutoff = self.get_cutoff(options)
+        # Everything is deleted by its last activity, so running again with the same cutoff resumes the purge
+        print(f'Purging carts inactive since before {cutoff.isoformat()} '
+              f'(resume with --cutoff={cutoff.isoformat()})')
+
+        start = time.perf_counter()
+        paused = 0
+        batches = carts = items = 0
+        try:
+            while options['max_batches'] is None or batches < options['max_batches']:
+                batch_carts, batch_items = self.purge_batch(cutoff, options['batch_size'])
+                if not batch_carts:
+                    break
+                batches += 1
+                carts += batch_carts
+                items += batch_items
+
+                # The pauses are left out of the rate, which measures how fast the database deletes
+                elapsed = time.perf_counter() - start - paused
+                print(f'Batch {batches}: {batch_carts} carts, {batch_items} items '
+                      f'({(carts + items) / elapsed:,.0f} rows/s)')
+
+                time.sleep(options['pause'])
+                paused += options['pause']
+        except KeyboardInterrupt:
+            print('Interrupted, the batches above are committed')
+
+        elapsed = time.perf_counter() - start - paused
+        rate = (carts + items) / elapsed if elapsed > 0 else 0
+        print(f'Deleted {carts} carts and {items} items in {batches} batches, {rate:,.0f} rows/s')
@@ -0,0 +1,16 @@
+from typing import Any
+from django.core.management.base import BaseCommand
+
+from store import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the product full-text search index from the products table'
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        if not search.is_supported():
+            print('Full-text search is not supported on this database, nothing to do')
+            return
+
+        print('Rebuilding product search index')
+        search.index_products()
@@ -0,0 +1,17 @@
+from typing import Any
+from django.core.management.base import BaseCommand
+
+from store.models import Collection
+
+
+class Command(BaseCommand):
+    help = 'Repairs drift in the denormalized Collection.products_count, one batch of collections at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        checked, repairs = Collection.objects.reconcile_products_count(options['batch_size'])
+        for collection_id, stored, count in repairs:
+            print(f'Collection {collection_id}: {stored} -> {count}')
+        print(f'Checked {checked} collection(s), repaired {len(repairs)}')
@@ -0,0 +1,47 @@
+import time
+from typing import Any
+from django.core.management.base import BaseCommand
+
+from store.models import InventoryMovement
+
+
+class Command(BaseCommand):
+    help = 'Folds the inventory movements (sales, receipts, ...) into Product.inventory, one product at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of products to look up at a time')
+        parser.add_argument('--poll-interval', type=float, default=60.0,
+                            help='Seconds to wait between rollups')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit after a single rollup instead of repeating it forever')
+
+    def rollup(self, batch_size):
+        products = movements = 0
+        last_id = 0
+        while True:
+            # Each product is folded in its own short transaction, holding up its sales as little as possible
+            product_ids = list(InventoryMovement.objects
+                               .filter(rolled_up=False, product_id__gt=last_id)
+                               .order_by('product_id')
+                               .values_list('product_id', flat=True)
+                               .distinct()[:batch_size])
+            if not product_ids:
+                return products, movements
+            last_id = product_ids[-1]
+
+            for product_id in product_ids:
+                movements += InventoryMovement.objects.rollup(product_id)
+            products += len(product_ids)
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        print('Rolling up inventory movements')
+        while True:
+            start = time.perf_counter()
+            products, movements = self.rollup(options['batch_size'])
+            if products:
+                print(f'Rolled up {movements} movement(s) of {products} product(s) '
+                      f'in {time.perf_counter() - start:.2f}s')
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
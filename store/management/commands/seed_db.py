@@ -1,6 +1,7 @@
 from typing import Any
 from django.core.management.base import BaseCommand
 from django.db import connection
+from store.models import Collection, Product
 from pathlib import Path
 import os
 
@@ -16,3 +17,7 @@ class Command(BaseCommand):
 
         with connection.cursor() as cursor:
             cursor.execute(sql)
+
+        # The raw inserts leave effective_price and products_count at their database defaults
+        Product.objects.update_effective_prices()
+        Collection.objects.reconcile_products_count()
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = 'Copies the primary SQLite database over the replicas of DATABASE_REPLICAS, ' \
+           'standing in for replication locally (see storefront.settings_replicas)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('replicas', nargs='*',
+                            help='Replicas to sync, all of DATABASE_REPLICAS by default')
+
+    def handle(self, *args, **options):
+        replicas = options['replicas'] or settings.DATABASE_REPLICAS
+        if not replicas:
+            raise CommandError('No replicas in DATABASE_REPLICAS')
+        primary = connections[DEFAULT_DB_ALIAS]
+        for alias in replicas:
+            if alias not in settings.DATABASE_REPLICAS:
+                raise CommandError(f'Not a replica: {alias}')
+            if primary.vendor != 'sqlite' or connections[alias].vendor != 'sqlite':
+                raise CommandError('Only SQLite databases can be synced, real replicas replicate by themselves')
+
+        primary.ensure_connection()
+        for alias in replicas:
+            replica = connections[alias]
+            replica.ensure_connection()
+            # A consistent snapshot of the primary, even with writes going on
+            primary.connection.backup(replica.connection)
+            print(f'Synced {alias}')
@@ -0,0 +1,28 @@
+from typing import Any
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from store.models import Product, Promotion
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the stored effective prices, to be run periodically so that promotions apply as they start and end'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute every product, e.g. after changing TAX_RATE')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        products = Product.objects.all()
+        if not options['all']:
+            # Only products with a time limited promotion can change price without a write to the product
+            # or the promotion (which reprice them right away)
+            scheduled = Promotion.objects.filter(
+                Q(starts_at__isnull=False) | Q(ends_at__isnull=False))
+            products = products.filter(pk__in=Product.promotions.through.objects
+                                       .filter(promotion__in=scheduled)
+                                       .values('product_id'))
+
+        updated = products.update_effective_prices(batch_size=options['batch_size'])
+        print(f'Updated the effective price of {updated} products')
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:42
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE store_product_fts USING fts5(title, description, tokenize = 'unicode61 remove_diacritics 2')")
+        schema_editor.execute(
+            "INSERT INTO store_product_fts (rowid, title, description) "
+            "SELECT id, title, COALESCE(description, '') FROM store_product")
+    elif vendor == 'mysql':
+        schema_editor.execute(
+            'ALTER TABLE store_product ADD FULLTEXT INDEX store_product_search_idx (title, description)')
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE store_product_fts')
+    elif vendor == 'mysql':
+        schema_editor.execute(
+            'ALTER TABLE store_product DROP INDEX store_product_search_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_alter_orderitem_order_productimage'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
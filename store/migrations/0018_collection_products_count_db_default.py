@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_outboxevent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='collection',
+            name='products_count',
+            field=models.IntegerField(db_default=0, default=0, editable=False),
+        ),
+    ]
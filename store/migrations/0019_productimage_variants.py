@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:53
+
+import store.storage
+import store.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_collection_products_count_db_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(storage=store.storage.ContentAddressedStorage(), upload_to=store.storage.product_image_path, validators=[store.validators.validate_file_size]),
+        ),
+    ]
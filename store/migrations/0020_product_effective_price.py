@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:59
+
+from decimal import ROUND_HALF_UP, Decimal
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import Max
+
+
+# The TAX_RATE setting as of this migration, frozen like the price math below.
+# Run `manage.py update_prices --all` to apply another rate
+TAX_RATE = Decimal('0.18')
+BATCH_SIZE = 500
+
+
+def get_effective_price(unit_price, discount=None):
+    # Frozen copy of store.pricing.get_effective_price as of this migration, so that later changes to the
+    # price math don't change what this migration writes
+    price = Decimal(str(unit_price))
+    if discount:
+        price = price * (100 - Decimal(str(discount))) / 100
+    price = price * (1 + TAX_RATE)
+    return price.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def populate_effective_prices(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    last_id = 0
+    while True:
+        # Walk the products by primary key, a batch at a time, rather than loading them all at once
+        products = list(Product.objects.filter(pk__gt=last_id).order_by('pk').only('id', 'unit_price')[:BATCH_SIZE])
+        if not products:
+            return
+        # Promotions have no period yet, so every one of them is active
+        discounts = dict(Product.promotions.through.objects
+                         .filter(product_id__in=[product.id for product in products])
+                         .values('product_id')
+                         .annotate(discount=Max('promotion__discount'))
+                         .values_list('product_id', 'discount'))
+        for product in products:
+            product.effective_price = get_effective_price(
+                product.unit_price, discounts.get(product.id))
+        Product.objects.bulk_update(products, ['effective_price'])
+        last_id = products[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0019_productimage_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(db_default=0, db_index=True, decimal_places=2, default=0, editable=False, max_digits=8),
+        ),
+        migrations.AddField(
+            model_name='promotion',
+            name='ends_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='promotion',
+            name='starts_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='promotion',
+            name='discount',
+            field=models.FloatField(validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100)]),
+        ),
+        migrations.RunPython(populate_effective_prices,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:00
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def populate_last_activity(apps, schema_editor):
+    # Without any history, a cart was last active when it was created
+    Cart = apps.get_model('store', 'Cart')
+    Cart.objects.update(last_activity=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0020_product_effective_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='last_activity',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(populate_last_activity,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:10
+
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0021_cart_last_activity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='last_update',
+            field=models.DateTimeField(auto_now=True, db_default=django.db.models.functions.datetime.Now()),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='last_update',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -1,16 +1,94 @@
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.core.validators import MinValueValidator
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.contrib import admin
-from django.db import models
-
+from django.contrib.contenttypes.fields import GenericRelation
+from django.db import connections, models, transaction
+from django.db.models import Count, DecimalField, F, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Now
+from django.utils import timezone
+
+import random
+from collections import Counter
 from uuid import uuid4
 
+from . import cache, pricing, search
+from .storage import ContentAddressedStorage, product_image_path
 from .validators import validate_file_size
 
 
+class PromotionQuerySet(models.QuerySet):
+    def active(self, now=None):
+        now = now or timezone.now()
+        return self.filter(Q(starts_at__isnull=True) | Q(starts_at__lte=now),
+                           Q(ends_at__isnull=True) | Q(ends_at__gt=now))
+
+
 class Promotion(models.Model):
     description = models.CharField(max_length=255)
-    discount = models.FloatField()
+    # Percentage taken off the unit price
+    discount = models.FloatField(
+        validators=[MinValueValidator(0), MaxValueValidator(100)])
+    # Open ended when null, the update_prices command applies promotions as they start and end
+    starts_at = models.DateTimeField(null=True, blank=True)
+    ends_at = models.DateTimeField(null=True, blank=True)
+
+    objects = PromotionQuerySet.as_manager()
+
+
+class CollectionQuerySet(models.QuerySet):
+    def adjust_products_count(self, deltas):
+        # Apply {collection_id: delta} as atomic increments, so concurrent writers never overwrite each other
+        for collection_id, delta in deltas.items():
+            if collection_id is not None and delta:
+                self.filter(pk=collection_id).update(
+                    products_count=F('products_count') + delta)
+
+    def update(self, **kwargs):
+        # auto_now is only applied by save(), stamp bulk writes as well so that last_update stays usable
+        # as a validator for conditional requests
+        kwargs.setdefault('last_update', timezone.now())
+        return super().update(**kwargs)
+
+    def reconcile_products_count(self, batch_size=500):
+        """
+        Recounts the products of the collections one batch at a time, e.g. after products were written
+        with raw SQL, and repairs the counts that drifted.
+        Returns the number of collections checked and the repairs, as [(collection id, stored, actual)].
+        """
+        last_id = 0
+        checked = 0
+        repairs = []
+        while True:
+            with transaction.atomic(using=self.db):
+                # Lock the batch, so that products created concurrently either are already committed
+                # (and counted below) or apply their increment after the repaired value is written
+                collections = dict(self
+                                   .select_for_update()
+                                   .filter(pk__gt=last_id)
+                                   .order_by('pk')
+                                   .values_list('id', 'products_count')[:batch_size])
+                if not collections:
+                    return checked, repairs
+
+                actual = dict(Product.objects
+                              .using(self.db)
+                              .filter(collection_id__in=collections.keys())
+                              .order_by()
+                              .values('collection_id')
+                              .annotate(count=Count('id'))
+                              .values_list('collection_id', 'count'))
+
+                for collection_id, stored in collections.items():
+                    count = actual.get(collection_id, 0)
+                    if count != stored:
+                        Collection.objects.using(self.db).filter(
+                            pk=collection_id).update(products_count=count)
+                        cache.bump_collection(collection_id)
+                        repairs.append((collection_id, stored, count))
+
+            checked += len(collections)
+            last_id = max(collections.keys())
 
 
 class Collection(models.Model):
@@ -18,6 +96,14 @@ class Collection(models.Model):
     # related_name '+' indicates to Django to ignore creating the reverse relationship field
     featured_product = models.ForeignKey(
         'Product', on_delete=models.SET_NULL, null=True, related_name='+')
+    # Denormalized number of products, maintained by the Product signals and ProductQuerySet
+    # Can be repaired with the reconcile_products_count command should it ever drift
+    products_count = models.IntegerField(
+        default=0, db_default=0, editable=False)
+    # db_default for the rows inserted with raw SQL, e.g. by seed.sql
+    last_update = models.DateTimeField(auto_now=True, db_default=Now())
+
+    objects = CollectionQuerySet.as_manager()
 
     def __str__(self) -> str:
         return self.title
@@ -26,6 +112,135 @@ class Collection(models.Model):
         ordering = ['title']
 
 
+class ProductQuerySet(models.QuerySet):
+    # Bulk write paths don't send model signals, so they have to keep Collection.products_count
+    # (and the catalog cache / search index) in sync themselves
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            # New products have no promotions yet
+            obj.effective_price = pricing.get_effective_price(obj.unit_price)
+
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            if kwargs.get('update_conflicts'):
+                # Existing rows keep their promotions
+                self.filter(pk__in=[obj.pk for obj in objs if obj.pk is not None]) \
+                    .update_effective_prices()
+            if kwargs.get('ignore_conflicts') or kwargs.get('update_conflicts'):
+                # Can't tell which rows were actually inserted, count the affected collections again
+                Collection.objects.filter(pk__in={obj.collection_id for obj in objs}).update(
+                    products_count=Subquery(
+                        Product.objects.filter(collection_id=OuterRef('pk'))
+                        .order_by().values('collection_id').annotate(count=Count('id')).values('count')))
+            else:
+                Collection.objects.adjust_products_count(
+                    Counter(obj.collection_id for obj in objs))
+
+        collection_ids = {obj.collection_id for obj in objs}
+        for collection_id in collection_ids:
+            cache.bump_collection(collection_id)
+        search.index_products([obj.id for obj in objs if obj.id is not None])
+        return objs
+
+    def update(self, **kwargs):
+        # bulk_update() also ends up here, with CASE expressions as values.
+        # Stamped like save() does, so that last_update changes along with the product representation
+        kwargs.setdefault('last_update', timezone.now())
+        moved = 'collection' in kwargs or 'collection_id' in kwargs
+        searchable = 'title' in kwargs or 'description' in kwargs
+        priced = 'unit_price' in kwargs or 'effective_price' in kwargs
+        with transaction.atomic(using=self.db):
+            # The rows are only looked up when the bookkeeping needs them,
+            # other bulk updates invalidate every product at once
+            previous = current = None
+            if moved or searchable or priced:
+                previous = current = dict(self.values_list('id', 'collection_id'))
+            rows = super().update(**kwargs)
+            if moved:
+                current = dict(self.model.objects
+                               .filter(pk__in=previous.keys())
+                               .values_list('id', 'collection_id'))
+                deltas = Counter()
+                for product_id, old_collection_id in previous.items():
+                    deltas[old_collection_id] -= 1
+                    deltas[current.get(product_id)] += 1
+                Collection.objects.adjust_products_count(deltas)
+            if 'unit_price' in kwargs:
+                self.model.objects.filter(pk__in=previous.keys()) \
+                    .update_effective_prices()
+
+        if previous is None:
+            cache.bump_products()
+        else:
+            cache.bump_products(previous.keys(), {*previous.values(), *current.values()})
+        if searchable:
+            search.index_products(previous.keys())
+        return rows
+
+    def get_discounts(self):
+        """
+        Returns {product id: discount} with the best discount among the active promotions of every product
+        that has one.
+        """
+        return dict(Product.promotions.through.objects
+                    .filter(product_id__in=self.values('id'), promotion__in=Promotion.objects.active())
+                    .values('product_id')
+                    .annotate(discount=Max('promotion__discount'))
+                    .values_list('product_id', 'discount'))
+
+    def touch(self):
+        # For changes to related rows that are part of the product representation (images, tags) of a few products,
+        # invalidated one by one rather than along with the whole catalog
+        with transaction.atomic(using=self.db):
+            products = dict(self.values_list('id', 'collection_id'))
+            rows = super().update(last_update=timezone.now())
+        cache.bump_products(products.keys(), products.values())
+        return rows
+
+    def update_effective_prices(self, batch_size=1000):
+        """
+        Recomputes the stored effective price of the products in batches, only writing the ones that changed.
+        Returns the number of products updated.
+        """
+        updated = 0
+        last_id = 0
+        while True:
+            products = list(self.filter(pk__gt=last_id)
+                            .order_by('pk')
+                            .only('id', 'unit_price', 'effective_price', 'collection_id')[:batch_size])
+            if not products:
+                return updated
+            last_id = products[-1].id
+
+            discounts = Product.objects.filter(
+                pk__in=[product.id for product in products]).get_discounts()
+            changed = []
+            for product in products:
+                price = pricing.get_effective_price(
+                    product.unit_price, discounts.get(product.id))
+                if price != product.effective_price:
+                    product.effective_price = price
+                    changed.append(product)
+            if changed:
+                # Goes through update(), which invalidates the cached catalog entries of these products
+                Product.objects.bulk_update(changed, ['effective_price'])
+                updated += len(changed)
+
+    def with_available_inventory(self):
+        # The stock that can be sold right now: the sum of the shards of the products that have them, read with
+        # a single statement so that it's consistent without locking anything, see InventoryShardQuerySet
+        return self.annotate(available_inventory=Coalesce(
+            Subquery(InventoryShard.objects
+                     .filter(product_id=OuterRef('pk'))
+                     .order_by().values('product_id').annotate(total=Sum('quantity')).values('total')),
+            F('inventory')))
+
+    def get_available_inventory(self):
+        return dict(self.order_by().with_available_inventory().values_list('id', 'available_inventory'))
+
+
 class Product(models.Model):
     title = models.CharField(max_length=255)
     slug = models.SlugField()
@@ -36,16 +251,57 @@ class Product(models.Model):
         decimal_places=2,
         validators=[MinValueValidator(1)]
     )
+    # Initial stock, then maintained by rollup_inventory from the InventoryMovement ledger
     inventory = models.IntegerField(validators=[MinValueValidator(0)])
+    # unit_price with the active promotions and tax applied, see store.pricing. Stored and indexed so that
+    # listings can filter and order by the price customers actually pay
+    effective_price = models.DecimalField(
+        max_digits=8, decimal_places=2, default=0, db_default=0, db_index=True, editable=False)
     last_update = models.DateTimeField(auto_now=True)
     collection = models.ForeignKey(
 
         Collection, on_delete=models.PROTECT, related_name='products')
     promotions = models.ManyToManyField(Promotion, blank=True)
+    # Reverse side of TaggedItem's generic foreign key, for prefetching and filtering by tags
+    tagged_items = GenericRelation('tags.TaggedItem', related_query_name='product')
+
+    objects = ProductQuerySet.as_manager()
 
     def __str__(self) -> str:
         return self.title
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if self._state.adding:
+            # Promotions can only be attached once the product exists
+            self.effective_price = pricing.get_effective_price(self.unit_price)
+            repriced = True
+        else:
+            # Only look the promotions up when the unit price actually changes, promotion changes
+            # reprice their products by themselves (see the signal handlers and update_prices)
+            repriced = (update_fields is None or 'unit_price' in update_fields) \
+                and ('_loaded_unit_price' not in self.__dict__
+                     or pricing.to_decimal(self.unit_price) != self._loaded_unit_price)
+            if repriced:
+                discount = Product.objects.filter(pk=self.pk).get_discounts().get(self.pk)
+                self.effective_price = pricing.get_effective_price(self.unit_price, discount)
+
+        # The inventory of an existing product is never written back: it's maintained by the rollup_inventory
+        # command, and the value loaded by e.g. the admin may predate the last rollup.
+        # Stock changes go through InventoryMovement instead. Likewise for an effective price that wasn't
+        # recomputed, which may have been repriced since the product was loaded
+        if not self._state.adding:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'inventory'
+                and (repriced if field.name == 'effective_price'
+                     else update_fields is None or field.name in update_fields)]
+
+        # Make the collection products_count update done by the post_save handler part of the same transaction
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+        self._loaded_unit_price = pricing.to_decimal(self.unit_price)
+
     class Meta:
         ordering = ['title']
 
@@ -53,8 +309,11 @@ class Product(models.Model):
 class ProductImage(models.Model):
     product = models.ForeignKey(
         Product, on_delete=models.CASCADE, related_name='images')
-    image = models.ImageField(upload_to='store/images',
+    image = models.ImageField(upload_to=product_image_path,
+                              storage=ContentAddressedStorage(),
                               validators=[validate_file_size])
+    # {variant name: storage name} of the resized copies rendered by store.images
+    variants = models.JSONField(default=dict, blank=True, editable=False)
 
 
 class Customer(models.Model):
@@ -77,6 +336,7 @@ class Customer(models.Model):
         max_length=1, choices=MEMBERSHIP_CHOICES, default=MEMBERSHIP_KEY_BRONZE)
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    last_update = models.DateTimeField(auto_now=True)
 
     def __str__(self) -> str:
         return f'{self.user.first_name} {self.user.last_name}'
@@ -141,9 +401,76 @@ class Address(models.Model):
         Customer, on_delete=models.CASCADE, primary_key=True)
 
 
+class CartQuerySet(models.QuerySet):
+    def touch(self):
+        # Records activity on the carts, which keeps them from being purged (see the purge_carts command)
+        return self.update(last_activity=timezone.now())
+
+    async def atouch(self):
+        return await self.aupdate(last_activity=timezone.now())
+
+    def with_totals(self):
+        # Aggregated by the database in the same query that loads the carts, rather than summed over the items
+        return self.annotate(
+            items_count=Count('items'),
+            total_quantity=Coalesce(Sum('items__quantity'), 0),
+            total_price=Coalesce(
+                Sum(F('items__quantity') * F('items__product__unit_price'),
+                    output_field=DecimalField(max_digits=12, decimal_places=2)),
+                Value(0), output_field=DecimalField(max_digits=12, decimal_places=2)),
+        )
+
+
 class Cart(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Refreshed whenever items are added, updated or removed
+    last_activity = models.DateTimeField(default=timezone.now, db_index=True)
+
+    objects = CartQuerySet.as_manager()
+
+
+class CartItemQuerySet(models.QuerySet):
+    def add_items(self, cart_id, quantities):
+        """
+        Adds {product_id: quantity} to a cart with a single INSERT that increments the quantity of products
+        already in the cart, so that concurrent adds of the same product can't run into the (cart, product)
+        unique constraint. Returns the resulting cart items when the database can return them from the insert,
+        None otherwise.
+        """
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        db_cart_id = self.model._meta.get_field('cart').get_db_prep_value(
+            cart_id, connection)
+
+        # Always insert in the same order, so that concurrent adds lock the rows in the same order
+        rows = sorted(quantities.items())
+        values = ', '.join(['(%s, %s, %s)'] * len(rows))
+        params = [value for product_id, quantity in rows
+                  for value in (db_cart_id, product_id, quantity)]
+
+        sql = f'INSERT INTO {table} (cart_id, product_id, quantity) VALUES {values} '
+        if connection.vendor == 'mysql':
+            sql += 'ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity)'
+        else:
+            sql += f'ON CONFLICT (cart_id, product_id) DO UPDATE SET quantity = {table}.quantity + excluded.quantity'
+
+        returning = connection.features.can_return_columns_from_insert
+        if returning:
+            sql += ' RETURNING id, product_id, quantity'
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            items = None
+            if returning:
+                items = [self.model(id=id, cart_id=cart_id, product_id=product_id, quantity=quantity)
+                         for id, product_id, quantity in cursor.fetchall()]
+        Cart.objects.using(self.db).filter(pk=cart_id).touch()
+        return items
+
+    async def aadd_items(self, cart_id, quantities):
+        # No async cursors in Django, the statement runs in a thread like the rest of the async ORM
+        return await sync_to_async(self.add_items)(cart_id, quantities)
 
 
 class CartItem(models.Model):
@@ -153,6 +480,8 @@ class CartItem(models.Model):
     quantity = models.PositiveSmallIntegerField(
         validators=[MinValueValidator(1)])
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         unique_together = [['cart', 'product']]
 
@@ -163,3 +492,203 @@ class Review(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField()
     date = models.DateField(auto_now_add=True)
+
+
+class OutboxEvent(models.Model):
+    # Events written in the same transaction as the change they describe,
+    # and delivered to their handlers afterwards by the process_outbox worker (see store.outbox)
+    topic = models.CharField(max_length=255)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Not picked up before this time, pushed forward while a worker holds the event and after failures
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    processed_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['processed_at', 'available_at'])
+        ]
+
+
+def split_evenly(total, parts):
+    return [total // parts + (1 if index < total % parts else 0) for index in range(parts)]
+
+
+class InventoryShardQuerySet(models.QuerySet):
+    # The stock of a product is spread over INVENTORY_SHARDS rows, so that concurrent checkouts of a hot product
+    # each update one of them instead of all waiting on the lock of the product row. Once a product has shards
+    # they add up to its available stock: Product.inventory plus the movements not rolled up yet
+
+    def ensure(self, product_ids):
+        """
+        Creates the shards of the products that have none yet, splitting their inventory evenly
+        """
+        product_ids = set(product_ids)
+        sharded = set(self.filter(product_id__in=product_ids).values_list('product_id', flat=True).distinct())
+        if not product_ids - sharded:
+            return
+
+        # Concurrent first checkouts of a product may both get here, whichever inserts first wins.
+        # The inventory doesn't change until the product has movements, which takes shards
+        inventory = dict(Product.objects.filter(pk__in=product_ids - sharded).values_list('id', 'inventory'))
+        self.bulk_create([
+            InventoryShard(product_id=product_id, shard=shard, quantity=quantity)
+            for product_id, total in inventory.items()
+            for shard, quantity in enumerate(split_evenly(total, settings.INVENTORY_SHARDS))
+        ], ignore_conflicts=True)
+
+    def add(self, quantities):
+        # Adding never fails, any shard will do
+        self.ensure(quantities.keys())
+        for product_id, quantity in sorted(quantities.items()):
+            if not self.filter(product_id=product_id, shard=random.randrange(settings.INVENTORY_SHARDS)) \
+                    .update(quantity=F('quantity') + quantity):
+                # INVENTORY_SHARDS was raised since the product got its shards
+                self.filter(product_id=product_id, shard=0).update(quantity=F('quantity') + quantity)
+
+    def take(self, quantities):
+        """
+        Takes {product_id: quantity} out of the shards. Returns True if every product had enough stock;
+        when it returns False some shards may have been decremented, so the caller must roll back its transaction.
+        """
+        self.ensure(quantities.keys())
+        # Products in primary key order, which keeps concurrent checkouts of overlapping carts from deadlocking
+        for product_id, quantity in sorted(quantities.items()):
+            shard = random.randrange(settings.INVENTORY_SHARDS)
+            if self.filter(product_id=product_id, shard=shard, quantity__gte=quantity) \
+                    .update(quantity=F('quantity') - quantity):
+                continue
+
+            # Not enough in that shard: lock them all, in order, and take from their total
+            shards = list(self.select_for_update().filter(product_id=product_id).order_by('shard'))
+            total = sum(shard.quantity for shard in shards)
+            if total < quantity:
+                return False
+            self.rebalance(shards, total - quantity)
+        return True
+
+    def rebalance(self, shards, total):
+        for shard, quantity in zip(shards, split_evenly(total, len(shards))):
+            shard.quantity = quantity
+        self.bulk_update(shards, ['quantity'])
+
+
+class InventoryShard(models.Model):
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='inventory_shards')
+    shard = models.PositiveSmallIntegerField()
+    quantity = models.IntegerField()
+
+    objects = InventoryShardQuerySet.as_manager()
+
+    class Meta:
+        unique_together = [['product', 'shard']]
+
+
+class InventoryMovementQuerySet(models.QuerySet):
+    def record(self, kind, quantities, order=None):
+        """
+        Adds {product_id: quantity} to the stock (negative quantities remove it) as movements of the given kind.
+        For sales, which must not oversell, see sell().
+        """
+        with transaction.atomic():
+            InventoryShard.objects.add(quantities)
+            return self.bulk_create([
+                InventoryMovement(product_id=product_id, kind=kind, quantity=quantity, order=order)
+                for product_id, quantity in quantities.items()
+            ])
+
+    def sell(self, quantities, order=None):
+        """
+        Takes {product_id: quantity} out of stock for the order. Returns False, and the caller must roll back
+        its transaction, when a product doesn't have enough stock left.
+        """
+        if not InventoryShard.objects.take(quantities):
+            return False
+        self.bulk_create([
+            InventoryMovement(product_id=product_id, kind=InventoryMovement.KIND_SALE,
+                              quantity=-quantity, order=order)
+            for product_id, quantity in quantities.items()
+        ])
+        return True
+
+    def set_stock(self, levels):
+        """
+        Brings the stock of products to {product_id: quantity}, recording the difference with the stock
+        available right now as adjustments. E.g. after counting what is actually on the shelves.
+        """
+        with transaction.atomic():
+            InventoryShard.objects.ensure(levels.keys())
+            # Sales of these products wait until this commits, so that the difference stays right
+            shards = {}
+            for shard in (InventoryShard.objects
+                          .select_for_update()
+                          .filter(product_id__in=levels.keys())
+                          .order_by('product_id', 'shard')):
+                shards.setdefault(shard.product_id, []).append(shard)
+
+            movements = []
+            for product_id, product_shards in shards.items():
+                quantity = levels[product_id] - sum(shard.quantity for shard in product_shards)
+                if quantity:
+                    movements.append(InventoryMovement(
+                        product_id=product_id, kind=InventoryMovement.KIND_ADJUSTMENT, quantity=quantity))
+                    InventoryShard.objects.rebalance(product_shards, levels[product_id])
+            return self.bulk_create(movements)
+
+    def rollup(self, product_id):
+        """
+        Folds the movements of the product that aren't rolled up yet into Product.inventory, and evens out
+        its shards. Returns the number of movements folded.
+        """
+        with transaction.atomic():
+            # Sales of the product wait until this commits, so that the shards still add up afterwards
+            shards = list(InventoryShard.objects.select_for_update().filter(product_id=product_id).order_by('shard'))
+            movements = dict(self.filter(product_id=product_id, rolled_up=False).values_list('id', 'quantity'))
+            if not movements:
+                return 0
+
+            # Bypass the bookkeeping in ProductQuerySet.update(), the product is bumped below once committed
+            collection_id = Product.objects.values_list('collection_id', flat=True).get(pk=product_id)
+            super(ProductQuerySet, Product.objects.filter(pk=product_id)).update(
+                inventory=F('inventory') + sum(movements.values()), last_update=timezone.now())
+            self.filter(pk__in=movements.keys()).update(rolled_up=True)
+            if shards:
+                InventoryShard.objects.rebalance(shards, sum(shard.quantity for shard in shards))
+
+        cache.bump_product(product_id, collection_id)
+        return len(movements)
+
+
+class InventoryMovement(models.Model):
+    # Append-only ledger of stock changes, periodically folded into Product.inventory by rollup_inventory
+    KIND_RECEIPT = 'R'
+    KIND_SALE = 'S'
+    KIND_ADJUSTMENT = 'A'
+    KIND_RETURN = 'T'
+
+    KIND_CHOICES = [
+        (KIND_RECEIPT, 'Receipt'),
+        (KIND_SALE, 'Sale'),
+        (KIND_ADJUSTMENT, 'Adjustment'),
+        (KIND_RETURN, 'Return'),
+    ]
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='inventory_movements')
+    kind = models.CharField(max_length=1, choices=KIND_CHOICES)
+    # Added to the stock, negative for sales
+    quantity = models.IntegerField()
+    order = models.ForeignKey(
+        Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='inventory_movements')
+    created_at = models.DateTimeField(auto_now_add=True)
+    rolled_up = models.BooleanField(default=False)
+
+    objects = InventoryMovementQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['rolled_up', 'product'])
+        ]
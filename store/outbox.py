@@ -0,0 +1,91 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import Order, OutboxEvent
+from .signals import order_created
+
+
+logger = logging.getLogger(__name__)
+
+# topic -> function(payload), raising to have the event retried
+handlers = {}
+
+
+def register(topic):
+    def decorator(handler):
+        handlers[topic] = handler
+        return handler
+    return decorator
+
+
+def enqueue(topic, payload):
+    # Meant to be called inside the transaction that makes the change, so the event is committed
+    # (or rolled back) together with it. This is the only cost paid on the request path
+    return OutboxEvent.objects.create(topic=topic, payload=payload)
+
+
+def get_backoff(attempts):
+    delay = settings.OUTBOX_RETRY_BACKOFF * (2 ** (attempts - 1))
+    return timedelta(seconds=min(delay, settings.OUTBOX_RETRY_BACKOFF_MAX))
+
+
+def claim_batch(batch_size):
+    """
+    Claims up to batch_size events that are due, by pushing their available_at past the lease duration
+    so that other workers skip them. skip_locked lets several workers claim batches concurrently.
+    Events that aren't marked processed before the lease expires (e.g. the worker died) become due again.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(OutboxEvent.objects
+                      .select_for_update(skip_locked=True)
+                      .filter(processed_at__isnull=True,
+                              available_at__lte=now,
+                              attempts__lt=settings.OUTBOX_MAX_ATTEMPTS)
+                      .order_by('available_at', 'id')[:batch_size])
+        OutboxEvent.objects \
+            .filter(pk__in=[event.id for event in events]) \
+            .update(available_at=now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS))
+    return events
+
+
+def process(event):
+    """
+    Delivers a single event to its handler. Delivery is at-least-once: the event is only marked as processed
+    after the handler returned, so handlers must tolerate seeing the same event twice.
+    """
+    try:
+        handler = handlers[event.topic]
+        handler(event.payload)
+    except Exception:
+        attempts = event.attempts + 1
+        logger.exception('Outbox event %s (%s) failed, attempt %s',
+                         event.id, event.topic, attempts)
+        OutboxEvent.objects.filter(pk=event.id).update(
+            attempts=attempts,
+            available_at=timezone.now() + get_backoff(attempts),
+            last_error=traceback.format_exc()
+        )
+        return False
+    else:
+        OutboxEvent.objects.filter(pk=event.id).update(
+            processed_at=timezone.now())
+        return True
+    finally:
+        # Worker threads each hold their own connection, don't keep them past their max age
+        close_old_connections()
+
+
+@register('order_created')
+def dispatch_order_created(payload):
+    order = Order.objects.get(pk=payload['order_id'])
+    # Receivers of the order_created signal are the registered consumers. Run all of them, and fail the event
+    # if any of them failed (which means the ones that succeeded will see the order again on retry)
+    for receiver, response in order_created.send_robust(sender=OutboxEvent, order=order):
+        if isinstance(response, Exception):
+            raise response
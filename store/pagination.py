@@ -0,0 +1,279 @@
+import hashlib
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import reduce
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor based pagination that seeks to the next page with a WHERE clause on the ordering columns
+    instead of an OFFSET, so page 1000 costs the same as page 1.
+
+    The ordering is taken from the queryset (OrderingFilter / Meta.ordering) and always ends with the primary key
+    as a tiebreaker, which makes the position of every row unique even when e.g. several products share a price.
+    Ordering fields are expected to be non-nullable.
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    # The total is optional, and when included it is cached per filtered query so that paging through
+    # a large result set only pays for the COUNT(*) once every `count_cache_timeout` seconds
+    include_count = True
+    count_cache_timeout = 60
+
+    def get_ordering(self, queryset):
+        ordering = [field for field in (queryset.query.order_by or queryset.model._meta.ordering)
+                    if isinstance(field, str) and field != '?']
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering.append('id')
+        return ordering
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            # An empty cursor asks for the first page
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode()))
+            return list(cursor['v']), bool(cursor.get('r'))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, values, reverse):
+        cursor = {'v': [None if value is None else str(value) for value in values]}
+        if reverse:
+            cursor['r'] = 1
+        encoded = urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_ordering_field(self, queryset, name):
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        return queryset.model._meta.get_field('id' if name == 'pk' else name)
+
+    def parse_position(self, queryset, values):
+        # Cursor values travel as strings, convert them back so the seek compares like with like
+        # (e.g. SQLite would consider any string greater than a number)
+        try:
+            return [None if value is None else self.get_ordering_field(queryset, field.lstrip('-')).to_python(value)
+                    for field, value in zip(self.ordering, values)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_position(self, obj):
+        if isinstance(obj, dict):
+            # values() rows, keyed by the ordering fields themselves
+            return [obj['id' if field.lstrip('-') == 'pk' else field.lstrip('-')] for field in self.ordering]
+        values = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            if name == 'pk':
+                name = 'id'
+            try:
+                name = obj._meta.get_field(name).attname
+            except Exception:
+                # Not a model field, most likely an annotation (e.g. a search rank)
+                pass
+            values.append(getattr(obj, name))
+        return values
+
+    def get_seek_filter(self, values, reverse):
+        # Lexicographic "comes after" on (f1, f2, ..., id):
+        # f1 > v1 OR (f1 = v1 AND f2 > v2) OR ... honouring the direction of every field
+        conditions = []
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            descending = field.startswith('-')
+            operator = 'lt' if descending != reverse else 'gt'
+            condition = Q(**{f'{name}__{operator}': values[index]})
+            for previous, value in zip(self.ordering[:index], values):
+                condition &= Q(**{previous.lstrip('-'): value})
+            conditions.append(condition)
+        return reduce(lambda left, right: left | right, conditions)
+
+    def get_page_queryset(self, queryset, request):
+        """
+        Builds the (unevaluated) queryset for the requested page. Kept separate from paginate_queryset
+        so that callers that evaluate querysets differently (e.g. the async views) can share the seek logic.
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(queryset)
+        self.position, self.reverse = self.decode_cursor(request)
+        self.has_cursor = self.position is not None
+
+        ordering = self.ordering
+        if self.reverse:
+            ordering = [field[1:] if field.startswith('-') else '-' + field
+                        for field in ordering]
+        queryset = queryset.order_by(*ordering)
+
+        if self.position is not None:
+            if len(self.position) != len(self.ordering):
+                raise NotFound(self.invalid_cursor_message)
+            self.position = self.parse_position(queryset, self.position)
+            queryset = queryset.filter(
+                self.get_seek_filter(self.position, self.reverse))
+
+        # Fetch one extra row to find out whether there is anything beyond this page
+        return queryset[:self.page_size + 1]
+
+    def paginate_page(self, rows):
+        rows = list(rows)
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+
+        # Walking backwards, the extra row tells us whether there is a previous page,
+        # and the page we came from guarantees there is a next one (and vice versa)
+        if self.reverse:
+            self.has_previous, self.has_next = has_more, self.has_cursor
+        else:
+            self.has_previous, self.has_next = self.has_cursor, has_more
+
+        self.page = rows
+        return rows
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = self.get_page_queryset(queryset, request)
+        if self.include_count:
+            self.count = self.get_count(queryset)
+        return self.paginate_page(page)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page = self.get_page_queryset(queryset, request)
+        if self.include_count:
+            self.count = await self.aget_count(queryset)
+        return self.paginate_page([row async for row in page])
+
+    def get_count_cache_key(self, queryset):
+        sql, params = queryset.order_by().query.sql_with_params()
+        return 'keyset-count:' + hashlib.md5(f'{sql}|{params}'.encode()).hexdigest()
+
+    def get_count(self, queryset):
+        key = self.get_count_cache_key(queryset)
+        count = cache.get(key)
+        if count is None:
+            count = queryset.order_by().count()
+            cache.set(key, count, self.count_cache_timeout)
+        return count
+
+    async def aget_count(self, queryset):
+        key = self.get_count_cache_key(queryset)
+        count = await cache.aget(key)
+        if count is None:
+            count = await queryset.order_by().acount()
+            await cache.aset(key, count, self.count_cache_timeout)
+        return count
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return replace_query_param(self.base_url, self.cursor_query_param, '')
+        return self.encode_cursor(self.get_position(self.page[0]), reverse=True)
+
+    def get_paginated_response(self, data):
+        response = {}
+        if self.include_count:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        properties = {
+            'next': {
+                'type': 'string',
+                'nullable': True,
+                'format': 'uri',
+            },
+            'previous': {
+                'type': 'string',
+                'nullable': True,
+                'format': 'uri',
+            },
+            'results': schema,
+        }
+        if self.include_count:
+            properties['count'] = {'type': 'integer'}
+        return {'type': 'object', 'properties': properties}
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            }
+        ]
+
+
+class CursorOrPageNumberPagination(BasePagination):
+    """
+    Page numbers (?page=), like the rest of the API, unless the client opts in to keyset pagination by sending
+    a cursor (?cursor= with no value for the first page, then the next / previous links). Deep pages of large
+    listings are only cheap with cursors.
+    """
+    keyset_class = KeysetPagination
+    page_number_class = PageNumberPagination
+
+    def __init__(self):
+        self.paginator = self.page_number_class()
+
+    def select_paginator(self, request, queryset):
+        if self.keyset_class.cursor_query_param in request.query_params:
+            self.paginator = self.keyset_class()
+        elif not queryset.ordered:
+            # Pages have to be cut from the same order every time, like cursors do with the primary key
+            queryset = queryset.order_by('pk')
+        return self.paginator, queryset
+
+    def paginate_queryset(self, queryset, request, view=None):
+        paginator, queryset = self.select_paginator(request, queryset)
+        return paginator.paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        paginator, queryset = self.select_paginator(request, queryset)
+        if hasattr(paginator, 'apaginate_queryset'):
+            return await paginator.apaginate_queryset(queryset, request, view)
+        return await sync_to_async(paginator.paginate_queryset)(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.paginator.get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return [*self.page_number_class().get_schema_operation_parameters(view),
+                *self.keyset_class().get_schema_operation_parameters(view)]
+
+    def get_results(self, data):
+        return self.paginator.get_results(data)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    @property
+    def display_page_controls(self):
+        return getattr(self.paginator, 'display_page_controls', False)
@@ -0,0 +1,37 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+
+
+# Price math shared by the stored Product.effective_price and the serializers. Everything stays in Decimal
+# and is rounded once, half up to the cent, after the discount and the tax have been applied.
+
+CENT = Decimal('0.01')
+
+
+def to_decimal(value):
+    # str() first, so that a float such as 1.18 doesn't turn into 1.17999999999999993782...
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def get_tax_rate():
+    return to_decimal(settings.TAX_RATE)
+
+
+def round_price(amount):
+    return amount.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def apply_tax(unit_price):
+    return round_price(to_decimal(unit_price) * (1 + get_tax_rate()))
+
+
+def get_effective_price(unit_price, discount=None):
+    """
+    Price a customer pays for one unit: the unit price minus the discount (a percentage, the best one
+    among the active promotions of the product), plus tax
+    """
+    price = to_decimal(unit_price)
+    if discount:
+        price = price * (100 - to_decimal(discount)) / 100
+    return round_price(price * (1 + get_tax_rate()))
@@ -0,0 +1,173 @@
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+
+# Read replicas. Views opting in with ReplicaReadMixin send the reads of their safe requests to one of
+# DATABASE_REPLICAS, everything else (writes, and the reads of every other view) goes to the primary.
+#
+# Replicas lag behind the primary, so a client that just wrote something reads from the primary for
+# DATABASE_REPLICA_STICKY_SECONDS afterwards: users are made sticky by ReadYourWritesMiddleware on any write,
+# carts by the cart views. Stickiness is kept in the default cache, which has to be shared between the workers.
+
+# Alias the reads of the current request go to, None for the primary
+read_alias = ContextVar('read_alias', default=None)
+
+
+class ReplicaPool:
+    """
+    Picks the replica of every request, in turn ('round-robin') or the one with the fewest requests of this
+    process in flight ('least-loaded'), as set by DATABASE_REPLICA_POLICY
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.position = -1
+        self.in_flight = {}
+
+    def acquire(self):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas:
+            return None
+        with self.lock:
+            if settings.DATABASE_REPLICA_POLICY == 'least-loaded':
+                alias = min(replicas, key=lambda alias: self.in_flight.get(alias, 0))
+            else:
+                self.position = (self.position + 1) % len(replicas)
+                alias = replicas[self.position]
+            self.in_flight[alias] = self.in_flight.get(alias, 0) + 1
+        return alias
+
+    def release(self, alias):
+        with self.lock:
+            self.in_flight[alias] -= 1
+
+
+replicas = ReplicaPool()
+
+
+def stick(*keys):
+    if keys and settings.DATABASE_REPLICAS:
+        cache.set_many({f'db-sticky:{key}': True for key in keys},
+                       settings.DATABASE_REPLICA_STICKY_SECONDS)
+
+
+def is_sticky(*keys):
+    return bool(keys) and bool(cache.get_many([f'db-sticky:{key}' for key in keys]))
+
+
+def get_user_key(user):
+    return f'user:{user.id}'
+
+
+def get_cart_key(cart_id):
+    return f'cart:{cart_id}'
+
+
+def is_test_mirror(alias):
+    # In tests, a replica declared as a TEST MIRROR is pointed at the test database of its mirror. Its own connection
+    # doesn't see what the test wrote in its transaction, the mirror's does
+    settings_dict = connections.settings.get(alias, {})
+    mirror = settings_dict.get('TEST', {}).get('MIRROR')
+    return mirror is not None and settings_dict.get('NAME') == connections.settings[mirror].get('NAME')
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = read_alias.get()
+        if alias is not None and is_test_mirror(alias):
+            return connections.settings[alias]['TEST']['MIRROR']
+        return alias
+
+    def db_for_write(self, model, **hints):
+        # Explicitly, or Django would write objects read from a replica back to it
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaReadMixin:
+    """
+    Reads from a replica for safe requests, unless one of the sticky keys of the request (the user, see
+    get_sticky_keys) was written to recently. Successful writes through the view make the keys sticky.
+    """
+    replica = None
+
+    def get_sticky_keys(self, request):
+        return [get_user_key(request.user)] if request.user.is_authenticated else []
+
+    @contextmanager
+    def replica_scope(self):
+        # Around the whole request, which only picks a replica once authenticated (see initial)
+        token = read_alias.set(None)
+        try:
+            yield
+        finally:
+            read_alias.reset(token)
+            if self.replica is not None:
+                replicas.release(self.replica)
+
+    def dispatch(self, request, *args, **kwargs):
+        with self.replica_scope():
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        # Authentication and permissions run on the primary, right before the switch
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and not is_sticky(*self.get_sticky_keys(request)):
+            self.replica = replicas.acquire()
+            read_alias.set(self.replica)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            stick(*self.get_sticky_keys(request))
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReadYourWritesMiddleware:
+    """
+    Makes the user sticky after any successful write, through the API or the admin
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self.is_write(request, response):
+            self.stick_user(request)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self.is_write(request, response):
+            # The user may still have to be loaded from the session
+            await sync_to_async(self.stick_user)(request)
+        return response
+
+    def is_write(self, request, response):
+        return settings.DATABASE_REPLICAS and request.method not in SAFE_METHODS and response.status_code < 400
+
+    def stick_user(self, request):
+        # request.user is set by DRF as well, for token authenticated requests
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            stick(get_user_key(user))
@@ -0,0 +1,204 @@
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from tags.models import TaggedItem
+from . import pricing
+from .models import OrderItem, Product, ProductImage
+from .serializers import OrderItemSerializer, OrderSerializer, ProductImageSerializer, ProductSerializer, SimpleProductSerializer
+
+
+# Read-only serialization straight from values() rows, for the list endpoints where the ModelSerializer machinery
+# (a get_attribute / to_representation round trip per field, per object) dominates the response time.
+#
+# Every row serializer mirrors one of the serializers in store.serializers and produces the same data: the plan
+# of a row serializer is compiled once from the fields of its serializer, so plain fields added there show up here
+# as well. Fields needing more than a column (nested serializers, SerializerMethodFields and `computed_fields`)
+# come from `get_<name>(row)` methods, which have to be kept in line with the serializer by hand.
+
+# to_representation() of these is the identity for the values the database returns, so it is skipped
+IDENTITY_FIELDS = (serializers.CharField, serializers.IntegerField,
+                   serializers.BooleanField, serializers.ChoiceField)
+
+
+def compile_plan(serializer_class, computed_fields=()):
+    """
+    Returns [(name, column, convert)] for the fields of serializer_class, where column is None for
+    the fields computed by a method, and convert None when the column value is used as is
+    """
+    plan = []
+    for name, field in serializer_class().fields.items():
+        if name in computed_fields or isinstance(field, (serializers.BaseSerializer, serializers.SerializerMethodField)):
+            plan.append((name, None, None))
+        elif isinstance(field, serializers.PrimaryKeyRelatedField):
+            plan.append((name, field.source + '_id', None))
+        elif isinstance(field, IDENTITY_FIELDS):
+            plan.append((name, field.source, None))
+        else:
+            plan.append((name, field.source, field.to_representation))
+    return plan
+
+
+class RowSerializer:
+    serializer_class = None
+    # Fields computed by a method even though the serializer reads them from a column, e.g. files
+    computed_fields = []
+    # Columns read by the methods
+    extra_columns = []
+
+    def __init__(self, context=None, prefix=''):
+        self.context = context or {}
+        # For rows of a related model selected through a join, e.g. 'product__'
+        self.prefix = prefix
+        cls = type(self)
+        if '_plan' not in cls.__dict__:
+            cls._plan = compile_plan(cls.serializer_class, cls.computed_fields)
+        self.plan = [(name, None, getattr(self, f'get_{name}')) if column is None
+                     else (name, prefix + column, convert)
+                     for name, column, convert in cls._plan]
+
+    def get_columns(self):
+        return [column for _, column, _ in self.plan if column is not None] + \
+            [self.prefix + column for column in self.extra_columns]
+
+    def get_rows(self, queryset):
+        """
+        The rows of the queryset, with the columns of the plan and the ones the queryset is ordered by
+        (which the keyset pagination builds its cursors from)
+        """
+        ordering = [field.lstrip('-') for field in (queryset.query.order_by or queryset.model._meta.ordering)
+                    if isinstance(field, str) and field != '?']
+        columns = dict.fromkeys(['id', *self.get_columns(), *ordering])
+        columns.pop('pk', None)
+        return queryset.prefetch_related(None).values(*columns)
+
+    def load_related(self, rows):
+        # Loads what the methods need for all the rows at once, before any of them is serialized
+        pass
+
+    def to_representation(self, row):
+        data = {}
+        for name, column, convert in self.plan:
+            if column is None:
+                data[name] = convert(row)
+            else:
+                value = row[column]
+                data[name] = value if convert is None or value is None else convert(value)
+        return data
+
+    def serialize(self, rows):
+        rows = list(rows)
+        self.load_related(rows)
+        return [self.to_representation(row) for row in rows]
+
+    async def aserialize(self, rows):
+        rows = [row async for row in rows] if hasattr(rows, '__aiter__') else list(rows)
+        await sync_to_async(self.load_related)(rows)
+        return [self.to_representation(row) for row in rows]
+
+
+class ProductImageRowSerializer(RowSerializer):
+    serializer_class = ProductImageSerializer
+    computed_fields = ['image']
+    extra_columns = ['product_id', 'image', 'variants']
+
+    def __init__(self, context=None, prefix=''):
+        super().__init__(context, prefix)
+        self.storage = ProductImage._meta.get_field('image').storage
+        self.request = self.context.get('request')
+
+    def build_url(self, name):
+        url = self.storage.url(name)
+        return self.request.build_absolute_uri(url) if self.request is not None else url
+
+    def get_image(self, row):
+        # As serializers.ImageField does
+        return self.build_url(row['image']) if row['image'] else None
+
+    def get_variants(self, row):
+        return {variant: self.build_url(name) for variant, name in row['variants'].items()}
+
+
+class ProductRowSerializer(RowSerializer):
+    serializer_class = ProductSerializer
+
+    def __init__(self, context=None, prefix=''):
+        super().__init__(context, prefix)
+        self.image_serializer = ProductImageRowSerializer(context)
+        self.images = self.tags = {}
+
+    def load_related(self, rows):
+        ids = [row['id'] for row in rows]
+        self.images = defaultdict(list)
+        for image in ProductImage.objects.filter(product_id__in=ids).order_by('id') \
+                .values(*self.image_serializer.get_columns()):
+            self.images[image['product_id']].append(self.image_serializer.to_representation(image))
+        self.tags = TaggedItem.objects.get_tags_for_many(Product, ids)
+
+    def get_price_with_tax(self, row):
+        return pricing.apply_tax(row['unit_price'])
+
+    def get_images(self, row):
+        return self.images.get(row['id'], [])
+
+    def get_tags(self, row):
+        return sorted(self.tags.get(row['id'], ()))
+
+
+class SimpleProductRowSerializer(RowSerializer):
+    serializer_class = SimpleProductSerializer
+
+
+class OrderItemRowSerializer(RowSerializer):
+    serializer_class = OrderItemSerializer
+    extra_columns = ['order_id']
+
+    def __init__(self, context=None, prefix=''):
+        super().__init__(context, prefix)
+        self.product_serializer = SimpleProductRowSerializer(context, prefix='product__')
+
+    def get_columns(self):
+        return super().get_columns() + self.product_serializer.get_columns()
+
+    def get_product(self, row):
+        return self.product_serializer.to_representation(row)
+
+
+class OrderRowSerializer(RowSerializer):
+    serializer_class = OrderSerializer
+
+    def __init__(self, context=None, prefix=''):
+        super().__init__(context, prefix)
+        self.item_serializer = OrderItemRowSerializer(context)
+        self.items = {}
+
+    def load_related(self, rows):
+        # Items and their product in a single query, like the Prefetch of OrderViewSet
+        self.items = defaultdict(list)
+        for item in OrderItem.objects.filter(order_id__in=[row['id'] for row in rows]).order_by('id') \
+                .values(*self.item_serializer.get_columns()):
+            self.items[item['order_id']].append(self.item_serializer.to_representation(item))
+
+    def get_items(self, row):
+        return self.items.get(row['id'], [])
+
+
+class RowListMixin:
+    """
+    Serves list() with `row_serializer_class` when FAST_READ_SERIALIZATION is on, instead of the serializer
+    """
+    row_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_READ_SERIALIZATION or self.row_serializer_class is None:
+            return super().list(request, *args, **kwargs)
+
+        serializer = self.row_serializer_class(self.get_serializer_context())
+        rows = serializer.get_rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.serialize(page))
+        return Response(serializer.serialize(rows))
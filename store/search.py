@@ -0,0 +1,118 @@
+import re
+
+from django.db import connection
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+
+# Full-text search over product title and description.
+# SQLite keeps an FTS5 inverted index in a separate virtual table that is updated from the Product signals,
+# MySQL uses a native FULLTEXT index on store_product which the database maintains by itself.
+# Both are created by migration 0015_product_search_index. Any other backend falls back to SearchFilter.
+
+FTS_TABLE = 'store_product_fts'
+
+SUPPORTED_VENDORS = ['sqlite', 'mysql']
+
+
+def is_supported():
+    return connection.vendor in SUPPORTED_VENDORS
+
+
+def get_terms(query):
+    # Only keep word characters, so that user input can never inject FTS / boolean mode operators
+    return re.findall(r'\w+', query.lower())
+
+
+def search_products(queryset, query):
+    """
+    Narrows down a Product queryset to the products matching every term of the query
+    (the last term as a prefix, for search-as-you-type), annotated with a `search_rank` where lower is better.
+    """
+    terms = get_terms(query)
+    if not terms:
+        return queryset
+
+    if connection.vendor == 'sqlite':
+        match = ' '.join('"' + term + '"' for term in terms[:-1])
+        match = f'{match} "{terms[-1]}"*'.strip()
+        # Join the index once and take the rank from that join, rather than running one MATCH per result row
+        return queryset \
+            .extra(tables=[FTS_TABLE], where=[f'{FTS_TABLE}.rowid = store_product.id', f'{FTS_TABLE} MATCH %s'],
+                   params=[match]) \
+            .annotate(search_rank=RawSQL(f'bm25({FTS_TABLE}, 10.0, 1.0)', [], output_field=FloatField()))
+
+    match = ' '.join('+' + term for term in terms[:-1])
+    match = f'{match} +{terms[-1]}*'.strip()
+    # MATCH returns a relevance where higher is better, negate it so that ranks sort the same way on every backend
+    return queryset \
+        .annotate(search_rank=RawSQL(
+            '-MATCH (store_product.title, store_product.description) AGAINST (%s IN BOOLEAN MODE)', [match],
+            output_field=FloatField())) \
+        .filter(search_rank__lt=0)
+
+
+def index_product(product):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, title, description) VALUES (%s, %s, %s)',
+            [product.id, product.title, product.description or '']
+        )
+
+
+def unindex_product(product_id):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product_id])
+
+
+def index_products(product_ids=None):
+    """
+    Refreshes the index for the given products (or all of them), for write paths that bypass the model signals
+    such as bulk_create / bulk_update.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        if product_ids is None:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, description) '
+                f"SELECT id, title, COALESCE(description, '') FROM store_product"
+            )
+            return
+
+        product_ids = list(product_ids)
+        # Stay well below SQLite's limit on the number of query parameters
+        for start in range(0, len(product_ids), 500):
+            batch = product_ids[start:start + 500]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', batch)
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, description) '
+                f"SELECT id, title, COALESCE(description, '') FROM store_product WHERE id IN ({placeholders})",
+                batch
+            )
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    Drop-in replacement for SearchFilter on products that uses the full-text index, ordering results by relevance
+    unless the client asked for an explicit ordering. Composes with ProductFilter like any other filter backend.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if not is_supported():
+            return super().filter_queryset(request, queryset, view)
+
+        query = request.query_params.get(self.search_param, '')
+        if not get_terms(query):
+            return queryset
+
+        return search_products(queryset, query).order_by('search_rank')
@@ -1,9 +1,9 @@
-from decimal import Decimal
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction
 from rest_framework import serializers
 
-from .models import CartItem, Customer, Order, OrderItem, Product, Collection, ProductImage, Review, Cart
-from .signals import order_created
+from . import outbox, pricing
+from .models import CartItem, Customer, InventoryMovement, Order, OrderItem, Product, Collection, ProductImage, Review, Cart
 
 
 class CollectionSerializer(serializers.ModelSerializer):
@@ -17,22 +17,37 @@ class CollectionSerializer(serializers.ModelSerializer):
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    variants = serializers.SerializerMethodField(method_name='get_variants')
+
     def create(self, validated_data):
         product_id = self.context['product_id']
         return ProductImage.objects.create(product_id=product_id, **validated_data)
 
+    def get_variants(self, image: ProductImage):
+        # Empty until the variants have been rendered in the background, clients fall back to the original
+        storage = image.image.storage
+        request = self.context.get('request')
+        urls = {}
+        for variant, name in image.variants.items():
+            url = storage.url(name)
+            urls[variant] = request.build_absolute_uri(url) if request is not None else url
+        return urls
+
     class Meta:
         model = ProductImage
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'variants']
 
 
 class ProductSerializer(serializers.ModelSerializer):
     images = ProductImageSerializer(many=True, read_only=True)
+    tags = serializers.SerializerMethodField(method_name='get_tags')
 
     class Meta:
         model = Product
+        # inventory is the figure last rolled up by rollup_inventory, without the sales made since:
+        # the stock action returns the stock available right now
         fields = ['id', 'title', 'description', 'slug', 'inventory',
-                  'unit_price', 'price_with_tax', 'collection', 'images']
+                  'unit_price', 'price_with_tax', 'effective_price', 'collection', 'images', 'tags']
     # id = serializers.IntegerField()
     # title = serializers.CharField(max_length=255)
     # price = serializers.DecimalField(
@@ -45,8 +60,19 @@ class ProductSerializer(serializers.ModelSerializer):
     #     view_name='collection-detail'
     # )
 
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.instance is not None:
+            # Only set on creation, changes are recorded as inventory movements
+            fields['inventory'].read_only = True
+        return fields
+
     def calculate_tax(self, product: Product):
-        return product.unit_price * Decimal(1.18)
+        return pricing.apply_tax(product.unit_price)
+
+    def get_tags(self, product: Product):
+        # Prefetched along with their tags in a single query by ProductViewSet
+        return sorted({tagged_item.tag.label for tagged_item in product.tagged_items.all()})
 
 
 class ReviewSerializer(serializers.ModelSerializer):
@@ -78,6 +104,17 @@ class CartItemSerializer(serializers.ModelSerializer):
         return cart_item.quantity * cart_item.product.unit_price
 
 
+def validate_cart(cart_id):
+    # Items of a missing cart would only be rejected by the foreign key, as a database error
+    try:
+        found = Cart.objects.filter(pk=cart_id).exists()
+    except DjangoValidationError:
+        found = False
+    if not found:
+        raise serializers.ValidationError(
+            {'cart_id': ['Cart with given ID was not found']})
+
+
 class AddCartItemSerializer(serializers.ModelSerializer):
     product_id = serializers.IntegerField()
 
@@ -87,22 +124,34 @@ class AddCartItemSerializer(serializers.ModelSerializer):
                 'Product with given ID was not found')
         return val
 
+    def validate(self, attrs):
+        validate_cart(self.context['cart_id'])
+        return attrs
+
     def save(self, **kwargs):
         cart_id = self.context['cart_id']
         product_id = self.validated_data['product_id']
         quantity = self.validated_data['quantity']
 
-        try:
-            # Attempt to fetch existing quantity for this product in the cart
-            cart_item = CartItem.objects.get(
-                cart_id=cart_id, product_id=product_id)
-            cart_item.quantity += quantity
-            cart_item.save()
-            self.instance = cart_item
-        except CartItem.DoesNotExist:
-            # Create new item
-            self.instance = CartItem.objects.create(
-                cart_id=cart_id, **self.validated_data)
+        # Creates the item, or adds to the quantity of an existing one, in a single atomic statement
+        items = CartItem.objects.add_items(cart_id, {product_id: quantity})
+        if items is None:
+            items = [CartItem.objects.get(
+                cart_id=cart_id, product_id=product_id)]
+        self.instance = items[0]
+
+        return self.instance
+
+    async def asave(self, **kwargs):
+        # As save(), for the async views
+        cart_id = self.context['cart_id']
+        product_id = self.validated_data['product_id']
+        quantity = self.validated_data['quantity']
+
+        items = await CartItem.objects.aadd_items(cart_id, {product_id: quantity})
+        if items is None:
+            items = [await CartItem.objects.aget(cart_id=cart_id, product_id=product_id)]
+        self.instance = items[0]
 
         return self.instance
 
@@ -111,7 +160,55 @@ class AddCartItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'product_id', 'quantity']
 
 
+class CartItemInputSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, max_value=32767)
+
+
+class BulkAddCartItemSerializer(serializers.Serializer):
+    items = CartItemInputSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, items):
+        # Check all products with one query, rather than one per item
+        product_ids = {item['product_id'] for item in items}
+        found = set(Product.objects
+                    .filter(pk__in=product_ids)
+                    .values_list('id', flat=True))
+        missing = product_ids - found
+        if missing:
+            raise serializers.ValidationError(
+                f'Products with given IDs were not found: {sorted(missing)}')
+        return items
+
+    def validate(self, attrs):
+        validate_cart(self.context['cart_id'])
+        return attrs
+
+    def save(self, **kwargs):
+        cart_id = self.context['cart_id']
+
+        # The same product may be listed more than once
+        quantities = {}
+        for item in self.validated_data['items']:
+            quantities[item['product_id']] = quantities.get(
+                item['product_id'], 0) + item['quantity']
+
+        CartItem.objects.add_items(cart_id, quantities)
+        self.instance = list(CartItem.objects
+                             .select_related('product')
+                             .filter(cart_id=cart_id, product_id__in=quantities.keys()))
+
+        return self.instance
+
+
 class UpdateCartItemSerializer(serializers.ModelSerializer):
+    async def asave(self, **kwargs):
+        # As save(), for the async views
+        for attr, value in self.validated_data.items():
+            setattr(self.instance, attr, value)
+        await self.instance.asave()
+        return self.instance
+
     class Meta:
         model = CartItem
         fields = ['quantity']
@@ -128,7 +225,20 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ['id', 'items', 'total_price']
 
     def get_total_price(self, cart: Cart):
-        return sum([item.quantity * item.product.unit_price for item in cart.items.all()])
+        # Annotated by CartQuerySet.with_totals(), a freshly created cart is empty
+        return pricing.round_price(pricing.to_decimal(getattr(cart, 'total_price', 0)))
+
+
+class CartSummarySerializer(serializers.ModelSerializer):
+    id = serializers.UUIDField(read_only=True)
+    items_count = serializers.IntegerField(read_only=True)
+    total_quantity = serializers.IntegerField(read_only=True)
+    total_price = serializers.DecimalField(
+        max_digits=12, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Cart
+        fields = ['id', 'items_count', 'total_quantity', 'total_price']
 
 
 class CustomerSerializer(serializers.ModelSerializer):
@@ -161,47 +271,76 @@ class UpdateOrderSerializer(serializers.ModelSerializer):
         fields = ['payment_status']
 
 
+class InsufficientInventory(Exception):
+    # Raised by CreateOrderSerializer.save() with the items that can't be fulfilled. Not a ValidationError,
+    # which would turn the quantities into strings
+    def __init__(self, items=None):
+        super().__init__(items)
+        self.items = items
+
+
 class CreateOrderSerializer(serializers.Serializer):
     cart_id = serializers.UUIDField()
 
-    def validate_cart_id(self, cart_id):
-        if not Cart.objects.filter(pk=cart_id).exists():
-            raise serializers.ValidationError(
-                'Cart with given ID was not found')
-        if CartItem.objects.filter(cart_id=cart_id).count() == 0:
-            raise serializers.ValidationError('Cart is empty')
-        return cart_id
-
     def save(self, **kwargs):
-        with transaction.atomic():
-            cart_id = self.validated_data['cart_id']
-
-            # Custom logic required, where we create both an order and add the relevant order items
-            customer = Customer.objects.get(
-                user_id=self.context['user_id'])
-            order = Order.objects.create(customer=customer)
-
-            # Extract items currently in cart
-            cart_items = CartItem.objects \
-                .select_related('product') \
-                .filter(cart_id=cart_id)
-            # Generate equivalent order item list
-            order_items = [
-                OrderItem(
-                    order=order,
-                    product=item.product,
-                    unit_price=item.product.unit_price,
-                    quantity=item.quantity
-                )
-                for item in cart_items
-            ]
-            # Store order items against the earlier created order
-            OrderItem.objects.bulk_create(order_items)
-            # Finally, remove these items from cart
-            Cart.objects.filter(pk=cart_id).delete()
-
-            # Send a signal to the app so that an event can be triggered after order creation
-            # Send the 'sender class' and order information as kwargs to the signal handler
-            order_created.send_robust(sender=self.__class__, order=order)
-
-            return order
+        cart_id = self.validated_data['cart_id']
+
+        try:
+            with transaction.atomic():
+                # Lock the cart first, so that items added or changed concurrently either wait for the cart to be
+                # gone or are ordered as well. A single query then loads everything checkout needs from the items
+                if not Cart.objects.select_for_update().filter(pk=cart_id).exists():
+                    raise serializers.ValidationError({'cart_id': ['Cart with given ID was not found']})
+                cart_items = list(CartItem.objects
+                                  .filter(cart_id=cart_id)
+                                  .values('product_id', 'quantity', 'product__unit_price'))
+                if not cart_items:
+                    raise serializers.ValidationError({'cart_id': ['Cart is empty']})
+                quantities = {item['product_id']: item['quantity']
+                              for item in cart_items}
+
+                # Custom logic required, where we create both an order and add the relevant order items
+                customer_id = self.context.get('customer_id')
+                if customer_id is None:
+                    customer_id = Customer.objects.values_list('id', flat=True).get(
+                        user_id=self.context['user_id'])
+                order = Order.objects.create(customer_id=customer_id)
+
+                # Store the equivalent order items against the earlier created order
+                OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        product_id=item['product_id'],
+                        unit_price=item['product__unit_price'],
+                        quantity=item['quantity']
+                    )
+                    for item in cart_items
+                ])
+                # Finally, remove these items from cart
+                Cart.objects.filter(pk=cart_id).delete()
+
+                # Take the stock last, so that the locks on the inventory shards are only held
+                # for the remainder of the transaction. The sales are recorded in the inventory ledger
+                if not InventoryMovement.objects.sell(quantities, order):
+                    raise InsufficientInventory()
+
+                # Record an event so that the order_created signal is sent to its receivers after the fact,
+                # by the process_outbox worker, keeping slow consumers out of the checkout request
+                outbox.enqueue('order_created', {'order_id': order.id})
+        except InsufficientInventory:
+            # Everything above was rolled back, report which items can't be fulfilled with the current stock
+            available = Product.objects.filter(pk__in=quantities.keys()).get_available_inventory()
+            raise InsufficientInventory([
+                {
+                    'product_id': product_id,
+                    'quantity': quantity,
+                    'available': available.get(product_id, 0),
+                    'error': 'Not enough items in stock'
+                }
+                for product_id, quantity in quantities.items()
+                if available.get(product_id, 0) < quantity
+            ] or ['Stock changed during checkout, please try again'])
+
+        # Sales leave the products themselves alone, so the cached catalog stays valid
+        # until rollup_inventory folds them into the inventory
+        return order
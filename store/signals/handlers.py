@@ -1,10 +1,126 @@
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
 from django.dispatch import receiver
-from store.models import Customer
+from store import cache, pricing, search
+from store.models import Collection, Customer, Product, ProductImage, Promotion
+from tags.models import TaggedItem
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_customer_for_new_user(sender, **kwargs):
     if kwargs['created']:
         Customer.objects.create(user=kwargs['instance'])
+
+
+@receiver(post_init, sender=Product)
+def remember_loaded_values(sender, instance, **kwargs):
+    # Keep track of the collection the product was loaded with, so that moving it to another collection
+    # can invalidate both, and of its unit price so that saving it only reprices it when the price changed.
+    # Read from __dict__ to avoid triggering a query for deferred fields, which are left unknown
+    if 'collection_id' in instance.__dict__:
+        instance._loaded_collection_id = instance.collection_id
+    if instance.__dict__.get('unit_price') is not None:
+        instance._loaded_unit_price = pricing.to_decimal(instance.unit_price)
+
+
+@receiver(pre_save, sender=Product)
+def load_previous_collection(sender, instance, **kwargs):
+    if '_loaded_collection_id' not in instance.__dict__ and not instance._state.adding:
+        instance._loaded_collection_id = Product.objects.filter(pk=instance.pk) \
+            .values_list('collection_id', flat=True).first()
+
+
+@receiver(post_save, sender=Product)
+def on_product_saved(sender, instance, created, **kwargs):
+    old_collection_id = instance._loaded_collection_id
+    if created:
+        Collection.objects.adjust_products_count({instance.collection_id: 1})
+    elif old_collection_id != instance.collection_id:
+        # Product moved to another collection
+        Collection.objects.adjust_products_count(
+            {old_collection_id: -1, instance.collection_id: 1})
+
+    cache.bump_product(instance.id, instance.collection_id, old_collection_id)
+    instance._loaded_collection_id = instance.collection_id
+
+
+@receiver(post_delete, sender=Product)
+def on_product_deleted(sender, instance, **kwargs):
+    Collection.objects.adjust_products_count({instance.collection_id: -1})
+    cache.bump_product(instance.id, instance.collection_id,
+                       instance.__dict__.get('_loaded_collection_id'))
+
+
+@receiver(post_save, sender=Product)
+def index_product_for_search(sender, instance, **kwargs):
+    search.index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product_for_search(sender, instance, **kwargs):
+    search.unindex_product(instance.id)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_product_image_cache(sender, instance, **kwargs):
+    # Also invalidates the catalog cache entries of the product
+    Product.objects.filter(pk=instance.product_id).touch()
+
+
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+def invalidate_collection_cache(sender, instance, **kwargs):
+    cache.bump_collection(instance.id)
+
+
+@receiver(m2m_changed, sender=Product.promotions.through)
+def on_product_promotions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # pk_set is not provided on clear, so remember which products are about to lose the promotion
+        instance._cleared_product_ids = list(
+            instance.product_set.values_list('id', flat=True))
+        return
+
+    if not action.startswith('post_'):
+        return
+
+    if reverse:
+        # Promotion side of the relationship (promotion.product_set.add(...)), pk_set holds product ids
+        if action == 'post_clear':
+            pk_set = instance.__dict__.pop('_cleared_product_ids', [])
+        products = Product.objects.filter(pk__in=pk_set)
+        for product_id, collection_id in products.values_list('id', 'collection_id'):
+            cache.bump_product(product_id, collection_id)
+    else:
+        products = Product.objects.filter(pk=instance.id)
+        cache.bump_product(instance.id, instance.collection_id)
+    products.update_effective_prices()
+
+
+@receiver(post_save, sender=Promotion)
+def reprice_promotion_products(sender, instance, **kwargs):
+    # The discount or the period may have changed
+    Product.objects.filter(promotions=instance).update_effective_prices()
+
+
+@receiver(pre_delete, sender=Promotion)
+def remember_promotion_products(sender, instance, **kwargs):
+    # The m2m rows are deleted along with the promotion without sending m2m_changed
+    instance._product_ids = list(
+        instance.product_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Promotion)
+def reprice_former_promotion_products(sender, instance, **kwargs):
+    Product.objects.filter(pk__in=instance.__dict__.pop(
+        '_product_ids', [])).update_effective_prices()
+
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+def invalidate_tagged_product_cache(sender, instance, **kwargs):
+    # Tags are part of the product representation
+    if ContentType.objects.get_for_id(instance.content_type_id).model_class() is Product:
+        Product.objects.filter(pk=instance.object_id).touch()
@@ -0,0 +1,44 @@
+import hashlib
+import os
+from uuid import uuid4
+
+from django.core.files.storage import FileSystemStorage
+
+
+def content_hash(file):
+    sha256 = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(64 * 1024), b''):
+        sha256.update(chunk)
+    file.seek(0)
+    return sha256.hexdigest()
+
+
+def content_addressed_path(directory, digest, extension):
+    # Spread files over sub directories so that no single directory grows too large
+    return f'{directory}/{digest[:2]}/{digest}{extension.lower()}'
+
+
+def product_image_path(instance, filename):
+    _, extension = os.path.splitext(filename)
+    return content_addressed_path('store/images', content_hash(instance.image.file), extension)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File names are derived from the file contents (see product_image_path), so a name that already exists
+    holds exactly the same bytes: it is reused instead of writing a second copy under a new name.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        if self.exists(name):
+            return name
+        # A concurrent upload of the same file may create the name in the meantime. FileSystemStorage would then
+        # ask get_available_name for another name, get the same one back and retry forever: write under a unique
+        # temporary name instead and move it into place, replacing identical bytes at worst
+        temporary = super()._save(os.path.join(os.path.dirname(name), f'.{uuid4().hex}.tmp'), content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
@@ -1,3 +1,1329 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import re
+import tempfile
+import time
+import types
+from datetime import timedelta
+from decimal import Decimal
+from contextlib import redirect_stdout
+from io import BytesIO, StringIO
+from unittest import mock
+from uuid import uuid4
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.utils import timezone
+from django.utils.http import http_date, urlencode
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from core.authentication import user_cache
+from core.models import User
+from core.serializers import TokenObtainPairSerializer
+from likes.models import LikeCounter
+from tags.models import Tag, TaggedItem
+from . import outbox, urls
+from .models import (Cart, CartItem, Collection, Customer, InventoryMovement, Order, OrderItem, OutboxEvent,
+                     Product, ProductImage, Promotion)
+from .cache import CATALOG_VERSION_KEY, bump_product, get_cache, get_fill_timeout
+from .exports import ProductExport
+from .imports import ProductImporter
+from .renderers import FastJSONRenderer
+from .routers import ReplicaPool, ReplicaRouter, get_cart_key, is_sticky, read_alias, replicas, stick
+from .serializers import CreateOrderSerializer, InsufficientInventory
+from .signals import order_created
+
+
+class OrderQueryBudgetTests(APITestCase):
+    # The number of queries must not depend on the number of orders / items on the page
+    ORDERS = 10
+    ITEMS_PER_ORDER = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Collection')
+        products = Product.objects.bulk_create([
+            Product(title=f'Product {index}', slug=f'product-{index}', unit_price=10,
+                    inventory=100, collection=collection)
+            for index in range(cls.ITEMS_PER_ORDER)
+        ])
+
+        cls.staff = User.objects.create(
+            username='staff', email='staff@domain.com', is_staff=True)
+        cls.user = User.objects.create(
+            username='customer', email='customer@domain.com')
+        customer = Customer.objects.get(user=cls.user)
+
+        orders = Order.objects.bulk_create(
+            [Order(customer=customer) for _ in range(cls.ORDERS)])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product,
+                      quantity=1, unit_price=product.unit_price)
+            for order in orders
+            for product in products
+        ])
+        cls.order = orders[0]
+
+    def setUp(self):
+        # The paginator caches counts, start every test from a cold cache
+        cache.clear()
+        user_cache.clear()
+
+    def test_staff_order_list(self):
+        self.client.force_authenticate(self.staff)
+        # count, orders, items with their products
+        with self.assertNumQueries(3):
+            response = self.client.get('/store/orders/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), self.ORDERS)
+        self.assertEqual(
+            len(response.data['results'][0]['items']), self.ITEMS_PER_ORDER)
+
+    def test_customer_order_list(self):
+        self.client.force_authenticate(self.user)
+        # count, orders, items with their products, the orders are joined to the customer
+        with self.assertNumQueries(3):
+            response = self.client.get('/store/orders/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), self.ORDERS)
+
+    def test_customer_order_list_with_token(self):
+        token = TokenObtainPairSerializer.get_token(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {token}')
+        # user, count, orders, items with their products, the customer comes from the token
+        with self.assertNumQueries(4):
+            response = self.client.get('/store/orders/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), self.ORDERS)
+
+    def test_customer_order_detail(self):
+        self.client.force_authenticate(self.user)
+        # order, items with their products
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/store/orders/{self.order.id}/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['items']), self.ITEMS_PER_ORDER)
+
+    def test_order_list_rows_match_serializer(self):
+        self.client.force_authenticate(self.staff)
+        with override_settings(FAST_READ_SERIALIZATION=False):
+            expected = self.client.get('/store/orders/').content
+        self.assertEqual(self.client.get('/store/orders/').content, expected)
+
+
+class ProductRowsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Collection')
+        products = [
+            Product.objects.create(title='Plain', slug='plain', unit_price=10, inventory=1, collection=collection),
+            Product.objects.create(title='Décor \u2028', slug='decor', description='Lamp', unit_price='12.35',
+                                   inventory=3, collection=collection),
+        ]
+        products[1].promotions.add(Promotion.objects.create(description='Sale', discount=12.5))
+        ProductImage.objects.bulk_create([ProductImage(
+            product=products[1], image='dog.jpg', variants={'thumbnail': 'dog.jpg'})])
+        content_type = ContentType.objects.get_for_model(Product)
+        TaggedItem.objects.bulk_create([
+            TaggedItem(tag=Tag.objects.create(label=label), content_type=content_type, object_id=products[1].id)
+            for label in ['lighting', 'home']
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(User.objects.create(username='customer', email='customer@domain.com'))
+
+    def test_product_list_rows_match_serializer(self):
+        for url in ['/store/products/', '/store/products/?cursor=', '/store/products/?ordering=-effective_price']:
+            with override_settings(FAST_READ_SERIALIZATION=False):
+                expected = self.client.get(url).content
+            cache.clear()
+            response = self.client.get(url)
+            self.assertEqual(response.content, expected, url)
+
+    def test_renderers_match(self):
+        data = self.client.get('/store/products/').data
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class TagTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Collection')
+        cls.lamp, cls.chair, cls.desk = Product.objects.bulk_create([
+            Product(title=title, slug=title.lower(), unit_price=10, inventory=1, collection=collection)
+            for title in ['Lamp', 'Chair', 'Desk']
+        ])
+        cls.tags = {label: Tag.objects.create(label=label) for label in ['home', 'lighting', 'office']}
+        cls.content_type = ContentType.objects.get_for_model(Product)
+        # A tag on another model with the same object id must not leak onto the product
+        TaggedItem.objects.create(
+            tag=cls.tags['office'], content_type=ContentType.objects.get_for_model(Collection), object_id=cls.lamp.id)
+        TaggedItem.objects.bulk_create([
+            TaggedItem(tag=cls.tags[label], content_type=cls.content_type, object_id=product.id)
+            for product, labels in [(cls.lamp, ['lighting', 'home']), (cls.chair, ['home', 'office'])]
+            for label in labels
+        ])
+
+    def setUp(self):
+        cache.clear()
+        get_cache().clear()
+
+    def get_tags(self, **params):
+        response = self.client.get('/store/products/', params)
+        self.assertEqual(response.status_code, 200)
+        return {product['title']: product['tags'] for product in response.data['results']}
+
+    def test_tags_on_products(self):
+        self.assertEqual(self.get_tags(), {'Chair': ['home', 'office'], 'Desk': [], 'Lamp': ['home', 'lighting']})
+
+    def test_tags_for_many(self):
+        with self.assertNumQueries(1):
+            tags = TaggedItem.objects.get_tags_for_many(Product, [self.lamp.id, self.chair.id, self.desk.id])
+        self.assertEqual(tags, {self.lamp.id: ['home', 'lighting'], self.chair.id: ['home', 'office'],
+                                self.desk.id: []})
+
+    def test_filter_by_tags(self):
+        self.assertEqual(list(self.get_tags(tag='home,lighting')), ['Chair', 'Lamp'])
+        self.assertEqual(list(self.get_tags(tag='office')), ['Chair'])
+        self.assertEqual(len(self.get_tags(tag=',')), 3)
+
+    def test_tagging_invalidates_the_product(self):
+        url = f'/store/products/{self.desk.id}/'
+        self.assertEqual(self.client.get(url).data['tags'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            tagged_item = TaggedItem.objects.create(
+                tag=self.tags['office'], content_type=self.content_type, object_id=self.desk.id)
+        self.assertEqual(self.client.get(url).data['tags'], ['office'])
+        with self.captureOnCommitCallbacks(execute=True):
+            tagged_item.delete()
+        self.assertEqual(self.client.get(url).data['tags'], [])
+
+
+class LikeTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Collection')
+        cls.products = Product.objects.bulk_create([
+            Product(title=f'Product {index}', slug=f'product-{index}', unit_price=10, inventory=1,
+                    collection=collection)
+            for index in range(3)
+        ])
+        cls.users = [User.objects.create(username=f'user{index}', email=f'user{index}@domain.com')
+                     for index in range(2)]
+
+    def like(self, product, user, method='post'):
+        self.client.force_authenticate(user)
+        return getattr(self.client, method)(f'/store/products/{product.id}/like/')
+
+    def get_likes(self, ids):
+        response = self.client.get('/store/products/likes/', {'ids': ','.join(str(id) for id in ids)})
+        return response.status_code, response.data
+
+    def test_like_and_unlike(self):
+        product = self.products[0]
+        response = self.like(product, self.users[0])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {'product_id': product.id, 'likes_count': 1, 'liked': True})
+        # Liking again changes nothing
+        self.assertEqual(self.like(product, self.users[0]).status_code, 200)
+        self.assertEqual(self.like(product, self.users[1]).data['likes_count'], 2)
+
+        for _ in range(2):
+            response = self.like(product, self.users[0], 'delete')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, {'product_id': product.id, 'likes_count': 1, 'liked': False})
+
+        self.assertEqual(self.like(Product(id=0), self.users[0]).status_code, 404)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.post(f'/store/products/{product.id}/like/').status_code, 401)
+
+    def test_likes_of_many_products(self):
+        self.like(self.products[0], self.users[0])
+        self.like(self.products[0], self.users[1])
+        self.like(self.products[1], self.users[1])
+        ids = [product.id for product in self.products]
+
+        self.client.force_authenticate(self.users[0])
+        with self.assertNumQueries(2):
+            status_code, likes = self.get_likes(ids + [ids[0]])
+        self.assertEqual(status_code, 200)
+        self.assertEqual([(like['likes_count'], like['liked']) for like in likes],
+                         [(2, True), (1, False), (0, False)])
+
+        self.client.force_authenticate(None)
+        self.assertEqual([like['liked'] for like in self.get_likes(ids)[1]], [False] * 3)
+
+        self.assertEqual(self.get_likes(['one'])[0], 400)
+        self.assertEqual(self.get_likes(range(1, 102))[0], 400)
+
+    def test_rebuild_counters(self):
+        self.like(self.products[0], self.users[0])
+        self.like(self.products[1], self.users[0])
+        LikeCounter.objects.update(count=10)
+        LikeCounter.objects.rebuild()
+        self.assertEqual(sorted(LikeCounter.objects.values_list('object_id', 'count')),
+                         [(self.products[0].id, 1), (self.products[1].id, 1)])
+
+
+class PaginationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Collection')
+        # Prices shared by several products, which the cursor has to tell apart
+        Product.objects.bulk_create([
+            Product(title=f'Product {index:02}', slug=f'product-{index}', unit_price=10 + index % 3,
+                    inventory=100, collection=collection)
+            for index in range(25)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(User.objects.create(username='customer', email='customer@domain.com'))
+
+    def test_page_numbers(self):
+        response = self.client.get('/store/products/?page=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual([product['title'] for product in response.data['results']],
+                         [f'Product {index:02}' for index in range(10, 20)])
+        self.assertTrue(response.data['previous'])
+        self.assertIn('page=3', response.data['next'])
+        self.assertEqual(self.client.get('/store/products/?page=4').status_code, 404)
+
+    def test_cursors(self):
+        url = '/store/products/?ordering=-unit_price&cursor='
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([product['id'] for product in response.data['results']])
+            url = response.data['next']
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        expected = list(Product.objects.order_by('-unit_price', 'id').values_list('id', flat=True))
+        self.assertEqual(sum(pages, []), expected)
+
+        # And back
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([product['id'] for product in response.data['results']], pages[1])
+        self.assertEqual(self.client.get('/store/products/?cursor=invalid').status_code, 404)
+
+
+class SearchTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shoes = Collection.objects.create(title='Shoes')
+        cls.hats = Collection.objects.create(title='Hats')
+        cls.boot = Product.objects.create(
+            title='Leather boot', slug='boot', description='Brown walking shoe', unit_price=50, inventory=1,
+            collection=cls.shoes)
+        cls.sneaker = Product.objects.create(
+            title='Red sneaker', slug='sneaker', description='Canvas shoe', unit_price=30, inventory=1,
+            collection=cls.shoes)
+        cls.hat = Product.objects.create(
+            title='Red hat', slug='hat', description='Wool', unit_price=20, inventory=1, collection=cls.hats)
+        Product.objects.bulk_create([
+            Product(title=f'Shoe {index}', slug=f'shoe-{index}', unit_price=10, inventory=1, collection=cls.shoes)
+            for index in range(12)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(User.objects.create(username='customer', email='customer@domain.com'))
+
+    def search(self, query, **params):
+        response = self.client.get('/store/products/', {'search': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [product['id'] for product in response.data['results']]
+
+    def test_every_term_matches_and_the_last_one_as_a_prefix(self):
+        self.assertEqual(self.search('red sne'), [self.sneaker.id])
+        self.assertEqual(set(self.search('red')), {self.sneaker.id, self.hat.id})
+        self.assertEqual(self.search('red wool'), [self.hat.id])
+        self.assertEqual(self.search('red boot'), [])
+
+    def test_title_matches_rank_first(self):
+        # Both mention "shoe" in their description only, behind every product named after it
+        ids = []
+        url = f'/store/products/?search=shoe&collection_id={self.shoes.id}&cursor='
+        while url:
+            response = self.client.get(url)
+            ids += [product['id'] for product in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(len(ids), 14)
+        self.assertEqual(set(ids[-2:]), {self.boot.id, self.sneaker.id})
+        self.assertEqual(self.search('shoe', ordering='-unit_price')[:2], [self.boot.id, self.sneaker.id])
+
+    def test_index_is_matched_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.search('shoe')
+        searches = [query['sql'] for query in queries if 'MATCH' in query['sql']]
+        self.assertTrue(searches)
+        for sql in searches:
+            self.assertEqual(sql.count('MATCH'), 1, sql)
+
+
+class ProductsCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.first = Collection.objects.create(title='First')
+        cls.second = Collection.objects.create(title='Second')
+        cls.product = Product.objects.create(
+            title='Product', slug='product', unit_price=10, inventory=1, collection=cls.first)
+
+    def assertCounts(self, first, second):
+        self.assertEqual(list(Collection.objects.order_by('id').values_list('products_count', flat=True)),
+                         [first, second])
+
+    def test_counts_follow_products(self):
+        self.assertCounts(1, 0)
+        product = Product.objects.get(pk=self.product.pk)
+        product.collection = self.second
+        product.save()
+        self.assertCounts(0, 1)
+        product.delete()
+        self.assertCounts(0, 0)
+
+    def test_move_with_deferred_collection(self):
+        product = Product.objects.only('title').get(pk=self.product.pk)
+        product.collection_id = self.second.id
+        product.save()
+        self.assertCounts(0, 1)
+
+        # Not loaded and not changed
+        product = Product.objects.only('title').get(pk=self.product.pk)
+        product.title = 'Renamed'
+        product.save()
+        self.assertCounts(0, 1)
+
+    def test_bulk_writes(self):
+        Product.objects.bulk_create([
+            Product(title='Other', slug='other', unit_price=10, inventory=1, collection=self.second)])
+        self.assertCounts(1, 1)
+        Product.objects.update(collection=self.second)
+        self.assertCounts(0, 2)
+
+    def test_reconcile(self):
+        # As after raw SQL inserts, which bypass the bookkeeping
+        Collection.objects.update(products_count=7)
+        with redirect_stdout(StringIO()) as output:
+            call_command('reconcile_products_count', '--batch-size', '1')
+        self.assertCounts(1, 0)
+        self.assertIn('Checked 2 collection(s), repaired 2', output.getvalue())
+        self.assertEqual(Collection.objects.reconcile_products_count(), (2, []))
+
+    def test_unrelated_updates_skip_the_bookkeeping(self):
+        with CaptureQueriesContext(connection) as queries:
+            Product.objects.update(slug='renamed')
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT')])
+
+
+class GenerateDataTests(TransactionTestCase):
+    def generate(self, **options):
+        # Fewer products than items per cart or order, and several chunks of every kind
+        with redirect_stdout(StringIO()):
+            call_command('generate_data', collections=2, products=3, users=2, carts=3, orders=4, reviews=2, tags=2,
+                         tagged_items=3, likes=3, seed=7, batch_size=2, **options)
+        return {model.__name__: model.objects.count()
+                for model in [Collection, Product, User, Customer, Cart, CartItem, Order, OrderItem, TaggedItem]}
+
+    def test_same_rows_with_any_number_of_processes(self):
+        counts = self.generate(processes=1)
+        self.assertEqual(counts['Product'], 3)
+        self.assertEqual(counts['Order'], 4)
+        call_command('flush', interactive=False)
+        self.assertEqual(self.generate(processes=2), counts)
+
+    def test_missing_products_or_users(self):
+        with self.assertRaisesMessage(CommandError, '--orders needs customers'):
+            call_command('generate_data', users=0, carts=0, orders=1, reviews=0, tagged_items=0, likes=0)
+        with self.assertRaisesMessage(CommandError, '--carts needs products'):
+            call_command('generate_data', products=0, users=0, orders=0)
+        self.assertFalse(Product.objects.exists())
+
+
+class PricingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.collection = Collection.objects.create(title='Collection')
+        cls.product = Product.objects.create(
+            title='Product', slug='product', unit_price=100, inventory=1, collection=cls.collection)
+
+    def get_effective_price(self):
+        return Product.objects.values_list('effective_price', flat=True).get(pk=self.product.pk)
+
+    def test_best_active_promotion_and_tax(self):
+        self.assertEqual(self.get_effective_price(), Decimal('118.00'))
+        expired = Promotion.objects.create(
+            description='Expired', discount=50, ends_at=timezone.now() - timedelta(days=1))
+        self.product.promotions.add(
+            Promotion.objects.create(description='Small', discount=10),
+            Promotion.objects.create(description='Large', discount=25),
+            expired)
+        self.assertEqual(self.get_effective_price(), Decimal('88.50'))
+
+        Promotion.objects.filter(description='Large').delete()
+        self.assertEqual(self.get_effective_price(), Decimal('106.20'))
+
+    def test_saving_only_reprices_when_the_unit_price_changes(self):
+        product = Product.objects.get(pk=self.product.pk)
+        # Repriced behind the loaded instance's back, which must not write its stale price back
+        self.product.promotions.add(Promotion.objects.create(description='Promotion', discount=10))
+
+        product.title = 'Renamed'
+        with CaptureQueriesContext(connection) as queries:
+            product.save()
+        self.assertFalse([query for query in queries if 'store_promotion' in query['sql']])
+        self.assertEqual(self.get_effective_price(), Decimal('106.20'))
+
+        product.unit_price = Decimal('50.00')
+        product.save(update_fields=['unit_price'])
+        self.assertEqual(self.get_effective_price(), Decimal('53.10'))
+
+    def test_update_prices(self):
+        promotion = Promotion.objects.create(
+            description='Scheduled', discount=10, starts_at=timezone.now() + timedelta(hours=1))
+        self.product.promotions.add(promotion)
+        self.assertEqual(self.get_effective_price(), Decimal('118.00'))
+
+        # The promotion starts without any write that would reprice the product
+        Promotion.objects.filter(pk=promotion.pk).update(starts_at=timezone.now() - timedelta(hours=1))
+        with redirect_stdout(StringIO()):
+            call_command('update_prices')
+        self.assertEqual(self.get_effective_price(), Decimal('106.20'))
+
+        with override_settings(TAX_RATE='0.2'), redirect_stdout(StringIO()) as output:
+            call_command('update_prices', '--all')
+        self.assertEqual(self.get_effective_price(), Decimal('108.00'))
+        self.assertIn('Updated the effective price of 1 products', output.getvalue())
+
+
+class ConditionalGetTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Collection')
+        cls.products = [
+            Product.objects.create(title=f'Product {index}', slug=f'product-{index}', unit_price=10,
+                                   inventory=100, collection=collection)
+            for index in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        get_cache().clear()
+
+    def test_list_is_validated_by_etag(self):
+        response = self.client.get('/store/products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+
+        response = self.client.get('/store/products/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        # Without an ETag, there is nothing to revalidate against
+        response = self.client.get('/store/products/', headers={'If-Modified-Since': http_date(time.time())})
+        self.assertEqual(response.status_code, 200)
+
+        # The latest last_update stays the same, the count doesn't
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].delete()
+        response = self.client.get('/store/products/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_validator_is_cached(self):
+        # Authenticated responses aren't cached, the validator of the listing is
+        self.client.force_authenticate(User.objects.create(username='customer', email='customer@domain.com'))
+        etag = self.client.get('/store/products/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/store/products/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].delete()
+        self.assertEqual(self.client.get('/store/products/', headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_object_is_validated_by_etag_and_last_modified(self):
+        url = f'/store/products/{self.products[0].id}/'
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+        self.assertEqual(self.client.get(url, headers={'If-Modified-Since': last_modified}).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.products[0].id).update(last_update=timezone.now() + timedelta(seconds=1))
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+        self.assertEqual(self.client.get(url, headers={'If-Modified-Since': last_modified}).status_code, 200)
+
+
+class CatalogCacheTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.collections = [Collection.objects.create(title=f'Collection {index}') for index in range(2)]
+        cls.products = [
+            Product.objects.create(title=f'Product {index}', slug=f'product-{index}', unit_price=10,
+                                   inventory=100, collection=collection)
+            for index, collection in enumerate(cls.collections)
+        ]
+        cls.promotion = Promotion.objects.create(description='Sale', discount=0.1)
+
+    def setUp(self):
+        cache.clear()
+        get_cache().clear()
+        first, second = self.products
+        self.urls = {
+            'products': '/store/products/',
+            'collection 0 products': f'/store/products/?collection_id={self.collections[0].id}',
+            'collection 1 products': f'/store/products/?collection_id={self.collections[1].id}',
+            'product 0': f'/store/products/{first.id}/',
+            'product 1': f'/store/products/{second.id}/',
+            'collections': '/store/collections/',
+            'collection 0': f'/store/collections/{self.collections[0].id}/',
+            'collection 1': f'/store/collections/{self.collections[1].id}/',
+        }
+        for url in self.urls.values():
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def get_stale(self):
+        stale = set()
+        for name, url in self.urls.items():
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            if queries:
+                stale.add(name)
+        return stale
+
+    def test_repeated_requests_run_no_queries(self):
+        for url in self.urls.values():
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url, headers={'If-None-Match': response['ETag']}).status_code, 304)
+
+    def test_product_saved(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].save()
+        self.assertEqual(self.get_stale(), {'products', 'collection 0 products', 'product 0',
+                                            'collections', 'collection 0'})
+
+    def test_product_moved(self):
+        self.products[0].collection = self.collections[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].save()
+        self.assertEqual(self.get_stale(), {'products', 'collection 0 products', 'collection 1 products',
+                                            'product 0', 'collections', 'collection 0', 'collection 1'})
+
+    def test_product_image_saved(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductImage.objects.create(product=self.products[1], image='store/images/image.png')
+        self.assertEqual(self.get_stale(), {'products', 'collection 1 products', 'product 1',
+                                            'collections', 'collection 1'})
+
+    def test_collection_saved(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.collections[1].save()
+        self.assertEqual(self.get_stale(), {'products', 'collection 1 products', 'collections', 'collection 1'})
+
+    def test_promotions_changed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].promotions.add(self.promotion)
+        self.assertEqual(self.get_stale(), {'products', 'collection 0 products', 'product 0',
+                                            'collections', 'collection 0'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.promotion.product_set.add(self.products[1])
+        self.assertEqual(self.get_stale(), {'products', 'collection 1 products', 'product 1',
+                                            'collections', 'collection 1'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.promotion.product_set.remove(self.products[0])
+        self.assertEqual(self.get_stale(), {'products', 'collection 0 products', 'product 0',
+                                            'collections', 'collection 0'})
+
+    def test_ids_not_in_canonical_form_are_not_cached(self):
+        # Cached under their own version keys, these would never be invalidated
+        for url in [f'/store/products/0{self.products[0].id}/', f'/store/collections/0{self.collections[0].id}/',
+                    f'/store/products/?collection_id=0{self.collections[0].id}']:
+            for _ in range(2):
+                with CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(self.client.get(url).status_code, 200)
+                self.assertTrue(queries)
+
+
+class CartItemTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Collection')
+        cls.products = Product.objects.bulk_create([
+            Product(title=f'Product {index}', slug=f'product-{index}', unit_price=10, inventory=10,
+                    collection=collection)
+            for index in range(3)
+        ])
+
+    def setUp(self):
+        self.cart = Cart.objects.create()
+
+    def get_quantities(self):
+        return dict(self.cart.items.values_list('product_id', 'quantity'))
+
+    def test_add_to_an_existing_item(self):
+        for quantity in (1, 2):
+            response = self.client.post(f'/store/carts/{self.cart.id}/items/',
+                                        {'product_id': self.products[0].id, 'quantity': quantity})
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['quantity'], 3)
+        self.assertEqual(self.get_quantities(), {self.products[0].id: 3})
+
+    def test_bulk(self):
+        CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=1)
+        response = self.client.post(f'/store/carts/{self.cart.id}/items/bulk/', {'items': [
+            {'product_id': self.products[0].id, 'quantity': 1},
+            {'product_id': self.products[1].id, 'quantity': 2},
+            {'product_id': self.products[1].id, 'quantity': 3},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual({item['product']['id']: item['quantity'] for item in response.data},
+                         {self.products[0].id: 2, self.products[1].id: 5})
+        self.assertEqual(self.get_quantities(), {self.products[0].id: 2, self.products[1].id: 5})
+
+    def test_unknown_cart_or_product(self):
+        item = {'product_id': self.products[0].id, 'quantity': 1}
+        for cart_id in (uuid4(), 'unknown'):
+            response = self.client.post(f'/store/carts/{cart_id}/items/', item)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('cart_id', response.data)
+            response = self.client.post(f'/store/carts/{cart_id}/items/bulk/', {'items': [item]}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('cart_id', response.data)
+
+        response = self.client.post(f'/store/carts/{self.cart.id}/items/bulk/',
+                                    {'items': [item, {'product_id': 0, 'quantity': 1}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.cart.items.exists())
+
+
+class CartTotalsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Collection')
+        cls.cart = Cart.objects.create()
+        CartItem.objects.bulk_create([
+            CartItem(cart=cls.cart, quantity=quantity, product=Product.objects.create(
+                title=f'Product {quantity}', slug=f'product-{quantity}', unit_price=unit_price, inventory=10,
+                collection=collection))
+            for quantity, unit_price in [(2, '10.25'), (3, '0.99')]
+        ])
+
+    def test_cart(self):
+        response = self.client.get(f'/store/carts/{self.cart.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(item['total_price'] for item in response.data['items']),
+                         [Decimal('2.97'), Decimal('20.50')])
+        self.assertEqual(response.data['total_price'], Decimal('23.47'))
+
+        response = self.client.post('/store/carts/')
+        self.assertEqual(response.data['total_price'], 0)
+
+    def test_summary(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/store/carts/{self.cart.id}/?summary=true')
+        self.assertEqual(response.data, {'id': str(self.cart.id), 'items_count': 2, 'total_quantity': 5,
+                                         'total_price': Decimal('23.47')})
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT "store_cartitem"')])
+
+        response = self.client.get(f'/store/carts/{Cart.objects.create().id}/?summary=true')
+        self.assertEqual((response.data['items_count'], response.data['total_price']), (0, 0))
+
+
+class CartExpiryTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Collection')
+        cls.product = Product.objects.create(
+            title='Product', slug='product', unit_price=10, inventory=10, collection=collection)
+
+    def create_cart(self, days_inactive):
+        cart = Cart.objects.create(last_activity=timezone.now() - timedelta(days=days_inactive))
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        return cart
+
+    def purge(self, *args):
+        with redirect_stdout(StringIO()) as output:
+            call_command('purge_carts', '--pause', '0', '--batch-size', '2', *args)
+        return output.getvalue()
+
+    def test_item_changes_record_activity(self):
+        cart = self.create_cart(days_inactive=60)
+        item = cart.items.get()
+
+        def assertTouched(response):
+            self.assertLess(response.status_code, 300)
+            last_activity = Cart.objects.get(pk=cart.pk).last_activity
+            self.assertGreater(last_activity, timezone.now() - timedelta(minutes=1))
+            Cart.objects.filter(pk=cart.pk).update(last_activity=timezone.now() - timedelta(days=60))
+
+        assertTouched(self.client.patch(f'/store/carts/{cart.id}/items/{item.id}/', {'quantity': 2}))
+        assertTouched(self.client.delete(f'/store/carts/{cart.id}/items/{item.id}/'))
+        assertTouched(self.client.post(f'/store/carts/{cart.id}/items/', {'product_id': self.product.id,
+                                                                           'quantity': 1}))
+
+    def test_purge(self):
+        old = [self.create_cart(days_inactive=days) for days in (31, 40, 50, 60, 70)]
+        recent = self.create_cart(days_inactive=1)
+
+        output = self.purge('--max-batches', '1')
+        self.assertIn('Deleted 2 carts and 2 items in 1 batches', output)
+        # Stalest first
+        self.assertEqual(Cart.objects.filter(pk__in=[cart.pk for cart in old]).count(), 3)
+        self.assertFalse(Cart.objects.filter(pk__in=[old[3].pk, old[4].pk]).exists())
+
+        cutoff = re.search(r'--cutoff=(\S+)\)', output).group(1)
+        self.assertIn('Deleted 3 carts and 3 items in 2 batches', self.purge('--cutoff', cutoff))
+        self.assertEqual(list(Cart.objects.values_list('pk', flat=True)), [recent.pk])
+        self.assertEqual(CartItem.objects.count(), 1)
+
+        with self.assertRaises(CommandError):
+            self.purge('--cutoff', 'yesterday')
+
+
+class CheckoutTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Collection')
+        cls.products = Product.objects.bulk_create([
+            Product(title=f'Product {index}', slug=f'product-{index}', unit_price=10 + index,
+                    inventory=5, collection=collection)
+            for index in range(2)
+        ])
+        cls.user = User.objects.create(username='customer', email='customer@domain.com')
+
+    def setUp(self):
+        self.cart = Cart.objects.create()
+        CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=2)
+        self.client.force_authenticate(self.user)
+
+    def test_items_changed_after_validation_are_ordered(self):
+        serializer = CreateOrderSerializer(data={'cart_id': str(self.cart.id)}, context={'user_id': self.user.id})
+        self.assertTrue(serializer.is_valid())
+        CartItem.objects.add_items(self.cart.id, {self.products[0].id: 1, self.products[1].id: 3})
+        Product.objects.filter(pk=self.products[1].id).update(unit_price=20)
+
+        order = serializer.save()
+        self.assertEqual(sorted(order.items.values_list('product_id', 'quantity', 'unit_price')),
+                         [(self.products[0].id, 3, 10), (self.products[1].id, 3, 20)])
+        self.assertFalse(Cart.objects.filter(pk=self.cart.id).exists())
+
+    def test_short_stock(self):
+        CartItem.objects.add_items(self.cart.id, {self.products[1].id: 6})
+        response = self.client.post('/store/orders/', {'cart_id': str(self.cart.id)})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['items'], [{'product_id': self.products[1].id, 'quantity': 6,
+                                                   'available': 5, 'error': 'Not enough items in stock'}])
+        # Nothing was ordered, the cart is left as it was
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.cart.items.count(), 2)
+
+    def test_empty_or_missing_cart(self):
+        self.cart.items.all().delete()
+        response = self.client.post('/store/orders/', {'cart_id': str(self.cart.id)})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'cart_id': ['Cart is empty']})
+
+        response = self.client.post('/store/orders/', {'cart_id': str(uuid4())})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'cart_id': ['Cart with given ID was not found']})
+
+
+class OutboxTests(TestCase):
+    fail_delivery = False
+
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Collection')
+        cls.product = Product.objects.create(
+            title='Product', slug='product', unit_price=10, inventory=5, collection=collection)
+        cls.user = User.objects.create(username='customer', email='customer@domain.com')
+
+    def setUp(self):
+        # Would close the connection of the test transaction
+        self.enterContext(mock.patch('store.outbox.close_old_connections'))
+        self.received = []
+        order_created.connect(self.receive, sender=OutboxEvent)
+        self.addCleanup(order_created.disconnect, self.receive, sender=OutboxEvent)
+        self.enterContext(redirect_stdout(StringIO()))
+
+    def receive(self, order, **kwargs):
+        self.received.append(order.id)
+        if self.fail_delivery:
+            raise ConnectionError('Consumer is down')
+
+    def place_order(self, quantity=1):
+        cart = Cart.objects.create()
+        CartItem.objects.create(cart=cart, product=self.product, quantity=quantity)
+        serializer = CreateOrderSerializer(data={'cart_id': str(cart.id)}, context={'user_id': self.user.id})
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def test_orders_are_delivered_by_the_worker(self):
+        order = self.place_order()
+        # Nothing was delivered during the checkout
+        self.assertEqual(self.received, [])
+        event = OutboxEvent.objects.get()
+        self.assertEqual((event.topic, event.payload), ('order_created', {'order_id': order.id}))
+
+        events = outbox.claim_batch(10)
+        self.assertEqual(events, [event])
+        # Leased to this worker
+        self.assertEqual(outbox.claim_batch(10), [])
+        self.assertTrue(outbox.process(events[0]))
+        self.assertEqual(self.received, [order.id])
+        self.assertIsNotNone(OutboxEvent.objects.get().processed_at)
+
+    def test_failed_checkouts_enqueue_nothing(self):
+        with self.assertRaises(InsufficientInventory):
+            self.place_order(quantity=6)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=2, OUTBOX_RETRY_BACKOFF=5)
+    def test_failures_are_retried_with_a_backoff(self):
+        self.fail_delivery = True
+        self.place_order()
+        for attempt in range(1, 3):
+            [event] = outbox.claim_batch(10)
+            with self.assertLogs('store.outbox', 'ERROR'), self.assertLogs('django.dispatch', 'ERROR'):
+                self.assertFalse(outbox.process(event))
+            event.refresh_from_db()
+            self.assertEqual(event.attempts, attempt)
+            self.assertIn('Consumer is down', event.last_error)
+            self.assertAlmostEqual((event.available_at - timezone.now()).total_seconds(), 5 * 2 ** (attempt - 1),
+                                   delta=1)
+            self.assertEqual(outbox.claim_batch(10), [])
+            OutboxEvent.objects.update(available_at=timezone.now())
+        # Given up after OUTBOX_MAX_ATTEMPTS
+        self.assertEqual(outbox.claim_batch(10), [])
+        self.assertIsNone(event.processed_at)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_round_robin(self):
+        pool = ReplicaPool()
+        self.assertEqual([pool.acquire() for _ in range(3)], ['replica1', 'replica2', 'replica1'])
+
+    @override_settings(DATABASE_REPLICA_POLICY='least-loaded')
+    def test_least_loaded(self):
+        pool = ReplicaPool()
+        first, second = pool.acquire(), pool.acquire()
+        pool.release(second)
+        self.assertEqual(pool.acquire(), second)
+        self.assertNotEqual(first, second)
+
+    def test_sticky_after_write(self):
+        self.assertFalse(is_sticky(get_cart_key(1)))
+        stick(get_cart_key(1))
+        self.assertTrue(is_sticky('user:1', get_cart_key(1)))
+        self.assertFalse(is_sticky(get_cart_key(2)))
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReplicaReadTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Collection')
+        cls.product = Product.objects.create(
+            title='Product', slug='product', unit_price=10, inventory=100, collection=collection)
+        cls.user = User.objects.create(username='customer', email='customer@domain.com')
+
+    def setUp(self):
+        cache.clear()
+        get_cache().clear()
+        replicas.position = -1
+
+    def request(self, method, url, **kwargs):
+        """
+        Returns the response and the aliases its reads were routed to,
+        run against the test database whatever the alias
+        """
+        aliases = set()
+
+        def db_for_read(router, model, **hints):
+            aliases.add(read_alias.get())
+
+        with mock.patch.object(ReplicaRouter, 'db_for_read', db_for_read):
+            response = getattr(self.client, method)(url, **kwargs)
+        return response, aliases
+
+    def test_catalog_reads_from_replicas(self):
+        response, aliases = self.request('get', '/store/products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(aliases, {'replica1'})
+        response, aliases = self.request('get', f'/store/products/{self.product.id}/')
+        self.assertEqual(aliases, {'replica2'})
+
+    def test_reads_from_primary_after_write(self):
+        self.client.force_authenticate(self.user)
+        response, aliases = self.request('post', '/store/carts/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(aliases, {None})
+
+        response, aliases = self.request('get', f'/store/carts/{response.data["id"]}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(aliases, {None})
+        response, aliases = self.request('get', '/store/products/')
+        self.assertEqual(aliases, {None})
+
+    def test_entries_filled_from_replicas_after_a_write_expire_with_the_lag(self):
+        token = read_alias.set('replica1')
+        try:
+            self.assertEqual(get_fill_timeout([CATALOG_VERSION_KEY]), settings.CATALOG_CACHE_TIMEOUT)
+            with self.captureOnCommitCallbacks(execute=True):
+                bump_product(self.product.id)
+            self.assertLessEqual(get_fill_timeout([CATALOG_VERSION_KEY]), settings.DATABASE_REPLICA_STICKY_SECONDS)
+        finally:
+            read_alias.reset(token)
+        self.assertEqual(get_fill_timeout([CATALOG_VERSION_KEY]), settings.CATALOG_CACHE_TIMEOUT)
+
+
+async_urls = types.ModuleType('async_urls')
+async_urls.urlpatterns = [path('store/', include(urls.get_urlpatterns(
+    ['products-detail', 'cart-detail', 'cart-items-list', 'cart-items-detail'])))]
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Collection')
+        cls.products = Product.objects.bulk_create([
+            Product(title=f'Product {index}', slug=f'product-{index}', unit_price=10,
+                    inventory=100, collection=collection)
+            for index in range(2)
+        ])
+        cls.cart = Cart.objects.create()
+        CartItem.objects.create(cart=cls.cart, product=cls.products[0], quantity=2)
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_responses_match_sync_views(self):
+        for url in [f'/store/carts/{self.cart.id}/', f'/store/products/{self.products[0].id}/',
+                    '/store/products/0/']:
+            expected = await self.async_client.get(url)
+            with override_settings(ROOT_URLCONF=async_urls):
+                response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, expected.status_code)
+            self.assertEqual(response.content, expected.content)
+
+    @override_settings(ROOT_URLCONF=async_urls)
+    async def test_cart_item_writes(self):
+        url = f'/store/carts/{self.cart.id}/items/'
+        response = await self.async_client.post(
+            url, {'product_id': self.products[0].id, 'quantity': 3}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['quantity'], 5)
+
+        item_id = response.json()['id']
+        response = await self.async_client.patch(
+            f'{url}{item_id}/', {'quantity': 1}, content_type='application/json')
+        self.assertEqual(response.json(), {'quantity': 1})
+
+        response = await self.async_client.delete(f'{url}{item_id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(await CartItem.objects.filter(cart=self.cart).aexists())
+
+
+class ImageVariantTests(APITestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        collection = Collection.objects.create(title='Collection')
+        self.product = Product.objects.create(
+            title='Product', slug='product', unit_price=10, inventory=1, collection=collection)
+        self.client.force_authenticate(User.objects.create(username='customer', email='customer@domain.com'))
+
+    def upload(self, size):
+        file = BytesIO()
+        Image.new('RGB', size, 'red').save(file, format='PNG')
+        file.name = 'image.png'
+        file.seek(0)
+        response = self.client.post(f'/store/products/{self.product.id}/images/', {'image': file},
+                                    format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def process_images(self):
+        with redirect_stdout(StringIO()) as output:
+            call_command('process_images', '--once', '--workers', '0')
+        return output.getvalue()
+
+    def test_variants_are_rendered_by_the_worker(self):
+        with mock.patch('store.images.render_variants') as render_variants:
+            image = self.upload((2000, 1000))
+        render_variants.assert_not_called()
+        self.assertEqual(image['variants'], {})
+
+        self.assertIn('Rendered 1 images, 0 failed', self.process_images())
+        image = ProductImage.objects.get(pk=image['id'])
+        self.assertEqual(set(image.variants), set(settings.PRODUCT_IMAGE_VARIANTS))
+        for variant, size in settings.PRODUCT_IMAGE_VARIANTS.items():
+            with image.image.storage.open(image.variants[variant]) as file:
+                self.assertEqual(Image.open(file).size, (min(size, 2000), min(size, 2000) // 2))
+
+        response = self.client.get(f'/store/products/{self.product.id}/images/{image.id}/')
+        self.assertTrue(response.data['variants']['thumbnail'].endswith('.webp'))
+
+        # Nothing left to render
+        self.assertNotIn('Rendered', self.process_images())
+
+    def test_identical_uploads_racing(self):
+        storage = ProductImage._meta.get_field('image').storage
+        name = storage.save('store/images/race.png', ContentFile(b'image'))
+        # The other upload wrote the file between the existence check and the write
+        with mock.patch.object(type(storage), 'exists', return_value=False):
+            self.assertEqual(storage.save(name, ContentFile(b'image')), name)
+        with storage.open(name) as file:
+            self.assertEqual(file.read(), b'image')
+        self.assertEqual(os.listdir(os.path.dirname(storage.path(name))), ['race.png'])
+
+    def test_failures_do_not_stop_the_others(self):
+        ProductImage.objects.create(product=self.product, image='store/images/missing.png')
+        image = self.upload((100, 100))
+        output = self.process_images()
+        self.assertIn('Rendered 1 images, 1 failed', output)
+        self.assertEqual(set(ProductImage.objects.get(pk=image['id']).variants),
+                         set(settings.PRODUCT_IMAGE_VARIANTS))
+
+
+class ExportTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.first = Collection.objects.create(title='First')
+        second = Collection.objects.create(title='Second')
+        cls.products = Product.objects.bulk_create([
+            Product(title=f'Product {index}', slug=f'product-{index}', unit_price=10 + index, inventory=index,
+                    collection=cls.first if index % 2 else second)
+            for index in range(5)
+        ])
+        customer = Customer.objects.get(user=User.objects.create(username='customer', email='customer@domain.com'))
+        cls.paid = Order.objects.create(customer=customer, payment_status=Order.PAYMENT_STATUS_KEY_COMPLETE)
+        cls.pending = Order.objects.create(customer=customer)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=cls.paid, product=cls.products[0], quantity=2, unit_price=10),
+            OrderItem(order=cls.paid, product=cls.products[1], quantity=1, unit_price=11),
+            OrderItem(order=cls.pending, product=cls.products[2], quantity=3, unit_price=12),
+        ])
+        cls.staff = User.objects.create(username='staff', email='staff@domain.com', is_staff=True)
+
+    def setUp(self):
+        self.client.force_authenticate(self.staff)
+
+    def export(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_staff_only(self):
+        self.client.force_authenticate(User.objects.get(username='customer'))
+        self.assertEqual(self.client.get('/store/exports/products.csv').status_code, 403)
+
+    def test_products(self):
+        # Several chunks, every row read exactly once
+        with mock.patch.object(ProductExport, 'chunk_size', 2):
+            rows = list(csv.DictReader(StringIO(self.export('/store/exports/products.csv'))))
+        self.assertEqual([int(row['id']) for row in rows], [product.id for product in self.products])
+        self.assertEqual(rows[1]['collection_title'], 'First')
+        self.assertEqual(rows[1]['unit_price'], '11.00')
+
+        lines = self.export('/store/exports/products.ndjson', collection_id=self.first.id).splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([record['id'] for record in records], [self.products[1].id, self.products[3].id])
+        self.assertEqual(records[0]['inventory'], 1)
+
+    def test_orders(self):
+        records = [json.loads(line) for line in self.export('/store/exports/orders.ndjson').splitlines()]
+        self.assertEqual([record['id'] for record in records], [self.paid.id, self.pending.id])
+        self.assertEqual([(item['product_id'], item['quantity']) for item in records[0]['items']],
+                         [(self.products[0].id, 2), (self.products[1].id, 1)])
+
+        # One row per item in CSV
+        rows = list(csv.DictReader(StringIO(self.export('/store/exports/orders.csv', payment_status='C'))))
+        self.assertEqual([(int(row['id']), row['product_title']) for row in rows],
+                         [(self.paid.id, 'Product 0'), (self.paid.id, 'Product 1')])
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get('/store/exports/products.xml').status_code, 404)
+        self.assertEqual(self.client.get('/store/exports/orders.csv', {'placed_after': 'soon'}).status_code, 400)
+
+
+class ImportTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.collection = Collection.objects.create(title='Collection')
+        cls.product = Product.objects.create(
+            title='Existing', slug='existing', unit_price=10, inventory=10, collection=cls.collection)
+        cls.staff = User.objects.create(username='staff', email='staff@domain.com', is_staff=True)
+
+    def setUp(self):
+        self.client.force_authenticate(self.staff)
+
+    def upload(self, name, content, **params):
+        file = SimpleUploadedFile(name, content.encode())
+        return self.client.post(f'/store/imports/products/?{urlencode(params)}', {'file': file},
+                                format='multipart')
+
+    def test_csv(self):
+        content = (
+            'title,slug,unit_price,inventory,collection_id\n'
+            f'New product,,12.50,5,{self.collection.id}\n'
+            f',existing,20,3,\n'
+            f'Free,,0,1,{self.collection.id}\n'
+            f'No price,,,1,{self.collection.id}\n'
+        )
+        response = self.upload('products.csv', content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['failed']), (1, 1, 2))
+        self.assertEqual([(error['line'], list(error['errors'])) for error in response.data['errors']],
+                         [(4, ['unit_price']), (5, ['unit_price'])])
+
+        created = Product.objects.get(slug='new-product')
+        self.assertEqual((created.unit_price, created.inventory), (Decimal('12.50'), 5))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.unit_price, 20)
+        # The stock count of an existing product goes through the ledger
+        self.assertEqual(Product.objects.filter(pk=self.product.pk).get_available_inventory()[self.product.pk], 3)
+        self.assertTrue(InventoryMovement.objects.filter(
+            product=self.product, kind=InventoryMovement.KIND_ADJUSTMENT, quantity=-7).exists())
+
+    def test_ndjson(self):
+        content = '\n'.join([
+            json.dumps({'title': 'Flag', 'unit_price': 10, 'inventory': True, 'collection_id': True}),
+            '{not json',
+            json.dumps({'id': self.product.id, 'title': 'Renamed'}),
+            json.dumps({'id': True, 'title': 'Renamed'}),
+            json.dumps({'title': 'Missing', 'unit_price': 10, 'inventory': 1, 'collection_id': 0}),
+        ])
+        response = self.upload('products.jsonl', content)
+        self.assertEqual((response.data['created'], response.data['updated']), (0, 1))
+        self.assertEqual([(error['line'], sorted(error['errors'])) for error in response.data['errors']],
+                         [(1, ['collection_id', 'inventory']), (2, ['non_field_errors']), (4, ['id']),
+                          (5, ['collection_id'])])
+        self.assertEqual(Product.objects.get(pk=self.product.pk).title, 'Renamed')
+
+    def test_rows_for_the_same_new_product_across_batches(self):
+        content = (
+            'title,slug,unit_price,inventory,collection_id\n'
+            f'First,new,10,1,{self.collection.id}\n'
+            f'Second,new,11,1,{self.collection.id}\n'
+            f'Third,new,12,1,{self.collection.id}\n'
+        )
+        result = ProductImporter(batch_size=2).run(StringIO(content), 'csv')
+        self.assertEqual((result['created'], result['updated']), (1, 1))
+        self.assertEqual(list(Product.objects.filter(slug='new').values_list('title', 'unit_price')),
+                         [('Third', Decimal('12.00'))])
+
+    def test_dry_run(self):
+        content = f'title,unit_price,inventory,collection_id\nNew,10,1,{self.collection.id}\n'
+        response = self.upload('products.csv', content, dry_run='true')
+        self.assertEqual(response.data['created'], 1)
+        self.assertFalse(Product.objects.filter(slug='new').exists())
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.upload('products.xlsx', '').status_code, 400)
+        self.assertEqual(self.client.post('/store/imports/products/', {}, format='multipart').status_code, 400)
+        self.client.force_authenticate(User.objects.create(username='customer', email='customer@domain.com'))
+        self.assertEqual(self.upload('products.csv', '').status_code, 403)
+
+
+class InventoryLedgerTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Collection')
+        cls.product = Product.objects.create(
+            title='Product', slug='product', unit_price=10, inventory=20, collection=collection)
+        cls.user = User.objects.create(username='customer', email='customer@domain.com')
+
+    def checkout(self, quantity):
+        cart = Cart.objects.create()
+        CartItem.objects.create(cart=cart, product=self.product, quantity=quantity)
+        self.client.force_authenticate(self.user)
+        return self.client.post('/store/orders/', {'cart_id': str(cart.id)})
+
+    def get_available(self):
+        response = self.client.get(f'/store/products/stock/?ids={self.product.id}')
+        return response.data[0]['available']
+
+    def test_sales_are_folded_by_rollup(self):
+        self.assertEqual(self.checkout(15).status_code, 200)
+        response = self.checkout(6)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['items'][0]['available'], 5)
+
+        # The sale only went to the shards and the ledger
+        self.assertEqual(Product.objects.get(pk=self.product.pk).inventory, 20)
+        self.assertEqual(self.get_available(), 5)
+        InventoryMovement.objects.record(InventoryMovement.KIND_RECEIPT, {self.product.id: 10})
+        self.assertEqual(self.get_available(), 15)
+
+        with redirect_stdout(StringIO()):
+            call_command('rollup_inventory', '--once')
+        self.assertEqual(Product.objects.get(pk=self.product.pk).inventory, 15)
+        self.assertEqual(self.get_available(), 15)
+        self.assertEqual(sorted(self.product.inventory_shards.values_list('quantity', flat=True)),
+                         [1] + [2] * 7)
+        self.assertFalse(InventoryMovement.objects.filter(rolled_up=False).exists())
+
+    def test_saving_products_leaves_the_stock_alone(self):
+        self.checkout(5)
+        # The inventory loaded here predates the sale, or isn't loaded at all
+        product = Product.objects.get(pk=self.product.pk)
+        product.refresh_from_db()
+        product.title = 'Renamed'
+        product.save()
+        Product.objects.defer('inventory').get(pk=self.product.pk).save()
+        self.assertEqual(self.get_available(), 15)
+
+        self.client.force_authenticate(User.objects.create(username='staff', email='staff@domain.com', is_staff=True))
+        response = self.client.patch(f'/store/products/{self.product.id}/', {'title': 'Renamed', 'inventory': 100})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_available(), 15)
+
+    def test_set_stock_records_adjustments(self):
+        self.checkout(5)
+        InventoryMovement.objects.set_stock({self.product.id: 0})
+        self.assertEqual(self.get_available(), 0)
+        self.assertEqual(list(self.product.inventory_movements.order_by('id').values_list('kind', 'quantity')),
+                         [(InventoryMovement.KIND_SALE, -5), (InventoryMovement.KIND_ADJUSTMENT, -15)])
+
+        with redirect_stdout(StringIO()):
+            call_command('rollup_inventory', '--once')
+        self.assertEqual(Product.objects.get(pk=self.product.pk).inventory, 0)
+
+    def test_exports_and_admin_report_the_available_stock(self):
+        self.checkout(15)
+        staff = User.objects.create(username='staff', email='staff@domain.com', is_staff=True, is_superuser=True)
+        self.client.force_authenticate(staff)
+        response = self.client.get('/store/exports/products.ndjson')
+        self.assertEqual(json.loads(b''.join(response.streaming_content))['inventory'], 5)
+
+        self.client.force_login(staff)
+        response = self.client.get('/admin/store/product/', {'inventory_status': '<10'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['cl'].result_list), [self.product])
@@ -1,7 +1,9 @@
+from django.conf import settings
 from django.urls import path
 # from rest_framework.routers import SimpleRouter
 from rest_framework_nested import routers
 from . import views
+from .async_views import use_async_routes
 
 router = routers.DefaultRouter()
 router.register('products', views.ProductViewSet, basename='products')
@@ -20,7 +22,23 @@ products_router.register(
 carts_router = routers.NestedDefaultRouter(router, 'carts', lookup='cart')
 carts_router.register('items', views.CartItemViewSet, basename='cart-items')
 
-urlpatterns = router.urls + products_router.urls + carts_router.urls
+# Viewsets whose routes can be served asynchronously instead, see ASYNC_ROUTES
+ASYNC_VIEWSETS = {
+    views.ProductViewSet: views.AsyncProductViewSet,
+    views.CartViewSet: views.AsyncCartViewSet,
+    views.CartItemViewSet: views.AsyncCartItemViewSet,
+}
+
+
+def get_urlpatterns(async_routes=()):
+    return use_async_routes(router.urls + products_router.urls + carts_router.urls, ASYNC_VIEWSETS, async_routes) + [
+        path('exports/orders.<str:export_format>', views.OrderExportView.as_view()),
+        path('exports/products.<str:export_format>', views.ProductExportView.as_view()),
+        path('imports/products/', views.ProductImportView.as_view()),
+    ]
+
+
+urlpatterns = get_urlpatterns(settings.ASYNC_ROUTES)
 
 # urlpatterns = [
 #     # path('products/', views.product_list),
@@ -1,35 +1,60 @@
-from django.db.models import Count
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Count, Max, Prefetch, prefetch_related_objects
+from django.http import StreamingHttpResponse
 # from django.shortcuts import get_object_or_404
 # from django.http import HttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.generics import get_object_or_404
 # from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView
+from rest_framework.parsers import MultiPartParser
 from rest_framework.mixins import CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, UpdateModelMixin
 # from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser, DjangoModelPermissions
 from rest_framework.response import Response
-# from rest_framework.views import APIView
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 from rest_framework import status
 
+from core.authentication import CUSTOMER_ID_CLAIM, get_token_claim
+from likes.models import LikedItem
+from tags.models import TaggedItem
+from .async_views import AsyncViewSetMixin
+from .cache import CatalogCacheMixin, CATALOG_VERSION_KEY, PRODUCTS_VERSION_KEY, canonical_id, collection_version_key, product_version_key
+from .conditional import ConditionalGetMixin, get_timestamp_validator, make_validators
 from .permissions import FullDjangoModelPermissions, IsAdminOrReadOnly, ViewCustomerHistoryPermission
-from .filters import ProductFilter
+from .exports import FORMATS, OrderExport, ProductExport
+from .imports import ProductImporter, get_format
+from .filters import OrderExportFilter, ProductExportFilter, ProductFilter
+from .pagination import CursorOrPageNumberPagination
+from .routers import ReplicaReadMixin, get_cart_key, stick
+from .rows import OrderRowSerializer, ProductRowSerializer, RowListMixin
+from .search import ProductSearchFilter
 from .models import CartItem, Customer, Order, Product, Collection, OrderItem, ProductImage, Review, Cart
-from .serializers import AddCartItemSerializer, CartItemSerializer, CartSerializer, CreateOrderSerializer, CustomerSerializer, OrderSerializer, ProductImageSerializer, ProductSerializer, CollectionSerializer, ReviewSerializer, UpdateCartItemSerializer, UpdateOrderSerializer
+from .serializers import AddCartItemSerializer, BulkAddCartItemSerializer, CartItemSerializer, CartSerializer, CartSummarySerializer, CreateOrderSerializer, CustomerSerializer, InsufficientInventory, OrderSerializer, ProductImageSerializer, ProductSerializer, CollectionSerializer, ReviewSerializer, UpdateCartItemSerializer, UpdateOrderSerializer
 
 
-class ProductViewSet(ModelViewSet):
-    queryset = Product.objects.prefetch_related('images').all()
+class ProductViewSet(ReplicaReadMixin, CatalogCacheMixin, RowListMixin, ModelViewSet):
+    queryset = Product.objects.prefetch_related(
+        'images',
+        Prefetch('tagged_items', queryset=TaggedItem.objects.select_related('tag'))
+    ).all()
     serializer_class = ProductSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    row_serializer_class = ProductRowSerializer
+    filter_backends = [DjangoFilterBackend,
+                       ProductSearchFilter, OrderingFilter]
     # filterset_fields = ['collection_id']
     filterset_class = ProductFilter
     # pagination_class = PageNumberPaginat ion
+    pagination_class = CursorOrPageNumberPagination
     permission_classes = [IsAdminOrReadOnly]
     search_fields = ['title', 'description']
-    ordering_fields = ['unit_price', 'last_update']
+    ordering_fields = ['unit_price', 'effective_price', 'last_update']
 
     # def get_queryset(self):
     #     queryset = Product.objects.all()
@@ -41,6 +66,21 @@ class ProductViewSet(ModelViewSet):
     def get_serializer_context(self):
         return {'request': self.request}
 
+    def get_cache_version_keys(self, request, pk=None):
+        if pk is not None:
+            pk = canonical_id(pk)
+            return None if pk is None else [PRODUCTS_VERSION_KEY, product_version_key(pk)]
+        # Listings narrowed down to a single collection only change when that collection's products change
+        collection_id = request.query_params.get('collection_id')
+        if collection_id:
+            collection_id = canonical_id(collection_id)
+            return None if collection_id is None else [PRODUCTS_VERSION_KEY, collection_version_key(collection_id)]
+        return [CATALOG_VERSION_KEY]
+
+    def get_validator(self, request, pk=None):
+        # last_update also changes with the images, tags and effective price of the product
+        return get_timestamp_validator(self.filter_queryset(self.get_queryset()), pk)
+
     def destroy(self, request, *args, **kwargs):
         if OrderItem.objects.filter(product_id=kwargs['pk']).count() > 0:
             return Response(
@@ -48,6 +88,56 @@ class ProductViewSet(ModelViewSet):
             )
         return super().destroy(request, *args, **kwargs)
 
+    # Likes are kept out of the product representation, so that liking doesn't invalidate the cached catalog.
+    # Listing pages fetch them for the products on the page with a single call to `likes`
+    max_likes_lookup = 100
+
+    @action(detail=True, methods=['POST', 'DELETE'], permission_classes=[IsAuthenticated])
+    def like(self, request, pk):
+        # Idempotent: liking again or unliking a product that isn't liked changes nothing
+        product = get_object_or_404(Product.objects.only('id'), pk=pk)
+        if request.method == 'POST':
+            created = LikedItem.objects.like(request.user, Product, product.id)
+        else:
+            created = False
+            LikedItem.objects.unlike(request.user, Product, product.id)
+
+        likes_count, liked = LikedItem.objects.get_likes_for_many(
+            Product, [product.id], request.user)[product.id]
+        return Response({'product_id': product.id, 'likes_count': likes_count, 'liked': liked},
+                        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    @action(detail=False, methods=['GET'], permission_classes=[AllowAny])
+    def likes(self, request):
+        # ?ids=1,2,3 -> like counts, and whether the current user liked each product
+        try:
+            ids = list(dict.fromkeys(int(id) for id in request.query_params.get('ids', '').split(',') if id))
+        except ValueError:
+            raise ValidationError({'ids': ['Expected a comma separated list of product ids.']})
+        if len(ids) > self.max_likes_lookup:
+            raise ValidationError({'ids': [f'At most {self.max_likes_lookup} products at a time.']})
+
+        likes = LikedItem.objects.get_likes_for_many(Product, ids, request.user)
+        return Response([{'product_id': id, 'likes_count': likes_count, 'liked': liked}
+                         for id, (likes_count, liked) in likes.items()])
+
+    # So is the stock available right now: `inventory` only changes when rollup_inventory folds the sales in
+    max_stock_lookup = 100
+
+    @action(detail=False, methods=['GET'], permission_classes=[AllowAny])
+    def stock(self, request):
+        # ?ids=1,2,3 -> stock available for each product
+        try:
+            ids = list(dict.fromkeys(int(id) for id in request.query_params.get('ids', '').split(',') if id))
+        except ValueError:
+            raise ValidationError({'ids': ['Expected a comma separated list of product ids.']})
+        if len(ids) > self.max_stock_lookup:
+            raise ValidationError({'ids': [f'At most {self.max_stock_lookup} products at a time.']})
+
+        available = Product.objects.filter(pk__in=ids).get_available_inventory()
+        return Response([{'product_id': id, 'available': available[id]}
+                         for id in ids if id in available])
+
     # def delete(self, request, pk):
     #     product = get_object_or_404(Product, pk=pk)
     #     if product.orderitems.count() > 0:
@@ -58,23 +148,60 @@ class ProductViewSet(ModelViewSet):
     #     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class CollectionViewSet(ModelViewSet):
-    queryset = Collection.objects.annotate(
-        products_count=Count('products')).all()
+class AsyncProductViewSet(AsyncViewSetMixin, ProductViewSet):
+    # Async list and retrieve, for the routes in ASYNC_ROUTES (see store.async_views)
+
+    async def list(self, request, *args, **kwargs):
+        return await self.aconditional_response(
+            request, await sync_to_async(self.get_validators)(request),
+            lambda: self.acached_response(request, None, self.alist))
+
+    async def retrieve(self, request, *args, **kwargs):
+        pk = kwargs['pk']
+        return await self.aconditional_response(
+            request, await sync_to_async(self.get_validators)(request, pk),
+            lambda: self.acached_response(request, pk, self.aretrieve))
+
+    async def alist(self):
+        queryset = await self.afilter_queryset(self.get_queryset())
+        if settings.FAST_READ_SERIALIZATION:
+            serializer = self.row_serializer_class(self.get_serializer_context())
+            page = await self.apaginate_queryset(serializer.get_rows(queryset))
+            return self.get_paginated_response(await serializer.aserialize(page))
+
+        page = await self.apaginate_queryset(queryset)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    async def aretrieve(self):
+        return Response(self.get_serializer(await self.aget_object()).data)
+
+
+class CollectionViewSet(ReplicaReadMixin, CatalogCacheMixin, ModelViewSet):
+    queryset = Collection.objects.all()
     permission_classes = [IsAdminOrReadOnly]
     serializer_class = CollectionSerializer
 
+    def get_cache_version_keys(self, request, pk=None):
+        if pk is not None:
+            pk = canonical_id(pk)
+            return None if pk is None else [collection_version_key(pk)]
+        return [CATALOG_VERSION_KEY]
+
+    def get_validator(self, request, pk=None):
+        return get_timestamp_validator(self.get_queryset(), pk)
+
     def destroy(self, request, *args, **kwargs):
-        if Product.objects.filter(collection_id=kwargs['pk']).count() > 0:
+        if self.get_object().products_count > 0:
             return Response(
                 {'error': 'Collection cannot be deleted as it has one or more products associated with it.'}, status=status.HTTP_405_METHOD_NOT_ALLOWED
             )
         return super().destroy(request, *args, **kwargs)
 
 
-class ReviewViewSet(ModelViewSet):
+class ReviewViewSet(ReplicaReadMixin, ModelViewSet):
     # queryset = Review.objects.all()
     serializer_class = ReviewSerializer
+    pagination_class = CursorOrPageNumberPagination
 
     def get_queryset(self):
         return Review.objects.filter(product_id=self.kwargs['product_pk'])
@@ -94,16 +221,72 @@ class ReviewViewSet(ModelViewSet):
     #     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class CartViewSet(CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, GenericViewSet):
-    queryset = Cart.objects.prefetch_related('items__product').all()
-    serializer_class = CartSerializer
+class CartViewSet(ReplicaReadMixin, ConditionalGetMixin, CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, GenericViewSet):
+    queryset = Cart.objects.with_totals()
 
+    def is_summary(self):
+        # ?summary=true returns the totals alone, without loading the items
+        return self.action == 'retrieve' and self.request.query_params.get('summary') in ('1', 'true')
 
-class CartItemViewSet(ModelViewSet):
+    def get_queryset(self):
+        if self.action != 'retrieve' or self.is_summary():
+            return self.queryset
+        return self.queryset.prefetch_related('items__product')
+
+    def get_serializer_class(self):
+        if self.is_summary():
+            return CartSummarySerializer
+        return CartSerializer
+
+    # Carts are anonymous, reading one after changing it has to hit the primary by the cart as well
+    def get_sticky_keys(self, request):
+        keys = super().get_sticky_keys(request)
+        return keys + [get_cart_key(self.kwargs['pk'])] if 'pk' in self.kwargs else keys
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        stick(get_cart_key(serializer.instance.id))
+
+    def get_validator(self, request, pk=None):
+        # Adding, changing or removing items is recorded as activity, the products of the items
+        # change the cart too. The count covers items deleted along with their product
+        try:
+            cart = Cart.objects.filter(pk=pk) \
+                .annotate(products_updated=Max('items__product__last_update'), items_count=Count('items')) \
+                .values_list('last_activity', 'products_updated', 'items_count') \
+                .first()
+        except DjangoValidationError:
+            return None
+        if cart is None:
+            return None
+        last_activity, products_updated, items_count = cart
+        return max(last_activity, products_updated or last_activity), items_count
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(request, self.get_validators(request, kwargs['pk']),
+                                         lambda: super(CartViewSet, self).retrieve(request, *args, **kwargs))
+
+
+class AsyncCartViewSet(AsyncViewSetMixin, CartViewSet):
+    # Async retrieve, for the routes in ASYNC_ROUTES (see store.async_views)
+
+    async def retrieve(self, request, *args, **kwargs):
+        return await self.aconditional_response(
+            request, await sync_to_async(self.get_validators)(request, kwargs['pk']), self.aretrieve)
+
+    async def aretrieve(self):
+        # The items and their products are prefetched along with the cart
+        return Response(self.get_serializer(await self.aget_object()).data)
+
+
+class CartItemViewSet(ReplicaReadMixin, ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete']
+    pagination_class = CursorOrPageNumberPagination
     # serializer_class = CartItemSerializer
 
     def get_serializer_class(self, *args, **kwargs):
+        if self.action == 'bulk':
+            return BulkAddCartItemSerializer
         if self.request.method == 'POST':
             return AddCartItemSerializer
         elif self.request.method == 'PATCH':
@@ -116,8 +299,52 @@ class CartItemViewSet(ModelViewSet):
     def get_queryset(self):
         return CartItem.objects.filter(cart_id=self.kwargs['cart_pk']).select_related('product')
 
+    def get_sticky_keys(self, request):
+        return super().get_sticky_keys(request) + [get_cart_key(self.kwargs['cart_pk'])]
+
+    # Adds go through CartItem.objects.add_items(), which refreshes the cart's last activity by itself
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        Cart.objects.filter(pk=self.kwargs['cart_pk']).touch()
 
-class CustomerViewSet(ModelViewSet):
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        Cart.objects.filter(pk=self.kwargs['cart_pk']).touch()
+
+    @action(detail=False, methods=['POST'])
+    def bulk(self, request, cart_pk):
+        # Adds many products at once (e.g. reordering, bundles) with a constant number of queries
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.save()
+        return Response(CartItemSerializer(items, many=True).data, status=status.HTTP_201_CREATED)
+
+
+class AsyncCartItemViewSet(AsyncViewSetMixin, CartItemViewSet):
+    # Async add, update and delete, for the routes in ASYNC_ROUTES (see store.async_views)
+
+    async def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        # Validating looks the product up
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        await serializer.asave()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    async def partial_update(self, request, *args, **kwargs):
+        serializer = self.get_serializer(await self.aget_object(), data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        await serializer.asave()
+        await Cart.objects.filter(pk=self.kwargs['cart_pk']).atouch()
+        return Response(serializer.data)
+
+    async def destroy(self, request, *args, **kwargs):
+        item = await self.aget_object()
+        await item.adelete()
+        await Cart.objects.filter(pk=self.kwargs['cart_pk']).atouch()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class CustomerViewSet(ConditionalGetMixin, ModelViewSet):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
     permission_classes = [FullDjangoModelPermissions]
@@ -131,9 +358,15 @@ class CustomerViewSet(ModelViewSet):
     def me(self, request):
         # Such a method is called an 'action', and this is a custom action in specific
         # If not logged in, set to an instance of AnonymousUser class
-        customer = Customer.objects.get(user_id=request.user.id)
+        customer_id = get_token_claim(request, CUSTOMER_ID_CLAIM)
+        if customer_id is not None:
+            customer = Customer.objects.get(pk=customer_id)
+        else:
+            customer = Customer.objects.get(user_id=request.user.id)
         if request.method == 'GET':
-            serializer = CustomerSerializer(customer)
+            # The row is needed either way, only the serializer and the body are saved on a match
+            return self.conditional_response(request, make_validators(request, customer.last_update, customer.id),
+                                             lambda: Response(CustomerSerializer(customer).data))
         elif request.method == 'PUT':
             serializer = CustomerSerializer(customer, data=request.data)
             serializer.is_valid(raise_exception=True)
@@ -145,11 +378,13 @@ class CustomerViewSet(ModelViewSet):
         return Response('History fetched')
 
 
-class OrderViewSet(ModelViewSet):
+class OrderViewSet(RowListMixin, ModelViewSet):
     # queryset = Order.objects.all()
     # serializer_class = OrderSerializer
     # permission_classes = [IsAuthenticated]
     http_method_names = ['get', 'post', 'patch', 'delete', 'head ', 'options']
+    pagination_class = CursorOrPageNumberPagination
+    row_serializer_class = OrderRowSerializer
 
     def get_permissions(self):
         if self.request.method in ['PATCH', 'DELETE']:
@@ -159,10 +394,15 @@ class OrderViewSet(ModelViewSet):
     def create(self, request, *args, **kwargs):
         serializer = CreateOrderSerializer(
             data=request.data,
-            context={'user_id': self.request.user.id}
+            context={'user_id': self.request.user.id,
+                     'customer_id': get_token_claim(self.request, CUSTOMER_ID_CLAIM)}
         )
         serializer.is_valid(raise_exception=True)
-        order = serializer.save()
+        try:
+            order = serializer.save()
+        except InsufficientInventory as error:
+            return Response({'items': error.items}, status=status.HTTP_400_BAD_REQUEST)
+        prefetch_related_objects([order], self.get_items_prefetch())
         serializer = OrderSerializer(order)
         return Response(serializer.data)
 
@@ -176,27 +416,95 @@ class OrderViewSet(ModelViewSet):
     # def get_serializer_context(self):
     #     return {'user_id': self.request.user.id}
 
+    def get_items_prefetch(self):
+        # Load the items of all orders on the page, along with their product, in one query
+        # and only the columns OrderItemSerializer / SimpleProductSerializer need
+        return Prefetch('items', queryset=OrderItem.objects
+                        .select_related('product')
+                        .only('id', 'order_id', 'quantity', 'unit_price',
+                              'product__id', 'product__title', 'product__unit_price'))
+
     def get_queryset(self):
         user = self.request.user
+        queryset = Order.objects.prefetch_related(self.get_items_prefetch())
 
         if user.is_staff:
-            return Order.objects.all()
+            return queryset
 
-        customer_id = Customer.objects.only(
-            'id').get(user_id=user.id)
-        return Order.objects.filter(customer_id=customer_id)
+        customer_id = get_token_claim(self.request, CUSTOMER_ID_CLAIM)
+        if customer_id is not None:
+            return queryset.filter(customer_id=customer_id)
+        # Joined rather than looked up first, for requests without the claim
+        return queryset.filter(customer__user_id=user.id)
 
 
 class ProductImageViewSet(ModelViewSet):
     serializer_class = ProductImageSerializer
 
     def get_serializer_context(self):
-        return {'product_id': self.kwargs['product_pk']}
+        return {'product_id': self.kwargs['product_pk'], 'request': self.request}
 
     def get_queryset(self):
         return ProductImage.objects.filter(product_id=self.kwargs['product_pk'])
 
 
+class ExportView(APIView):
+    """
+    Streams every row matching the filters as CSV or NDJSON, for staff jobs that would otherwise page through the API
+    """
+    permission_classes = [IsAdminUser]
+    export_class = None
+    filterset_class = None
+    filename = None
+
+    def get(self, request, export_format):
+        if export_format not in FORMATS:
+            raise NotFound()
+
+        filterset = self.filterset_class(
+            request.query_params, queryset=self.filterset_class._meta.model.objects.all())
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+
+        export = self.export_class(filterset.qs)
+        response = StreamingHttpResponse(
+            export.stream(export_format), content_type=FORMATS[export_format])
+        response['Content-Disposition'] = f'attachment; filename="{self.filename}.{export_format}"'
+        return response
+
+
+class OrderExportView(ExportView):
+    export_class = OrderExport
+    filterset_class = OrderExportFilter
+    filename = 'orders'
+
+
+class ProductExportView(ExportView):
+    export_class = ProductExport
+    filterset_class = ProductExportFilter
+    filename = 'products'
+
+
+class ProductImportView(APIView):
+    """
+    Creates or updates products from an uploaded CSV / NDJSON file, see store.imports
+    """
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        file = request.FILES.get('file')
+        if file is None:
+            return Response({'file': ['No file was submitted.']}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = get_format(file.name)
+        if file_format is None:
+            return Response({'file': ['Only .csv and .ndjson files are supported.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        dry_run = request.query_params.get('dry_run') in ('1', 'true')
+        result = ProductImporter(dry_run=dry_run).run(file, file_format)
+        return Response(result)
+
+
 ########################################################################################################################
 # Removed since all features are a part of the Product viewset
 # class ProductList(ListCreateAPIView):
@@ -58,6 +58,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'store.routers.ReadYourWritesMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -104,6 +105,14 @@ DATABASES = {
     }
 }
 
+# Read replicas (see store.routers): aliases of DATABASES the catalog and cart reads are spread over,
+# 'round-robin' or 'least-loaded'. Clients read from the primary for a few seconds after writing,
+# which has to cover the replication lag. storefront.settings_replicas sets this up with SQLite
+DATABASE_ROUTERS = ['store.routers.ReplicaRouter']
+DATABASE_REPLICAS = []
+DATABASE_REPLICA_POLICY = 'round-robin'
+DATABASE_REPLICA_STICKY_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -144,6 +153,65 @@ STATIC_URL = 'static/'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Resized copies of product images (see store.images), {name: max width/height in pixels}
+PRODUCT_IMAGE_VARIANTS = {
+    'thumbnail': 150,
+    'small': 480,
+    'large': 1200,
+}
+PRODUCT_IMAGE_QUALITY = 80
+# Processes of the process_images worker rendering the variants, 0 renders them in the worker itself
+PRODUCT_IMAGE_WORKERS = 2
+
+# Caching
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Anonymous catalog responses (see store.cache). Local memory works for a single process;
+    # switch to 'django.core.cache.backends.filebased.FileBasedCache' with a LOCATION to share it between workers
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000
+        }
+    }
+}
+
+CATALOG_CACHE_ALIAS = 'catalog'
+CATALOG_CACHE_TIMEOUT = 60 * 15
+
+# Product and order lists are serialized from values() rows by the serializers in store.rows
+FAST_READ_SERIALIZATION = True
+
+# Routes served by async views (see store.async_views), out of products-list, products-detail, cart-detail,
+# cart-items-list and cart-items-detail. They only pay off when running under ASGI (storefront/asgi.py)
+ASYNC_ROUTES = []
+
+# Outbox (see store.outbox and the process_outbox command)
+
+OUTBOX_MAX_ATTEMPTS = 10
+OUTBOX_LEASE_SECONDS = 60
+OUTBOX_RETRY_BACKOFF = 5
+OUTBOX_RETRY_BACKOFF_MAX = 60 * 60
+
+# Carts without any activity for this long are deleted by the purge_carts command
+
+CART_EXPIRY_DAYS = 30
+
+# Inventory (see store.models.InventoryShard). Stock is spread over this many rows per product, so that
+# concurrent checkouts of the same product don't wait on each other. Sales and receipts are folded into
+# Product.inventory by the rollup_inventory command, to be run periodically
+
+INVENTORY_SHARDS = 8
+
+# Pricing (see store.pricing), run `manage.py update_prices --all` after changing the rate
+
+TAX_RATE = '0.18'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -154,7 +222,12 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
+    ),
+    # Same output as JSONRenderer, faster when orjson is installed
+    'DEFAULT_RENDERER_CLASSES': (
+        'store.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
     # 'DEFAULT_PERMISSION_CLASSES': [
     #     'rest_framework.permissions.IsAuthenticated'
@@ -163,11 +236,19 @@ REST_FRAMEWORK = {
 
 SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('JWT',),
-    'ACCESS_TOKEN_LIFETIME': timedelta(days=7)
+    'ACCESS_TOKEN_LIFETIME': timedelta(days=7),
+    'TOKEN_OBTAIN_SERIALIZER': 'core.serializers.TokenObtainPairSerializer',
 }
 
 AUTH_USER_MODEL = 'core.user'
 
+# Users resolved from access tokens are cached in every process (see core.authentication)
+USER_CACHE_MAX_ENTRIES = 10000
+USER_CACHE_TIMEOUT = 60
+# Where the user versions checked on every request are kept. It has to be shared by every process
+# (e.g. Redis or Memcached) for a change to a user to be seen everywhere before USER_CACHE_TIMEOUT
+USER_CACHE_VERSION_ALIAS = 'default'
+
 DJOSER = {
     'SERIALIZERS': {
         'user_create': 'core.serializers.UserCreateSerializer',
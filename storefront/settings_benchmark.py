@@ -0,0 +1,21 @@
+"""
+Settings for running the benchmark suite (manage.py benchmark) against a local SQLite database:
+
+    python manage.py benchmark --settings=storefront.settings_benchmark
+"""
+
+from .settings import *
+
+DEBUG = False
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'benchmark.sqlite3',
+    }
+}
+
+# The toolbar is only ever shown with DEBUG, keep it out of the measurements entirely
+MIDDLEWARE = [middleware for middleware in MIDDLEWARE
+              if not middleware.startswith('debug_toolbar')]
+SILENCED_SYSTEM_CHECKS = ['debug_toolbar.W001']
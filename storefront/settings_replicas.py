@@ -0,0 +1,33 @@
+"""
+Settings for trying out the read replicas (see store.routers) locally, with SQLite files standing in
+for the primary and two replicas. Replication is done by hand, copying the primary over the replicas:
+
+    python manage.py migrate --settings=storefront.settings_replicas
+    python manage.py sync_replicas --settings=storefront.settings_replicas
+
+Until the next sync_replicas, the replicas lag behind, which is what the stickiness has to cover.
+"""
+
+from .settings import *
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'primary.sqlite3',
+    },
+    'replica1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'replica1.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
+    'replica2': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'replica2.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_REPLICAS = ['replica1', 'replica2']
+
+# Asynchronous replication in production, here it lasts until the next sync_replicas
+DATABASE_REPLICA_STICKY_SECONDS = 60
@@ -29,6 +29,7 @@ urlpatterns = [
     path('store/', include('store.urls')),
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.jwt')),
+    path('auth/', include('core.urls')),
     path('__debug__/', include(debug_toolbar.urls)),
 ]
 
@@ -14,9 +14,34 @@ class TaggedItemManager(models.Manager):
                 object_id=obj_id
             )
 
+    def get_tags_for_many(self, obj_type, obj_ids):
+        # Tag labels of many objects of the same type with a single query, as {object id: [label, ...]}
+        content_type = ContentType.objects.get_for_model(obj_type)
+        tags = {obj_id: [] for obj_id in obj_ids}
+
+        tagged_items = TaggedItem.objects \
+            .select_related('tag') \
+            .filter(
+                content_type=content_type,
+                object_id__in=tags.keys()
+            ) \
+            .order_by('tag__label')
+        for tagged_item in tagged_items:
+            tags[tagged_item.object_id].append(tagged_item.tag.label)
+        return tags
+
+    def get_object_ids(self, obj_type, labels):
+        # Subquery of the ids of the objects tagged with any of the labels, to filter a queryset with
+        return TaggedItem.objects \
+            .filter(
+                content_type=ContentType.objects.get_for_model(obj_type),
+                tag__label__in=labels
+            ) \
+            .values('object_id')
+
 
 class Tag(models.Model):
-    label = models.CharField(max_length=255)
+    label = models.CharField(max_length=255, db_index=True)
 
     def __str__(self) -> str:
         return self.label
@@ -34,3 +59,10 @@ class TaggedItem(models.Model):
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey()
+
+    class Meta:
+        indexes = [
+            # Every lookup (tags of an object, objects with a tag, generic relations and their prefetches)
+            # filters on both columns
+            models.Index(fields=['content_type', 'object_id'])
+        ]